@@ -0,0 +1,353 @@
+"""
+Micro-benchmark for query analysis: the compiled single-pass QueryMatcher in main.py
+against the previous substring-scan implementation (kept verbatim below).
+
+Usage (from knowledge_layer_v5_deploy/):
+    python bench_query_analysis.py [--iterations 2000] [--context ../GPT]
+
+Reports per-question latency for both versions and lists every question where the
+detected intent, JIRA filters or AO search hints differ, so a keyword change can be
+checked before deploy.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+import main
+
+SAMPLE_QUESTIONS = [
+    "tell me the workflow of PRTS",
+    "ad serving dataflow diagram",
+    "show me a mermaid diagram of the bidding flow",
+    "How many story points did Front End complete last sprint?",
+    "List all AO tickets for the next 3 sprints",
+    "What is on the roadmap for Adaptive Optimization this year?",
+    "What are the AO factors?",
+    "how does the board review process work",
+    "compare Life vs Studio",
+    "What did the backend team ship in the last release?",
+    "Omnichannel audience releases year to date",
+    "What is QAR?",
+    "What is the target CPM for HCP Explorer campaigns?",
+    "what is planned for the rest of the year in Analytics-Platform-and-Workspaces",
+    "show me open bugs for Authentication",
+    "total count of epics in the current release",
+    "Who is the product manager for APIs?",
+    "explain how NPI matching works with Smart NPI Match",
+    "what's in this sprint",
+    "github repository for the targeting service",
+    "what are the processes for trafficking a campaign",
+    "anything currently blocked for Studio",
+    "which adaptive bidding settings changed",
+    "AO rollout notes"
+]
+
+def load_local_context(context_dir: str) -> dict:
+    """Build a GPT_CONTEXT-shaped dict from a local checkout of GPT/ (no network)"""
+    files = {}
+    for filename in sorted(os.listdir(context_dir)):
+        if filename.endswith('.json') and filename not in main.GPT_CONTEXT_SKIP_FILES:
+            with open(os.path.join(context_dir, filename), 'r', encoding='utf-8') as f:
+                files[filename[:-len('.json')]] = json.load(f)
+    return {"files": files}
+
+def time_per_call(fn, iterations: int) -> dict:
+    samples = []
+    for question in SAMPLE_QUESTIONS:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn(question)
+        samples.append((time.perf_counter() - start) / iterations * 1e6)
+    return {
+        "mean_us": statistics.mean(samples),
+        "p50_us": statistics.median(samples),
+        "max_us": max(samples)
+    }
+
+# === LEGACY IMPLEMENTATION (pre-QueryMatcher, for comparison only) ===
+
+def legacy_intelligent_query_analysis(question: str, gpt_context: dict = None) -> dict:
+    """
+    Enhanced intelligent query analysis with better keyword extraction
+    Bryan's requirement: Extract meaningful keywords and detect query intent
+    Now includes GPT context for better understanding
+    """
+    question_lower = question.lower()
+    
+    # Load GPT context if not provided
+    if gpt_context is None:
+        gpt_context = main.load_gpt_context_files()
+    
+    # Enhanced keyword extraction - remove duplicates and punctuation
+    import re
+    words = re.findall(r'\b\w+\b', question_lower)
+    
+    # Remove common stop words
+    stop_words = {
+        'what', 'is', 'the', 'of', 'in', 'to', 'for', 'with', 'on', 'at', 'by', 'from', 
+        'and', 'or', 'but', 'can', 'you', 'tell', 'me', 'about', 'details', 'information',
+        'how', 'does', 'work', 'show', 'list', 'find', 'get', 'all', 'any', 'some',
+        'please', 'provide', 'detailed', 'including'
+    }
+    
+    # Extract meaningful keywords (remove stop words and duplicates)
+    keywords = list(dict.fromkeys([word for word in words if word not in stop_words and len(word) > 1]))
+    
+    # Check GPT context for acronyms/products to expand keywords
+    acronyms = gpt_context.get('files', {}).get('acronyms', {})
+    products = gpt_context.get('files', {}).get('products', {})
+    
+    # Expand keywords with known acronyms/products
+    expanded_keywords = keywords.copy()
+    for keyword in keywords:
+        # Check if keyword matches an acronym
+        for section, terms in acronyms.items():
+            if isinstance(terms, dict):
+                if keyword.upper() in terms:
+                    expanded_keywords.append(terms[keyword.upper()])
+        # Check if keyword matches a product
+        if keyword in products:
+            expanded_keywords.append(keyword)
+    
+    # Limit to most relevant keywords
+    keywords = expanded_keywords[:5]
+    
+    # Detect query intent
+    intent = "general"
+    
+    # Detect workflow/diagram/dataflow questions (e.g., "tell me the workflow of PRTS", "ad serving dataflow diagram", "mermaid diagram")
+    workflow_keywords = ['workflow', 'work flow', 'process', 'how does', 'how do', 'explain', 'describe', 'what is']
+    diagram_keywords = ['diagram', 'flowchart', 'mermaid', 'dataflow', 'data flow', 'architecture', 'flow']
+    # Check if question contains workflow or diagram keywords
+    if any(keyword in question_lower for keyword in workflow_keywords + diagram_keywords):
+        # Also check if it mentions "the process" or contains an acronym (likely a process name) or asks for a diagram
+        if 'the process' in question_lower or any(word.isupper() and len(word) >= 2 for word in question.split()) or any(keyword in question_lower for keyword in diagram_keywords):
+            intent = "workflow"
+        elif any(keyword in question_lower for keyword in ['workflow', 'work flow', 'how does', 'how do']):
+            intent = "workflow"
+    elif any(word in question_lower for word in ['ticket', 'tickets', 'issue', 'issues', 'story', 'stories', 'epic', 'epics', 'bug', 'bugs', 'task', 'tasks']):
+        intent = "jira_only"
+    elif any(word in question_lower for word in ['count', 'sum', 'total', 'how many', 'aggregate']):
+        intent = "aggregation"
+    elif any(word in question_lower for word in ['list', 'show', 'find', 'get', 'all']):
+        intent = "listing"
+    elif any(word in question_lower for word in ['difference', 'compare', 'vs', 'versus']):
+        intent = "comparison"
+    elif any(word in question_lower for word in ['current', 'this', 'sprint']):
+        intent = "current_sprint"
+    
+    # Extract date information for JIRA queries - DYNAMIC based on current date
+    jira_params = {}
+    from datetime import datetime
+    from dateutil.relativedelta import relativedelta
+    
+    current_date = datetime.now()
+    current_month_year = current_date.strftime('%B %Y')  # e.g., "October 2025"
+    current_year = current_date.strftime('%Y')  # e.g., "2025"
+    
+    # Detect if query is about specific team
+    team_detected = None
+    if 'front end portal development' in question_lower or 'front end' in question_lower or 'frontend' in question_lower:
+        team_detected = 'Front End Portal Development'
+        jira_params['team'] = 'Front End Portal Development'
+    elif 'backend' in question_lower or 'back end' in question_lower:
+        team_detected = 'Backend'
+        jira_params['team'] = 'Backend'
+    elif 'data analysis' in question_lower or 'data analytics' in question_lower:
+        team_detected = 'Data Analysis'
+        jira_params['team'] = 'Data Analysis'
+    
+    # Sprint-based queries
+    # Determine if we should query Stories or Epics based on the question
+    # If asking about points, stories, or specific teams → use Stories
+    # If asking about epics, roadmap, planned work → use Epics
+    query_for_stories = any(word in question_lower for word in ['points', 'story points', 'stories', 'count of tickets']) or team_detected is not None
+    
+    if 'current sprint' in question_lower or 'this sprint' in question_lower:
+        jira_params['sprint_date'] = current_month_year
+        if not query_for_stories:
+            jira_params['issue_type_name'] = 'Epic'
+    elif 'last sprint' in question_lower or 'previous sprint' in question_lower:
+        last_month = current_date - relativedelta(months=1)
+        jira_params['sprint_date'] = last_month.strftime('%B %Y')
+        if not query_for_stories:
+            jira_params['issue_type_name'] = 'Epic'
+    elif 'next sprint' in question_lower:
+        next_month = current_date + relativedelta(months=1)
+        jira_params['sprint_date'] = next_month.strftime('%B %Y')
+        if not query_for_stories:
+            jira_params['issue_type_name'] = 'Epic'
+    elif 'next 3 sprints' in question_lower or 'next three sprints' in question_lower:
+        sprints = []
+        for i in range(1, 4):  # Next 3 months
+            future_month = current_date + relativedelta(months=i)
+            sprints.append(future_month.strftime('%B %Y'))
+        jira_params['sprint_date'] = ', '.join(sprints)
+        if not query_for_stories:
+            jira_params['issue_type_name'] = 'Epic'
+    elif 'next 2 sprints' in question_lower or 'next two sprints' in question_lower:
+        sprints = []
+        for i in range(1, 3):  # Next 2 months
+            future_month = current_date + relativedelta(months=i)
+            sprints.append(future_month.strftime('%B %Y'))
+        jira_params['sprint_date'] = ', '.join(sprints)
+        if not query_for_stories:
+            jira_params['issue_type_name'] = 'Epic'
+    
+    # Release-based queries
+    elif 'current release' in question_lower or 'this release' in question_lower:
+        jira_params['release_date'] = current_month_year
+        jira_params['issue_type_name'] = 'Epic'
+    elif 'last release' in question_lower or 'previous release' in question_lower:
+        last_month = current_date - relativedelta(months=1)
+        jira_params['release_date'] = last_month.strftime('%B %Y')
+        jira_params['issue_type_name'] = 'Epic'
+    elif 'next release' in question_lower:
+        next_month = current_date + relativedelta(months=1)
+        jira_params['release_date'] = next_month.strftime('%B %Y')
+        jira_params['issue_type_name'] = 'Epic'
+    elif 'last 3 releases' in question_lower or 'last three releases' in question_lower:
+        releases = []
+        for i in range(2, -1, -1):  # Last 3 months (including current)
+            past_month = current_date - relativedelta(months=i)
+            releases.append(past_month.strftime('%B %Y'))
+        jira_params['release_date'] = ', '.join(releases)
+        jira_params['issue_type_name'] = 'Epic'
+    elif 'next 3 releases' in question_lower or 'next three releases' in question_lower:
+        releases = []
+        for i in range(1, 4):  # Next 3 months
+            future_month = current_date + relativedelta(months=i)
+            releases.append(future_month.strftime('%B %Y'))
+        jira_params['release_date'] = ', '.join(releases)
+        jira_params['issue_type_name'] = 'Epic'
+    elif 'releases' in question_lower and ('ytd' in question_lower or 'year to date' in question_lower):
+        jira_params['release_date'] = f'%{current_year}%'
+        jira_params['issue_type_name'] = 'Epic'
+    
+    # Year-based queries
+    elif 'rest of the year' in question_lower or 'rest of this year' in question_lower or 'remainder of the year' in question_lower or 'remainder of this year' in question_lower:
+        # Rest of year = current month + remaining months until December
+        sprints = []
+        months_remaining = 12 - current_date.month + 1  # Include current month
+        for i in range(0, months_remaining):
+            future_month = current_date + relativedelta(months=i)
+            sprints.append(future_month.strftime('%B %Y'))
+        jira_params['sprint_date'] = ', '.join(sprints)
+        jira_params['issue_type_name'] = 'Epic'
+    elif 'this year' in question_lower or 'ytd' in question_lower or 'year to date' in question_lower:
+        # Full year
+        jira_params['sprint_date'] = f'%{current_year}%'
+        jira_params['issue_type_name'] = 'Epic'
+    
+    return {
+        'intent': intent,
+        'keywords': keywords,
+        'jira_params': jira_params,
+        'is_technical': any(word in question_lower for word in ['technical', 'architecture', 'code', 'github', 'repository'])
+    }
+
+def legacy_get_intelligent_jira_filters(question: str, product_mappings: dict) -> dict:
+    """
+    Get intelligent JIRA filters based on GitHub product mappings
+    """
+    filters = {}
+    question_lower = question.lower()
+    
+    # Check products.json for product filter
+    products = product_mappings.get('products', {})
+    for product_name, product_info in products.items():
+        if product_name.lower() in question_lower:
+            filters['product'] = product_name
+            break
+    
+    # Check stream_leads.json for stream filter
+    stream_leads = product_mappings.get('stream_leads', {})
+    for stream_name, stream_info in stream_leads.items():
+        if stream_name.lower() in question_lower:
+            filters['stream'] = stream_name
+            break
+    
+    # Check acronyms.json for related keywords
+    acronyms = product_mappings.get('acronyms', {})
+    for acronym, definition in acronyms.items():
+        if acronym.lower() in question_lower:
+            # Add related keywords to search
+            if 'search_terms' not in filters:
+                filters['search_terms'] = []
+            filters['search_terms'].append(acronym)
+            filters['search_terms'].append(definition)
+    
+    # Special handling for "Omnichannel" queries
+    if 'omnichannel' in question_lower:
+        # For Omnichannel queries, use summary search to get ALL Omnichannel work
+        # The stream filter doesn't work reliably, so we use summary instead
+        filters['summary'] = 'Omnichannel'
+        # Don't restrict by product - we want all products with Omnichannel in the summary
+        if 'audience' in question_lower:
+            filters['search_terms'] = ['omnichannel', 'audience', 'OA']
+    
+    return filters
+
+def legacy_search_hints(question: str) -> dict:
+    """The substring checks that picked AO search terms for JIRA and Confluence"""
+    question_lower = question.lower()
+    return {
+        'jira_ao': any(word in question_lower for word in ['ao', 'adaptive optimization', 'adaptive']),
+        'confluence_ao': 'ao' in question_lower
+    }
+
+def search_hints(question: str) -> dict:
+    groups = main._KEYWORD_MATCHER.match(question)['groups']
+    return {'jira_ao': 'jira_ao' in groups, 'confluence_ao': 'confluence_ao' in groups}
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--context", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "GPT"))
+    args = parser.parse_args()
+
+    gpt_context = load_local_context(args.context)
+    files = gpt_context["files"]
+    product_mappings = {
+        'products': files.get('products', {}),
+        'stream_leads': files.get('stream_leads', {}),
+        'acronyms': files.get('acronyms', {})
+    }
+
+    # Index and compile once up front - in the service this happens when the context store refreshes
+    start = time.perf_counter()
+    term_index = main.get_term_index(gpt_context)
+    matcher = main._get_query_matcher(term_index)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    legacy = time_per_call(lambda q: (legacy_intelligent_query_analysis(q, gpt_context), legacy_get_intelligent_jira_filters(q, product_mappings)), args.iterations)
+    compiled = time_per_call(lambda q: main.intelligent_query_analysis(q, gpt_context), args.iterations)
+
+    print(f"Questions: {len(SAMPLE_QUESTIONS)}  iterations: {args.iterations}  terms: {len(term_index)}  matcher phrases: {matcher.phrase_count}  index + compile: {compile_ms:.1f}ms")
+    print(f"{'':10} {'mean':>10} {'p50':>10} {'max':>10}")
+    for name, stats in (("legacy", legacy), ("compiled", compiled)):
+        print(f"{name:10} {stats['mean_us']:>8.1f}us {stats['p50_us']:>8.1f}us {stats['max_us']:>8.1f}us")
+    print(f"speedup: {legacy['mean_us'] / compiled['mean_us']:.1f}x")
+
+    print("\nDifferences (legacy -> compiled):")
+    differences = 0
+    for question in SAMPLE_QUESTIONS:
+        old = legacy_intelligent_query_analysis(question, gpt_context)
+        old_filters = legacy_get_intelligent_jira_filters(question, product_mappings)
+        new = main.intelligent_query_analysis(question, gpt_context)
+        for field, before, after in (
+            ("intent", old['intent'], new['intent']),
+            ("jira_params", old['jira_params'], new['jira_params']),
+            ("jira_filters", old_filters, new['jira_filters']),
+            ("search_hints", legacy_search_hints(question), search_hints(question))
+        ):
+            if before != after:
+                differences += 1
+                print(f"  {question!r}\n    {field}: {before} -> {after}")
+    if not differences:
+        print("  none")
+
+if __name__ == "__main__":
+    main_cli()
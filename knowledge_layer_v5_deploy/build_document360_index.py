@@ -0,0 +1,58 @@
+"""
+Build the compact Document360 search index that the knowledge layer mmaps at startup.
+
+document360_knowledge_base.json carries both `content` and `html_content` for every
+article and has to be parsed and tokenized in full by each worker. This writes the same
+BM25 index main.py would build from it - text only, postings precomputed - so a worker
+only maps the file and reads a small term dictionary.
+
+The file is optional - deploys do not build it. Usage (from knowledge_layer_v5_deploy/, before deploying):
+    python build_document360_index.py [--snapshot ../GPT/document360_knowledge_base.json] [--output document360_index.bin]
+
+main.py picks the file up from DOCUMENT360_INDEX_PATH, /app/document360_index.bin or
+./document360_index.bin, and otherwise falls back to indexing the JSON snapshot. It serves
+from cold start only: once the JSON snapshot's extracted_at is newer than the file's,
+workers index the JSON instead.
+"""
+import argparse
+import json
+import os
+import time
+
+import main
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--snapshot", default="../GPT/document360_knowledge_base.json")
+    parser.add_argument("--output", default="document360_index.bin")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with open(args.snapshot, 'r', encoding='utf-8') as f:
+        snapshot = json.load(f)
+    parse_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    header = main.write_document360_index_file(snapshot, args.output)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = main.open_document360_index_file(args.output)
+    open_seconds = time.perf_counter() - start
+
+    # The compact file must answer exactly like an index built from the JSON
+    reference = main.build_document360_index(snapshot)
+    for term, postings in reference['postings'].items():
+        compact = index['postings'].get(term)
+        assert [doc for doc, _ in compact] == [doc for doc, _ in postings], term
+    assert index['docs'][len(index['docs']) - 1]['content'] == reference['docs'][-1]['content']
+
+    snapshot_size = os.path.getsize(args.snapshot)
+    output_size = os.path.getsize(args.output)
+    print(f"Snapshot: {args.snapshot} ({snapshot_size / 1e6:.2f} MB, parsed in {parse_seconds * 1000:.0f} ms)")
+    print(f"Index:    {args.output} ({output_size / 1e6:.2f} MB, {output_size / snapshot_size:.0%} of the snapshot)")
+    print(f"          {header['article_count']} articles, {header['term_count']} terms, extracted_at {header['extracted_at']}")
+    print(f"Build:    {build_seconds * 1000:.0f} ms   Open: {open_seconds * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main_cli()
@@ -8,12 +8,23 @@ bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
 backlog = 2048
 
 # Worker processes
-workers = 2
-worker_class = 'sync'
+# A question spends almost all of its time waiting on JIRA/Confluence/GitHub/Document360
+# and the LLM, so each worker serves many at once on threads (gthread). The app keeps its
+# per-worker state (HTTP sessions, async loop, LLM clients, caches) behind locks and pid
+# checks, so it is safe to share between threads and to preload before forking.
+# GUNICORN_WORKER_CLASS=sync restores the one-request-per-worker profile.
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+# gunicorn silently turns sync into gthread when threads > 1, so other classes get one thread
+threads = int(os.environ.get('GUNICORN_THREADS', 16 if worker_class == 'gthread' else 1))
 worker_connections = 1000
 timeout = 120
 keepalive = 5
 
+# Import main.py once in the master: workers fork with the GPT context matcher, bulkheads
+# and compiled patterns already built, and a broken deploy fails before any worker starts
+preload_app = True
+
 # Logging
 accesslog = '-'
 errorlog = '-'
@@ -31,3 +42,24 @@ user = None
 group = None
 tmp_upload_dir = None
 
+def post_fork(server, worker):
+    server.log.info(f"Worker {worker.pid} started ({worker_class}, {threads} threads)")
+
+def post_worker_init(worker):
+    # Prime secrets, provider clients, GPT context/instructions and upstream connections
+    # before this worker accepts its first request. WARMUP_ON_BOOT=0 skips it (local runs).
+    if os.environ.get('WARMUP_ON_BOOT', '1') != '1':
+        return
+    try:
+        import main
+        main.warm_up()
+    except Exception as e:
+        worker.log.warning(f"Worker {worker.pid} warmup failed: {e}")
+
+def worker_exit(server, worker):
+    # Write this worker's final counts to the shared metrics store before it goes
+    try:
+        import main
+        main.flush_metrics(final=True)
+    except Exception as e:
+        worker.log.warning(f"Worker {worker.pid} metrics flush failed: {e}")
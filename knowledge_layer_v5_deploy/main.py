@@ -1,74 +1,149 @@
+# === STARTUP TIMING ===
+# A new instance pays for this module's import before it can answer anyone, so each
+# phase is timed and the breakdown printed once the module has loaded
+import time
+IMPORT_TIMINGS = {"phases": {}, "lazy": {}, "total_ms": None}  # milliseconds
+_IMPORT_STARTED = time.perf_counter()
+_import_phase_started = _IMPORT_STARTED
+
+def _end_import_phase(name: str):
+    global _import_phase_started
+    now = time.perf_counter()
+    IMPORT_TIMINGS["phases"][name] = round((now - _import_phase_started) * 1000, 1)
+    _import_phase_started = now
+
 import json
 import os
 import re
+import sys
+import importlib
+import importlib.util
 import requests
 from datetime import datetime, timedelta
-from flask import Request, jsonify, Flask
+from flask import Request, Response, jsonify, Flask, g
 from flask_cors import CORS, cross_origin
+_end_import_phase("flask+requests")
 try:
     import functions_framework
     FUNCTIONS_FRAMEWORK_AVAILABLE = True
 except ImportError:
     FUNCTIONS_FRAMEWORK_AVAILABLE = False
     print("⚠️ functions_framework not available - Cloud Run mode only")
+_end_import_phase("functions_framework")
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import time
-
-# Import Secret Manager for explicit secret access
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+import random
+import asyncio
+import contextvars
+import functools
+import copy
+import sqlite3
+import tempfile
+import math
+import heapq
+import mmap
+import struct
+import zlib
+from array import array
+from collections import OrderedDict, Counter
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+_end_import_phase("stdlib")
 try:
-    from google.cloud import secretmanager
-    SECRET_MANAGER_AVAILABLE = True
+    import httpx
+    HTTPX_AVAILABLE = True
 except ImportError:
-    SECRET_MANAGER_AVAILABLE = False
-    print("⚠️ Secret Manager not available - will rely on environment variables")
-
-# Import Firestore for GPT instructions
+    HTTPX_AVAILABLE = False
+    print("⚠️ httpx not available - async fan-out will use the pooled sync client in threads")
+# Raised by either HTTP client when an upstream doesn't answer in time
+UPSTREAM_TIMEOUT_ERRORS = (requests.Timeout, asyncio.TimeoutError) + ((httpx.TimeoutException,) if HTTPX_AVAILABLE else ())
+_end_import_phase("httpx")
 try:
-    from google.cloud import firestore
-    FIRESTORE_AVAILABLE = True
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
 except ImportError:
-    FIRESTORE_AVAILABLE = False
+    TIKTOKEN_AVAILABLE = False
+    print("⚠️ tiktoken not available - context token counts will be estimated")
+_end_import_phase("tiktoken")
+
+# === PROVIDER SDKS ===
+# vertexai, google.cloud.secretmanager, google.cloud.firestore and openai are only
+# checked for here; each is imported the first time it is used (or by warm_up), so a
+# new instance starts without paying for SDKs the first request may not need.
+_PROVIDER_IMPORT_LOCK = threading.Lock()
+# Only modules whose import has completed - sys.modules also holds ones still initializing
+_PROVIDER_MODULES = {}
+
+def _module_installed(name: str) -> bool:
+    """True when the module can be imported, without importing it"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+def _import_provider(name: str):
+    """Import a provider SDK on first use, recording how long it took (raises ImportError)"""
+    module = _PROVIDER_MODULES.get(name)
+    if module is not None:
+        return module
+    with _PROVIDER_IMPORT_LOCK:
+        if name in _PROVIDER_MODULES:
+            return _PROVIDER_MODULES[name]
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        IMPORT_TIMINGS["lazy"][name] = round((time.perf_counter() - start) * 1000, 1)
+        print(f"📦 Imported {name} on first use ({IMPORT_TIMINGS['lazy'][name]:.0f} ms)")
+        _PROVIDER_MODULES[name] = module
+        return module
+
+# Secret Manager for explicit secret access
+SECRET_MANAGER_AVAILABLE = _module_installed("google.cloud.secretmanager")
+if not SECRET_MANAGER_AVAILABLE:
+    print("⚠️ Secret Manager not available - will rely on environment variables")
+
+# Firestore for GPT instructions
+FIRESTORE_AVAILABLE = _module_installed("google.cloud.firestore")
+if not FIRESTORE_AVAILABLE:
     print("⚠️ Firestore not available - custom instructions will not be loaded")
 
-# Import Vertex AI for Gemini 2.0 Flash support
-VERTEX_AI_AVAILABLE = False
+# Vertex AI for Gemini 2.0 Flash support. VERTEX_AI_AVAILABLE means "installed" until the
+# first import is attempted, and is cleared if that import fails so routing stops offering Gemini
+VERTEX_AI_AVAILABLE = _module_installed("vertexai")
 vertexai = None
 GenerativeModel = None
+_VERTEX_IMPORT_LOCK = threading.Lock()
+if not VERTEX_AI_AVAILABLE:
+    print("⚠️ Vertex AI not available - Gemini requests will use OpenAI")
 
 def _check_vertex_ai_availability():
-    """Check if Vertex AI is available, try to import if needed"""
+    """Import Vertex AI on first use; False when it cannot be imported"""
     global VERTEX_AI_AVAILABLE, vertexai, GenerativeModel
-    if VERTEX_AI_AVAILABLE:
-        return True
-    
-    try:
-        import vertexai as vai
-        from vertexai.generative_models import GenerativeModel as GM
-        vertexai = vai
-        GenerativeModel = GM
-        VERTEX_AI_AVAILABLE = True
-        print("✅ Vertex AI imported successfully")
+    if GenerativeModel is not None:
         return True
-    except ImportError as e:
-        print(f"⚠️ Vertex AI import failed (ImportError): {e}")
-        return False
-    except Exception as e:
-        print(f"⚠️ Vertex AI import failed (Exception): {e}")
-        import traceback
-        print(f"⚠️ Traceback: {traceback.format_exc()}")
+    if not VERTEX_AI_AVAILABLE:
         return False
-
-# Try initial import
-try:
-    import vertexai as vai
-    from vertexai.generative_models import GenerativeModel as GM
-    vertexai = vai
-    GenerativeModel = GM
-    VERTEX_AI_AVAILABLE = True
-    print("✅ Vertex AI available - Gemini 2.0 Flash is ready")
-except Exception as e:
-    print(f"⚠️ Vertex AI not available at startup - will try lazy import. Error: {e}")
+    
+    # One thread imports; GenerativeModel is set last so a reader that sees it also sees vertexai
+    with _VERTEX_IMPORT_LOCK:
+        if GenerativeModel is not None:
+            return True
+        try:
+            vertexai = _import_provider("vertexai")
+            GenerativeModel = _import_provider("vertexai.generative_models").GenerativeModel
+            print("✅ Vertex AI imported successfully")
+            return True
+        except ImportError as e:
+            print(f"⚠️ Vertex AI import failed (ImportError): {e}")
+            VERTEX_AI_AVAILABLE = False
+            return False
+        except Exception as e:
+            print(f"⚠️ Vertex AI import failed (Exception): {e}")
+            import traceback
+            print(f"⚠️ Traceback: {traceback.format_exc()}")
+            VERTEX_AI_AVAILABLE = False
+            return False
 
 # Create Flask app for Cloud Run compatibility
 app = Flask(__name__)
@@ -84,101 +159,196 @@ location = "us-east4"
 # Initialize OpenAI with proper error handling
 OPENAI_AVAILABLE = False
 OPENAI_API_KEY_CACHE = None  # Cache for runtime access
+_OPENAI_API_KEY_LOCK = threading.Lock()  # One Secret Manager fetch at a time per worker
+
+_FIRESTORE_DB = None  # One client per worker - construction is not free
+_FIRESTORE_DB_PID = None
+
+# GPT instructions compiled once per worker and rebuilt only when the admin doc changes
+GPT_INSTRUCTIONS_CACHE = {
+    "combined": "",
+    "disclaimer": "",
+    "custom_update_time": None,  # Firestore update_time of gpt_instructions/current
+    "loaded": False,
+    "checked_at": 0.0,
+    "watch": None,               # Firestore snapshot listener, when available
+    "rechecking": False,
+    "pid": None
+}
+GPT_INSTRUCTIONS_RECHECK_SECONDS = 30  # Version check interval when no snapshot listener is running
+_GPT_INSTRUCTIONS_LOCK = threading.Lock()
+_CORE_INSTRUCTIONS = None  # ProductGPT_v15_Instructions.md contents, read once
+
+# Disclaimer extraction patterns, tried in order
+_DISCLAIMER_PATTERNS = [
+    # Pattern 1: "Always provide the statement to all answers: "text"" (handles markdown headers)
+    re.compile(r'Always provide the statement to all answers:\s*"([^"]+)"', re.IGNORECASE | re.DOTALL),
+    # Pattern 2: Look for any quoted text after "statement to all answers" (more flexible)
+    re.compile(r'statement to all answers[^"]*"([^"]+)"', re.IGNORECASE | re.DOTALL),
+    # Pattern 3: Generic "statement" followed by quoted text
+    re.compile(r'statement.*?:\s*"([^"]+)"', re.IGNORECASE | re.DOTALL),
+    # Pattern 4: Any quoted text after "disclaimer"
+    re.compile(r'disclaimer.*?:\s*"([^"]+)"', re.IGNORECASE | re.DOTALL)
+]
 
 def _get_firestore_db():
     """Get Firestore database client"""
+    global _FIRESTORE_DB, _FIRESTORE_DB_PID
     if not FIRESTORE_AVAILABLE:
         return None
+    # gRPC channels don't survive a fork, so a client inherited from the parent is rebuilt
+    if _FIRESTORE_DB is not None and _FIRESTORE_DB_PID == os.getpid():
+        return _FIRESTORE_DB
     try:
-        db = firestore.Client(project="pulsepoint-bitstrapped-ai")
-        return db
+        firestore = _import_provider("google.cloud.firestore")
+        _FIRESTORE_DB = firestore.Client(project="pulsepoint-bitstrapped-ai")
+        _FIRESTORE_DB_PID = os.getpid()
+        return _FIRESTORE_DB
     except Exception as e:
         print(f"⚠️ Failed to initialize Firestore: {e}")
         return None
 
-def _get_gpt_instructions() -> tuple:
-    """Fetch combined GPT instructions from Firestore (custom + core)
+def _extract_disclaimer(custom_content: str) -> str:
+    """Extract the disclaimer statement from custom instructions"""
+    for pattern in _DISCLAIMER_PATTERNS:
+        match = pattern.search(custom_content)
+        if match:
+            return match.group(1).strip()
+    return ""
+
+def _load_core_instructions() -> str:
+    """Read core instructions from the container (or local checkout) once per worker"""
+    global _CORE_INSTRUCTIONS
+    if _CORE_INSTRUCTIONS is not None:
+        return _CORE_INSTRUCTIONS
+
+    core_content = ""
+    core_paths = [
+        "/app/instructions/ProductGPT_v15_Instructions.md",
+        "./instructions/ProductGPT_v15_Instructions.md",  # Relative path in container
+        "/Users/bweinstein/product-gpt/knowledge_layer_v5_deploy/instructions/ProductGPT_v15_Instructions.md",
+        "/Users/bweinstein/product-gpt/instructions/ProductGPT_v15_Instructions.md"
+    ]
+    for path in core_paths:
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    core_content = f.read()
+                    break
+            except:
+                continue
+    _CORE_INSTRUCTIONS = core_content
+    return core_content
+
+def _compile_gpt_instructions(custom_content: str) -> tuple:
+    """Combine core + custom instructions and extract the disclaimer
     Returns: (combined_instructions, disclaimer_text)"""
-    db = _get_firestore_db()
-    if not db:
-        return ("", "")
-    
+    disclaimer_text = _extract_disclaimer(custom_content) if custom_content else ""
+    core_content = _load_core_instructions()
+
+    # Combine instructions (core first, then custom)
+    if custom_content.strip() and core_content.strip():
+        combined = f"{core_content}\n\n---\n\n## Custom Instructions (Admin-Added)\n\n{custom_content}"
+    elif custom_content.strip():
+        combined = custom_content
+    elif core_content.strip():
+        combined = core_content
+    else:
+        combined = ""
+
+    if combined:
+        print(f"✅ Loaded GPT instructions ({len(combined)} chars: {len(core_content)} core + {len(custom_content)} custom)")
+        # Verify the new Mermaid URL is in the instructions
+        if "pulsepointinc.github.io/product/mermaid" in combined:
+            print("✅ Verified: New Mermaid URL is in instructions")
+        if "rawcdn.githack.com" in combined:
+            print("⚠️ WARNING: Old rawcdn.githack.com URL found in instructions!")
+    if disclaimer_text:
+        print(f"✅ Extracted disclaimer: {disclaimer_text[:100]}...")
+
+    return (combined, disclaimer_text)
+
+def _apply_gpt_instructions_snapshot(doc):
+    """Rebuild the cached instructions from a gpt_instructions/current snapshot"""
+    custom_content = ""
+    if doc is not None and doc.exists:
+        custom_content = (doc.to_dict() or {}).get("content", "")
+    update_time = getattr(doc, "update_time", None) if doc is not None else None
+    combined, disclaimer_text = _compile_gpt_instructions(custom_content)
+    # Single update so readers see either the old or the new pair, never a mix
+    GPT_INSTRUCTIONS_CACHE.update({
+        "combined": combined,
+        "disclaimer": disclaimer_text,
+        "custom_update_time": update_time,
+        "loaded": True,
+        "checked_at": time.time(),
+        "pid": os.getpid()
+    })
+
+def _on_gpt_instructions_snapshot(doc_snapshots, changes, read_time):
+    """Firestore listener callback - an admin edit lands here within seconds"""
     try:
-        # Get custom instructions
-        instructions_ref = db.collection('gpt_instructions').document('current')
-        instructions_doc = instructions_ref.get()
-        
-        custom_content = ""
-        disclaimer_text = ""
-        if instructions_doc.exists:
-            data = instructions_doc.to_dict()
-            custom_content = data.get("content", "")
-            
-            # Extract disclaimer from custom instructions
-            # Pattern 1: "Always provide the statement to all answers: "text"" (handles markdown headers)
-            match = re.search(r'Always provide the statement to all answers:\s*"([^"]+)"', custom_content, re.IGNORECASE | re.DOTALL)
-            if match:
-                disclaimer_text = match.group(1).strip()
-            
-            # Pattern 2: Look for any quoted text after "statement to all answers" (more flexible)
-            if not disclaimer_text:
-                match = re.search(r'statement to all answers[^"]*"([^"]+)"', custom_content, re.IGNORECASE | re.DOTALL)
-                if match:
-                    disclaimer_text = match.group(1).strip()
-            
-            # Pattern 3: Generic "statement" followed by quoted text
-            if not disclaimer_text:
-                match = re.search(r'statement.*?:\s*"([^"]+)"', custom_content, re.IGNORECASE | re.DOTALL)
-                if match:
-                    disclaimer_text = match.group(1).strip()
-            
-            # Pattern 4: Any quoted text after "disclaimer"
-            if not disclaimer_text:
-                match = re.search(r'disclaimer.*?:\s*"([^"]+)"', custom_content, re.IGNORECASE | re.DOTALL)
-                if match:
-                    disclaimer_text = match.group(1).strip()
-        
-        # Get core instructions (from file path in container or fallback)
-        core_content = ""
-        core_paths = [
-            "/app/instructions/ProductGPT_v15_Instructions.md",
-            "./instructions/ProductGPT_v15_Instructions.md",  # Relative path in container
-            "/Users/bweinstein/product-gpt/knowledge_layer_v5_deploy/instructions/ProductGPT_v15_Instructions.md",
-            "/Users/bweinstein/product-gpt/instructions/ProductGPT_v15_Instructions.md"
-        ]
-        for path in core_paths:
-            if os.path.exists(path):
-                try:
-                    with open(path, 'r', encoding='utf-8') as f:
-                        core_content = f.read()
-                        break
-                except:
-                    continue
-        
-        # Combine instructions (core first, then custom)
-        if custom_content.strip() and core_content.strip():
-            combined = f"{core_content}\n\n---\n\n## Custom Instructions (Admin-Added)\n\n{custom_content}"
-        elif custom_content.strip():
-            combined = custom_content
-        elif core_content.strip():
-            combined = core_content
+        if doc_snapshots:
+            print("🔄 GPT instructions changed in Firestore - recompiling")
+            _apply_gpt_instructions_snapshot(doc_snapshots[0])
+    except Exception as e:
+        print(f"⚠️ Error applying GPT instructions snapshot: {e}")
+
+def _recheck_gpt_instructions_version():
+    """Fallback when no listener is running: re-read the doc only if update_time moved"""
+    try:
+        db = _get_firestore_db()
+        if not db:
+            return
+        doc = db.collection('gpt_instructions').document('current').get()
+        if getattr(doc, "update_time", None) != GPT_INSTRUCTIONS_CACHE["custom_update_time"]:
+            print("🔄 GPT instructions version changed - recompiling")
+            _apply_gpt_instructions_snapshot(doc)
         else:
-            combined = ""
-        
-        if combined:
-            print(f"✅ Loaded GPT instructions ({len(combined)} chars: {len(core_content)} core + {len(custom_content)} custom)")
-            # Verify the new Mermaid URL is in the instructions
-            if "pulsepointinc.github.io/product/mermaid" in combined:
-                print("✅ Verified: New Mermaid URL is in instructions")
-            if "rawcdn.githack.com" in combined:
-                print("⚠️ WARNING: Old rawcdn.githack.com URL found in instructions!")
-        if disclaimer_text:
-            print(f"✅ Extracted disclaimer: {disclaimer_text[:100]}...")
-        
-        return (combined, disclaimer_text)
+            GPT_INSTRUCTIONS_CACHE["checked_at"] = time.time()
     except Exception as e:
-        print(f"⚠️ Error fetching GPT instructions: {e}")
-        return ("", "")
+        print(f"⚠️ Error checking GPT instructions version: {e}")
+    finally:
+        GPT_INSTRUCTIONS_CACHE["rechecking"] = False
+
+def _get_gpt_instructions() -> tuple:
+    """Fetch combined GPT instructions from Firestore (custom + core)
+    Served from the per-worker cache; a Firestore snapshot listener (or a periodic
+    update_time check when the listener is unavailable) keeps it current
+    Returns: (combined_instructions, disclaimer_text)"""
+    cache = GPT_INSTRUCTIONS_CACHE
+    if cache["loaded"] and cache["pid"] == os.getpid():
+        if cache["watch"] is None and time.time() - cache["checked_at"] > GPT_INSTRUCTIONS_RECHECK_SECONDS:
+            with _GPT_INSTRUCTIONS_LOCK:
+                start_recheck = not cache["rechecking"]
+                cache["rechecking"] = True
+            if start_recheck:
+                threading.Thread(target=_recheck_gpt_instructions_version, name="gpt-instructions-recheck", daemon=True).start()
+        return (cache["combined"], cache["disclaimer"])
+
+    with _GPT_INSTRUCTIONS_LOCK:
+        if cache["loaded"] and cache["pid"] == os.getpid():
+            return (cache["combined"], cache["disclaimer"])
+
+        db = _get_firestore_db()
+        if not db:
+            cache.update({"loaded": True, "checked_at": time.time(), "pid": os.getpid()})
+            return ("", "")
+
+        try:
+            instructions_ref = db.collection('gpt_instructions').document('current')
+            _apply_gpt_instructions_snapshot(instructions_ref.get())
+            try:
+                # The listener's first callback re-delivers the current doc; later ones are admin edits
+                cache["watch"] = instructions_ref.on_snapshot(_on_gpt_instructions_snapshot)
+                print("✅ Watching gpt_instructions/current for changes")
+            except Exception as e:
+                cache["watch"] = None
+                print(f"⚠️ Firestore listener unavailable ({e}) - checking instructions version every {GPT_INSTRUCTIONS_RECHECK_SECONDS}s")
+            return (cache["combined"], cache["disclaimer"])
+        except Exception as e:
+            print(f"⚠️ Error fetching GPT instructions: {e}")
+            return ("", "")
 
 def _get_openai_api_key() -> str:
     """
@@ -206,51 +376,111 @@ def _get_openai_api_key() -> str:
     
     # Try Secret Manager as fallback
     if SECRET_MANAGER_AVAILABLE:
-        try:
-            print("🔍 Attempting to fetch OpenAI API key from Secret Manager...")
-            client = secretmanager.SecretManagerServiceClient()
-            project_id = "pulsepoint-datahub"
-            secret_id = "openai-api-key"
-            name = f"projects/{project_id}/secrets/{secret_id}/versions/latest"
-            
-            response = client.access_secret_version(request={"name": name})
-            api_key = response.payload.data.decode("UTF-8").strip()
-            
-            # Double-check strip (in case there are multiple newlines)
-            api_key = api_key.strip()
-            
-            if api_key and api_key.startswith("sk-"):
-                print(f"✅ OpenAI API key fetched from Secret Manager (length: {len(api_key)})")
-                OPENAI_API_KEY_CACHE = api_key
-                return api_key
-            else:
-                print(f"⚠️ Secret Manager returned invalid API key format")
-        except Exception as e:
-            print(f"⚠️ Failed to fetch from Secret Manager: {e}")
-            import traceback
-            print(f"⚠️ Traceback: {traceback.format_exc()}")
+        with _OPENAI_API_KEY_LOCK:
+            # Another thread may have fetched it while we waited
+            if OPENAI_API_KEY_CACHE:
+                return OPENAI_API_KEY_CACHE
+            return _fetch_openai_api_key_from_secret_manager()
     
     return None
 
-try:
-    import openai
-    # Try to get API key at initialization
-    api_key = _get_openai_api_key()
-    if api_key:
-        openai.api_key = api_key
-        OPENAI_AVAILABLE = True
-        print(f"✅ OpenAI initialized successfully (API key length: {len(api_key)})")
-    else:
-        print("⚠️ OpenAI API key not available at initialization - will try at runtime")
-        OPENAI_AVAILABLE = False
-except ImportError as e:
-    print(f"⚠️ OpenAI module not available: {e}")
-    OPENAI_AVAILABLE = False
-except Exception as e:
-    print(f"⚠️ OpenAI initialization error: {e}")
-    import traceback
-    print(f"⚠️ Traceback: {traceback.format_exc()}")
-    OPENAI_AVAILABLE = False
+def _fetch_openai_api_key_from_secret_manager() -> str:
+    """Read openai-api-key from Secret Manager into OPENAI_API_KEY_CACHE (caller holds _OPENAI_API_KEY_LOCK)"""
+    global OPENAI_API_KEY_CACHE
+    try:
+        print("🔍 Attempting to fetch OpenAI API key from Secret Manager...")
+        secretmanager = _import_provider("google.cloud.secretmanager")
+        client = secretmanager.SecretManagerServiceClient()
+        project_id = "pulsepoint-datahub"
+        secret_id = "openai-api-key"
+        name = f"projects/{project_id}/secrets/{secret_id}/versions/latest"
+        
+        response = client.access_secret_version(request={"name": name})
+        api_key = response.payload.data.decode("UTF-8").strip()
+        
+        # Double-check strip (in case there are multiple newlines)
+        api_key = api_key.strip()
+        
+        if api_key and api_key.startswith("sk-"):
+            print(f"✅ OpenAI API key fetched from Secret Manager (length: {len(api_key)})")
+            OPENAI_API_KEY_CACHE = api_key
+            return api_key
+        else:
+            print(f"⚠️ Secret Manager returned invalid API key format")
+    except Exception as e:
+        print(f"⚠️ Failed to fetch from Secret Manager: {e}")
+        import traceback
+        print(f"⚠️ Traceback: {traceback.format_exc()}")
+
+    return None
+
+# The SDK is imported and the API key resolved (env var or Secret Manager) on first use or by
+# warm_up - never at import, so a cold instance doesn't wait on Secret Manager to boot
+OPENAI_AVAILABLE = _module_installed("openai")
+if not OPENAI_AVAILABLE:
+    print("⚠️ OpenAI module not available")
+
+# === LLM CLIENTS ===
+# Provider clients are built once per worker and reused, so synthesis calls share one
+# keep-alive connection pool instead of paying client setup and a TLS handshake each time.
+# The OpenAI client is rebuilt only when the API key changes; Vertex AI is initialized once.
+OPENAI_CLIENT_TIMEOUT = 60.0  # Increased to 60 seconds for workflow questions
+_LLM_CLIENTS = {
+    "openai": None,
+    "openai_key": None,
+    "vertex_initialized": False,
+    "gemini_models": {},   # model name -> GenerativeModel
+    "pid": None
+}
+_LLM_CLIENTS_LOCK = threading.Lock()
+
+def _reset_llm_clients_after_fork():
+    # Connection pools and gRPC channels must not be shared across a fork
+    if _LLM_CLIENTS["pid"] != os.getpid():
+        _LLM_CLIENTS.update({"openai": None, "openai_key": None, "vertex_initialized": False, "gemini_models": {}, "pid": os.getpid()})
+
+def _get_openai_client(api_key: str):
+    """Worker-wide OpenAI client for this API key (a rotated key gets a fresh client)"""
+    client = _LLM_CLIENTS["openai"]
+    if client is not None and _LLM_CLIENTS["openai_key"] == api_key and _LLM_CLIENTS["pid"] == os.getpid():
+        return client
+    with _LLM_CLIENTS_LOCK:
+        _reset_llm_clients_after_fork()
+        if _LLM_CLIENTS["openai"] is None or _LLM_CLIENTS["openai_key"] != api_key:
+            if _LLM_CLIENTS["openai"] is not None:
+                print("🔑 OpenAI API key changed - creating a new client")
+            # The previous client is left to the garbage collector - in-flight calls may still be using it
+            _LLM_CLIENTS["openai"] = _import_provider("openai").OpenAI(api_key=api_key, timeout=OPENAI_CLIENT_TIMEOUT)
+            _LLM_CLIENTS["openai_key"] = api_key
+            print("✅ OpenAI client created")
+        return _LLM_CLIENTS["openai"]
+
+def _invalidate_openai_api_key():
+    """Forget the cached key and client after an auth failure so the next call re-reads the secret"""
+    global OPENAI_API_KEY_CACHE
+    with _LLM_CLIENTS_LOCK:
+        OPENAI_API_KEY_CACHE = None
+        _LLM_CLIENTS["openai"] = None
+        _LLM_CLIENTS["openai_key"] = None
+
+def _get_gemini_model(model_name: str):
+    """Worker-wide GenerativeModel; vertexai.init runs once per worker"""
+    model = _LLM_CLIENTS["gemini_models"].get(model_name)
+    if model is not None and _LLM_CLIENTS["pid"] == os.getpid():
+        return model
+    with _LLM_CLIENTS_LOCK:
+        _reset_llm_clients_after_fork()
+        if not _LLM_CLIENTS["vertex_initialized"]:
+            print(f"🚀 Initializing Vertex AI for Gemini...")
+            vertexai.init(project="pulsepoint-bitstrapped-ai", location="us-east4")
+            _LLM_CLIENTS["vertex_initialized"] = True
+            print(f"✅ Vertex AI initialized")
+        model = _LLM_CLIENTS["gemini_models"].get(model_name)
+        if model is None:
+            model = GenerativeModel(model_name)
+            _LLM_CLIENTS["gemini_models"][model_name] = model
+            print(f"✅ GenerativeModel created: {model_name}")
+        return model
 
 # API endpoints - Multi-source integration (Bryan's specified endpoints)
 CONFLUENCE_API = "https://pulsepoint-confluence-api-v3-420423430685.us-east4.run.app"
@@ -260,93 +490,1560 @@ DOCUMENT360_API = "https://pulsepoint-document360-api-v1-420423430685.us-east4.r
 
 # GPT repo context cache (public GitHub)
 GPT_REPO_API = "https://api.github.com/repos/pulsepointinc/product/contents/GPT"
+GPT_RAW_BASE = "https://raw.githubusercontent.com/pulsepointinc/product/main/GPT"
 GPT_CONTEXT = {
     "last_loaded": 0.0,
-    "ttl_seconds": 21600,  # 6 hours
+    "ttl_seconds": 21600,  # 6 hours - after that, served stale while a background refresh runs
     "files": {},          # filename -> parsed json
+    "etags": {},          # filename -> ETag, for If-None-Match revalidation
+    "refreshing": False,
+    "term_index": None,   # term -> acronym definition / product / stream, see build_term_index
     "team_aliases": {},   # alias(lower) -> canonical team name
     "jira_field_definitions": {}  # field_name -> {description, possible_values}
 }
+# Used when the GitHub directory listing is unavailable (rate limit, outage)
+GPT_CONTEXT_DEFAULT_FILES = [
+    'acronyms.json',
+    'products.json',
+    'stream_leads.json',
+    'official_sources.json',
+    'workflow_instructions.json',
+    'jira_field_definitions.json'
+]
+# Large snapshots that are not part of the per-request context
+GPT_CONTEXT_SKIP_FILES = {'document360_knowledge_base.json'}
+_GPT_CONTEXT_LOCK = threading.Lock()
+
+# === POOLED HTTP CLIENT ===
+# One keep-alive session per upstream host, shared by every request in the worker.
+# Confluence, JIRA v4, Git API, Document360 and raw.githubusercontent.com are hit on
+# every /ask, so reusing sockets saves a TCP+TLS handshake per call.
+HTTP_CLIENT_CONFIG = {
+    "pool_maxsize": int(os.environ.get("HTTP_POOL_MAXSIZE", "16")),  # Max kept-alive sockets per host
+    "max_retries": int(os.environ.get("HTTP_MAX_RETRIES", "2")),     # Retries for idempotent calls only
+    "backoff_base": 0.25,      # First retry waits ~0.25s, then ~0.5s, ...
+    "backoff_max": 2.0,
+    "retry_statuses": {429, 502, 503, 504}
+}
+_HTTP_SESSIONS = {}   # "scheme://host" -> requests.Session
+_HTTP_POOL_STATS = {}  # "scheme://host" -> counters
+_HTTP_SESSIONS_LOCK = threading.Lock()
+_HTTP_SESSIONS_PID = os.getpid()
+
+def _http_host_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+def _get_http_session(url: str) -> requests.Session:
+    """Get (or lazily create) the pooled keep-alive session for the URL's host"""
+    global _HTTP_SESSIONS_PID
+    host_key = _http_host_key(url)
+    session = _HTTP_SESSIONS.get(host_key)
+    if session is not None and _HTTP_SESSIONS_PID == os.getpid():
+        return session
+
+    with _HTTP_SESSIONS_LOCK:
+        # Sockets must not be shared across a fork (e.g. gunicorn preload) - start fresh in the child
+        if _HTTP_SESSIONS_PID != os.getpid():
+            _HTTP_SESSIONS.clear()
+            _HTTP_POOL_STATS.clear()
+            _HTTP_SESSIONS_PID = os.getpid()
+        session = _HTTP_SESSIONS.get(host_key)
+        if session is None:
+            session = requests.Session()
+            # Retries are handled in _http_request so that only idempotent calls are retried
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_CLIENT_CONFIG["pool_maxsize"], max_retries=0)
+            session.mount(f"{urlsplit(url).scheme}://", adapter)
+            _HTTP_SESSIONS[host_key] = session
+            print(f"🔌 Created pooled HTTP session for {host_key}")
+        return session
+
+def _http_record(host_key: str, field: str, amount=1):
+    with _HTTP_SESSIONS_LOCK:
+        stats = _HTTP_POOL_STATS.setdefault(host_key, {
+            "requests": 0,
+            "failures": 0,
+            "retries": 0,
+            "total_seconds": 0.0
+        })
+        stats[field] += amount
+
+def _http_request(method: str, url: str, idempotent: bool = None, **kwargs) -> requests.Response:
+    """
+    Send a request through the pooled session for the URL's host.
+    Idempotent calls (GET by default) are retried on connection errors and
+    429/502/503/504 with jittered exponential backoff. Read timeouts are never
+    retried - the caller's time budget is already spent.
+    """
+    if idempotent is None:
+        idempotent = method.upper() == "GET"
+    max_retries = HTTP_CLIENT_CONFIG["max_retries"] if idempotent else 0
+    session = _get_http_session(url)
+    host_key = _http_host_key(url)
+
+    attempt = 0
+    while True:
+        start_time = time.time()
+        try:
+            response = session.request(method, url, **kwargs)
+            retryable = response.status_code in HTTP_CLIENT_CONFIG["retry_statuses"]
+            error = None
+        except requests.exceptions.ConnectionError as e:
+            # Includes stale keep-alive sockets closed by the server
+            response = None
+            retryable = True
+            error = e
+        except Exception:
+            _http_record(host_key, "requests")
+            _http_record(host_key, "failures")
+            _http_record(host_key, "total_seconds", time.time() - start_time)
+            raise
+        _http_record(host_key, "requests")
+        _http_record(host_key, "total_seconds", time.time() - start_time)
+
+        if retryable and attempt < max_retries:
+            attempt += 1
+            _http_record(host_key, "retries")
+            backoff = min(HTTP_CLIENT_CONFIG["backoff_max"], HTTP_CLIENT_CONFIG["backoff_base"] * (2 ** (attempt - 1)))
+            time.sleep(random.uniform(backoff / 2, backoff))  # Jitter so workers don't retry in lockstep
+            continue
+
+        if error is not None:
+            _http_record(host_key, "failures")
+            raise error
+        if response.status_code >= 400:
+            _http_record(host_key, "failures")
+        return response
+
+def get_http_pool_stats() -> dict:
+    """Per-host connection pool statistics for this worker"""
+    stats = {}
+    with _HTTP_SESSIONS_LOCK:
+        for host_key, counters in _HTTP_POOL_STATS.items():
+            host_stats = dict(counters)
+            session = _HTTP_SESSIONS.get(host_key)
+            if session is not None:
+                # urllib3 tracks how many sockets it had to open vs. requests served
+                connections_opened = 0
+                adapter = session.get_adapter(host_key)
+                for pool_key in list(adapter.poolmanager.pools.keys()):
+                    pool = adapter.poolmanager.pools.get(pool_key)
+                    if pool is not None:
+                        connections_opened += pool.num_connections
+                host_stats["connections_opened"] = connections_opened
+            host_stats["avg_seconds"] = round(host_stats["total_seconds"] / host_stats["requests"], 3) if host_stats.get("requests") else 0.0
+            host_stats["total_seconds"] = round(host_stats.get("total_seconds", 0.0), 3)
+            stats[host_key] = host_stats
+    return stats
 
 def _http_get_json(url: str, params: dict = None, headers: dict = None, timeout: int = 30):  # Increased from 15 to 30 seconds
     try:
         # Convert params values to strings if they're not already
         if params:
             params = {k: str(v) if not isinstance(v, str) else v for k, v in params.items()}
-        r = requests.get(url, params=params, headers=headers or {}, timeout=timeout)
+        r = _http_request("GET", url, params=params, headers=headers or {}, timeout=timeout)
         r.raise_for_status()
         return r.json()
     except Exception as e:
         print(f"❌ HTTP GET failed for {url}: {e}")
         return None
 
-def _http_post_json(url: str, data: dict, headers: dict = None, timeout: int = 30):  # Increased from 15 to 30 seconds
+def _http_post_json(url: str, data: dict, headers: dict = None, timeout: int = 30, idempotent: bool = False):  # Increased from 15 to 30 seconds
     try:
-        r = requests.post(url, json=data, headers=headers or {}, timeout=timeout)
+        r = _http_request("POST", url, idempotent=idempotent, json=data, headers=headers or {}, timeout=timeout)
         r.raise_for_status()
         return r.json()
     except Exception as e:
         print(f"❌ HTTP POST failed for {url}: {e}")
         return None
 
+# === ASYNC RUNTIME ===
+# A single event loop per worker runs the upstream fan-out as coroutines.
+# Flask handlers stay synchronous and hand work to the loop through _run_async.
+_ASYNC_LOOP = None
+_ASYNC_LOOP_PID = None
+_ASYNC_LOOP_LOCK = threading.Lock()
+_ASYNC_HTTP_CLIENT = None
+
+def _get_async_loop() -> asyncio.AbstractEventLoop:
+    """Get (or lazily start) this worker's background event loop"""
+    global _ASYNC_LOOP, _ASYNC_LOOP_PID, _ASYNC_HTTP_CLIENT
+    if _ASYNC_LOOP is not None and _ASYNC_LOOP_PID == os.getpid():
+        return _ASYNC_LOOP
+
+    with _ASYNC_LOOP_LOCK:
+        if _ASYNC_LOOP is None or _ASYNC_LOOP_PID != os.getpid():
+            # Threads don't survive a fork, so a loop inherited from the parent is dead
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="knowledge-layer-async", daemon=True)
+            thread.start()
+            _ASYNC_LOOP = loop
+            _ASYNC_LOOP_PID = os.getpid()
+            _ASYNC_HTTP_CLIENT = None
+            print("🔄 Started async fan-out event loop")
+        return _ASYNC_LOOP
+
+def _on_async_loop_thread() -> bool:
+    """True on the worker's event loop thread, where blocking on the loop would deadlock"""
+    try:
+        return asyncio.get_running_loop() is _ASYNC_LOOP
+    except RuntimeError:
+        return False
+
+def _run_async(coro, timeout: float = None):
+    """Sync shim: run a coroutine on the worker's event loop and wait for its result"""
+    if _on_async_loop_thread():
+        coro.close()
+        raise RuntimeError("_run_async called on the event loop thread - await the coroutine instead")
+    trace = _CURRENT_TRACE.get()
+    if trace is not None:
+        coro = _with_trace(trace, coro)  # The loop thread has its own context - carry the request's trace over
+    future = asyncio.run_coroutine_threadsafe(coro, _get_async_loop())
+    try:
+        return future.result(timeout=timeout)
+    except Exception:
+        future.cancel()
+        raise
+
+def _get_async_http_client():
+    """Shared keep-alive httpx client - must be used from the event loop thread"""
+    global _ASYNC_HTTP_CLIENT
+    if _ASYNC_HTTP_CLIENT is None:
+        _ASYNC_HTTP_CLIENT = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_CLIENT_CONFIG["pool_maxsize"] * 4,
+                max_keepalive_connections=HTTP_CLIENT_CONFIG["pool_maxsize"] * 4
+            ),
+            follow_redirects=True
+        )
+        print("🔌 Created async HTTP client")
+    return _ASYNC_HTTP_CLIENT
+
+async def _http_request_async(method: str, url: str, idempotent: bool = None, timeout: float = 30, **kwargs):
+    """Async counterpart of _http_request with the same retry policy and stats"""
+    if not HTTPX_AVAILABLE:
+        # No async client installed - run the pooled sync client off the loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(_http_request, method, url, idempotent=idempotent, timeout=timeout, **kwargs))
+
+    if idempotent is None:
+        idempotent = method.upper() == "GET"
+    max_retries = HTTP_CLIENT_CONFIG["max_retries"] if idempotent else 0
+    client = _get_async_http_client()
+    host_key = _http_host_key(url)
+
+    attempt = 0
+    while True:
+        start_time = time.time()
+        try:
+            response = await client.request(method, url, timeout=timeout, **kwargs)
+            retryable = response.status_code in HTTP_CLIENT_CONFIG["retry_statuses"]
+            error = None
+        except (httpx.ConnectError, httpx.RemoteProtocolError) as e:
+            response = None
+            retryable = True
+            error = e
+        except Exception:
+            _http_record(host_key, "requests")
+            _http_record(host_key, "failures")
+            _http_record(host_key, "total_seconds", time.time() - start_time)
+            raise
+        _http_record(host_key, "requests")
+        _http_record(host_key, "total_seconds", time.time() - start_time)
+
+        if retryable and attempt < max_retries:
+            attempt += 1
+            _http_record(host_key, "retries")
+            backoff = min(HTTP_CLIENT_CONFIG["backoff_max"], HTTP_CLIENT_CONFIG["backoff_base"] * (2 ** (attempt - 1)))
+            await asyncio.sleep(random.uniform(backoff / 2, backoff))
+            continue
+
+        if error is not None:
+            _http_record(host_key, "failures")
+            raise error
+        if response.status_code >= 400:
+            _http_record(host_key, "failures")
+        return response
+
+# === TRACING ===
+# Each /ask request carries a RequestTrace in a context variable; code along the request
+# path opens spans on it (query analysis, context load, each upstream call, prompt assembly,
+# the LLM call, serialization) without a trace parameter being threaded through every call.
+# _run_async carries the trace onto the event loop, so fan-out tasks record into it too.
+# A finished trace becomes the Server-Timing header, the response's "timings" block, and
+# per-stage, per-intent latency histograms for this worker.
+LATENCY_BUCKETS_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+_LATENCY_HISTOGRAMS = {}  # (stage, intent) -> {"buckets": [count per bucket, +Inf last], "count", "sum"}
+_LATENCY_LOCK = threading.Lock()
+_CURRENT_TRACE = contextvars.ContextVar("request_trace", default=None)
+
+class RequestTrace:
+    """Spans for one request. Spans may start and end on different threads (request, event loop, stream)."""
+
+    def __init__(self, intent: str = None):
+        self.started = time.perf_counter()
+        self.intent = intent
+        self.spans = []
+        self.streaming = False  # Streamed responses are finished when they close, not by the request hooks
+        self.finished = False
+        self.in_flight = False  # Counted in knowledge_layer_in_flight_requests until the response closes
+        self.status_code = None
+        self.cache_status = None
+        self._lock = threading.Lock()
+
+    def start(self, name: str, **attrs) -> dict:
+        return self.record(name, time.perf_counter(), None, **attrs)
+
+    def record(self, name: str, start: float, end: float, **attrs) -> dict:
+        """Add a span measured elsewhere (perf_counter times; end None while it is still open)"""
+        span = {"name": name, "start": start, "end": end, "attrs": attrs}
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def end(self, span: dict, **attrs):
+        span["attrs"].update(attrs)
+        if span["end"] is None:
+            span["end"] = time.perf_counter()
+
+    def _closed_spans(self) -> list:
+        now = time.perf_counter()
+        with self._lock:
+            return [dict(span, end=span["end"] if span["end"] is not None else now) for span in self.spans]
+
+    def timings(self) -> dict:
+        """The "timings" block: milliseconds per stage (summed over repeats) and each span in start order"""
+        spans = self._closed_spans()
+        stages = {}
+        for span in spans:
+            stages[span["name"]] = round(stages.get(span["name"], 0.0) + (span["end"] - span["start"]) * 1000, 1)
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "stages": stages,
+            "spans": [
+                dict({"name": span["name"], "start_ms": round((span["start"] - self.started) * 1000, 1),
+                      "duration_ms": round((span["end"] - span["start"]) * 1000, 1)}, **span["attrs"])
+                for span in spans
+            ]
+        }
+
+    def server_timing(self) -> str:
+        """Server-Timing header value (durations in milliseconds)"""
+        entries = []
+        for span in self._closed_spans():
+            entry = f"{span['name']};dur={(span['end'] - span['start']) * 1000:.1f}"
+            if span["attrs"].get("status"):
+                entry += f';desc="{span["attrs"]["status"]}"'
+            entries.append(entry)
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+    def finish(self):
+        """Record every span and the total into the latency histograms and request metrics (once)"""
+        with self._lock:
+            if self.finished:
+                return
+            self.finished = True
+        intent = self.intent or "unknown"
+        total = time.perf_counter() - self.started
+        spans = self._closed_spans()
+        for span in spans:
+            record_latency(span["name"], intent, span["end"] - span["start"])
+        record_latency("total", intent, total)
+        # Cache hits and coalesced followers made no LLM call of their own
+        model = next((span["attrs"].get("model") for span in reversed(spans) if span["name"] == "llm"), None) or "none"
+        metric_inc("knowledge_layer_requests_total", intent=intent, model=model,
+                   cache=self.cache_status or "NONE", status=str(self.status_code or 200))
+        metric_observe("knowledge_layer_request_duration_seconds", total, intent=intent, model=model)
+
+    def close(self):
+        """The response is closed - sent, or the client went away, possibly before a stream started"""
+        self.finish()
+        with self._lock:
+            in_flight, self.in_flight = self.in_flight, False
+        if in_flight:
+            metric_gauge_add("knowledge_layer_in_flight_requests", -1)
+
+@contextmanager
+def activate_trace(trace: RequestTrace):
+    """Make trace the current one on this thread for the duration of the block"""
+    token = _CURRENT_TRACE.set(trace)
+    try:
+        yield trace
+    finally:
+        _CURRENT_TRACE.reset(token)
+
+def current_trace() -> RequestTrace:
+    return _CURRENT_TRACE.get()
+
+def trace_start(name: str, **attrs) -> dict:
+    """Open a span on the current trace (None when there is no trace)"""
+    trace = _CURRENT_TRACE.get()
+    return trace.start(name, **attrs) if trace is not None else None
+
+def trace_end(span: dict, **attrs):
+    trace = _CURRENT_TRACE.get()
+    if span is not None and trace is not None:
+        trace.end(span, **attrs)
+
+@contextmanager
+def trace_span(name: str, **attrs):
+    """Time a block as a span of the current trace; an exception is recorded as status=error"""
+    span = trace_start(name, **attrs)
+    try:
+        yield span
+    except BaseException as e:
+        trace_end(span, status="cancelled" if isinstance(e, asyncio.CancelledError) else "error")
+        raise
+    trace_end(span)
+
+async def traced_async(name: str, coro, **attrs):
+    """Await coro as a span - for fan-out tasks, so a call dropped at the deadline shows as cancelled"""
+    with trace_span(name, **attrs):
+        return await coro
+
+async def _with_trace(trace: RequestTrace, coro):
+    _CURRENT_TRACE.set(trace)  # Local to this task's context (and the tasks it creates)
+    return await coro
+
+def _latency_bucket_index(seconds: float) -> int:
+    """Index of the first bucket whose bound is >= seconds (len(LATENCY_BUCKETS_SECONDS) for +Inf)"""
+    index = 0
+    while index < len(LATENCY_BUCKETS_SECONDS) and seconds > LATENCY_BUCKETS_SECONDS[index]:
+        index += 1
+    return index
+
+def record_latency(stage: str, intent: str, seconds: float):
+    with _LATENCY_LOCK:
+        histogram = _LATENCY_HISTOGRAMS.get((stage, intent))
+        if histogram is None:
+            histogram = {"buckets": [0] * (len(LATENCY_BUCKETS_SECONDS) + 1), "count": 0, "sum": 0.0}
+            _LATENCY_HISTOGRAMS[(stage, intent)] = histogram
+        histogram["buckets"][_latency_bucket_index(seconds)] += 1
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+
+def _histogram_quantile(buckets: list, count: int, quantile: float) -> float:
+    """Quantile estimated from bucket counts, interpolating linearly inside the bucket"""
+    rank = quantile * count
+    cumulative = 0
+    for index, bucket_count in enumerate(buckets):
+        if bucket_count and cumulative + bucket_count >= rank:
+            lower = LATENCY_BUCKETS_SECONDS[index - 1] if index > 0 else 0.0
+            if index == len(LATENCY_BUCKETS_SECONDS):
+                return lower  # Beyond the last bucket - report its bound
+            upper = LATENCY_BUCKETS_SECONDS[index]
+            return lower + (upper - lower) * (rank - cumulative) / bucket_count
+        cumulative += bucket_count
+    return 0.0
+
+def get_latency_histograms() -> dict:
+    """stage -> intent (plus "all") -> count, mean and estimated p50/p95/p99 in seconds, with raw bucket counts"""
+    with _LATENCY_LOCK:
+        snapshot = {key: {"buckets": list(h["buckets"]), "count": h["count"], "sum": h["sum"]} for key, h in _LATENCY_HISTOGRAMS.items()}
+    merged = {}
+    for (stage, intent), histogram in snapshot.items():
+        merged.setdefault(stage, {})[intent] = histogram
+        overall = merged[stage].setdefault("all", {"buckets": [0] * len(histogram["buckets"]), "count": 0, "sum": 0.0})
+        overall["buckets"] = [a + b for a, b in zip(overall["buckets"], histogram["buckets"])]
+        overall["count"] += histogram["count"]
+        overall["sum"] += histogram["sum"]
+    report = {}
+    for stage, intents in merged.items():
+        report[stage] = {}
+        for intent, histogram in intents.items():
+            count = histogram["count"]
+            report[stage][intent] = {
+                "count": count,
+                "mean_seconds": round(histogram["sum"] / count, 4) if count else 0.0,
+                "p50_seconds": round(_histogram_quantile(histogram["buckets"], count, 0.50), 4),
+                "p95_seconds": round(_histogram_quantile(histogram["buckets"], count, 0.95), 4),
+                "p99_seconds": round(_histogram_quantile(histogram["buckets"], count, 0.99), 4),
+                "buckets": dict(zip([str(bound) for bound in LATENCY_BUCKETS_SECONDS] + ["+Inf"], histogram["buckets"]))
+            }
+    return report
+
+# === UPSTREAM BULKHEADS ===
+# One bulkhead per upstream, shared by every request in the worker. Each caps how many
+# calls may run at once and how many may wait, so a degraded Confluence can only tie up
+# its own slots - JIRA, Git API, Document360 and the LLMs keep their capacity.
+BULKHEAD_CONFIG = {
+    'confluence': {'max_concurrent': 8, 'max_queued': 16},
+    'jira_v4': {'max_concurrent': 8, 'max_queued': 16},
+    'git_api': {'max_concurrent': 8, 'max_queued': 16},
+    'document360': {'max_concurrent': 8, 'max_queued': 16},
+    'openai': {'max_concurrent': 8, 'max_queued': 16},
+    'gemini': {'max_concurrent': 8, 'max_queued': 16}
+}
+
+class BulkheadFullError(Exception):
+    """Raised when an upstream's bulkhead has no free slot and its queue is full"""
+
+class Bulkhead:
+    """
+    Concurrency cap + bounded wait queue for one upstream.
+    Coroutines are admitted with run_async (async HTTP calls); blocking SDK calls
+    run on the bulkhead's own long-lived executor via submit.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queued: int):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix=f"bulkhead-{name}")
+        self._lock = threading.Lock()
+        self._semaphore = None
+        self._semaphore_loop = None
+        self._stats = {
+            "active": 0,
+            "queued": 0,
+            "completed": 0,
+            "rejected": 0,
+            "queue_wait_total": 0.0,
+            "queue_wait_max": 0.0,
+            "run_time_total": 0.0,
+            "run_time_max": 0.0
+        }
+
+    def _admit(self):
+        with self._lock:
+            if self._stats["active"] + self._stats["queued"] >= self.max_concurrent + self.max_queued:
+                self._stats["rejected"] += 1
+                raise BulkheadFullError(f"{self.name} bulkhead full ({self.max_concurrent} running, {self.max_queued} queued)")
+            self._stats["queued"] += 1
+
+    def _started(self, queue_wait: float):
+        with self._lock:
+            self._stats["queued"] -= 1
+            self._stats["active"] += 1
+            self._stats["queue_wait_total"] += queue_wait
+            self._stats["queue_wait_max"] = max(self._stats["queue_wait_max"], queue_wait)
+
+    def _finished(self, run_time: float):
+        with self._lock:
+            self._stats["active"] -= 1
+            self._stats["completed"] += 1
+            self._stats["run_time_total"] += run_time
+            self._stats["run_time_max"] = max(self._stats["run_time_max"], run_time)
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def run_async(self, coro):
+        """Await a coroutine inside this bulkhead (raises BulkheadFullError when saturated)"""
+        try:
+            self._admit()
+        except BulkheadFullError:
+            coro.close()
+            raise
+        enqueued = time.monotonic()
+        semaphore = self._get_semaphore()
+        try:
+            await semaphore.acquire()
+        except BaseException:
+            # Cancelled while waiting for a slot (e.g. request deadline)
+            with self._lock:
+                self._stats["queued"] -= 1
+            coro.close()
+            raise
+        started = time.monotonic()
+        self._started(started - enqueued)
+        try:
+            return await coro
+        finally:
+            semaphore.release()
+            self._finished(time.monotonic() - started)
+
+    def submit(self, fn, *args, **kwargs):
+        """Run a blocking call on this bulkhead's executor; returns a concurrent.futures.Future"""
+        self._admit()
+        enqueued = time.monotonic()
+
+        def _run():
+            started = time.monotonic()
+            self._started(started - enqueued)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._finished(time.monotonic() - started)
+
+        future = self.executor.submit(_run)
+
+        def _on_done(f):
+            # A future cancelled before it started never reaches _run, so release its queue slot here
+            if f.cancelled():
+                with self._lock:
+                    self._stats["queued"] -= 1
+        future.add_done_callback(_on_done)
+        return future
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        completed = stats["completed"]
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "active": stats["active"],
+            "queued": stats["queued"],
+            "completed": completed,
+            "rejected": stats["rejected"],
+            "queue_wait_avg_seconds": round(stats["queue_wait_total"] / completed, 4) if completed else 0.0,
+            "queue_wait_total_seconds": round(stats["queue_wait_total"], 4),
+            "queue_wait_max_seconds": round(stats["queue_wait_max"], 4),
+            "run_time_avg_seconds": round(stats["run_time_total"] / completed, 4) if completed else 0.0,
+            "run_time_max_seconds": round(stats["run_time_max"], 4)
+        }
+
+UPSTREAM_BULKHEADS = {
+    name: Bulkhead(name, config['max_concurrent'], config['max_queued'])
+    for name, config in BULKHEAD_CONFIG.items()
+}
+
+def get_bulkhead_stats() -> dict:
+    """Queue-wait and run-time statistics for every upstream bulkhead in this worker"""
+    return {name: bulkhead.stats() for name, bulkhead in UPSTREAM_BULKHEADS.items()}
+
+async def _http_get_json_async(url: str, params: dict = None, headers: dict = None, timeout: int = 30):
+    try:
+        if params:
+            params = {k: str(v) if not isinstance(v, str) else v for k, v in params.items()}
+        r = await _http_request_async("GET", url, params=params, headers=headers or {}, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+    except UPSTREAM_TIMEOUT_ERRORS:
+        raise  # Counted as a timeout by _cached_upstream_json_async
+    except Exception as e:
+        print(f"❌ HTTP GET failed for {url}: {e}")
+        return None
+
+async def _http_post_json_async(url: str, data: dict, headers: dict = None, timeout: int = 30, idempotent: bool = False):
+    try:
+        r = await _http_request_async("POST", url, idempotent=idempotent, json=data, headers=headers or {}, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+    except UPSTREAM_TIMEOUT_ERRORS:
+        raise  # Counted as a timeout by _cached_upstream_json_async
+    except Exception as e:
+        print(f"❌ HTTP POST failed for {url}: {e}")
+        return None
+
+# === SHARED SQLITE STORE ===
+# One SQLite file per instance, shared by every gunicorn worker (WAL mode, so readers
+# never wait on a writer). Connections are per thread and re-opened after a fork.
+SHARED_STORE_PATH = os.environ.get("SHARED_STORE_PATH", os.path.join(tempfile.gettempdir(), "knowledge_layer_v5_store.sqlite3"))
+_SHARED_STORE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS retrieval_cache (
+        key TEXT PRIMARY KEY,
+        source TEXT NOT NULL,
+        value TEXT NOT NULL,
+        stored_at REAL NOT NULL,
+        expires_at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS retrieval_cache_expires ON retrieval_cache (expires_at)",
+    # One row per sample per worker; le is set on histogram _bucket rows only
+    """CREATE TABLE IF NOT EXISTS metrics (
+        worker TEXT NOT NULL,
+        family TEXT NOT NULL,
+        name TEXT NOT NULL,
+        labels TEXT NOT NULL,
+        le REAL,
+        value REAL NOT NULL,
+        gauge INTEGER NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS metrics_worker ON metrics (worker)",
+    """CREATE TABLE IF NOT EXISTS metrics_workers (
+        worker TEXT PRIMARY KEY,
+        pid INTEGER NOT NULL,
+        flushed_at REAL NOT NULL
+    )"""
+]
+_SHARED_STORE_LOCAL = threading.local()
+
+def _get_shared_store():
+    """SQLite connection for this thread, or None when the store cannot be opened"""
+    local = _SHARED_STORE_LOCAL
+    if getattr(local, "pid", None) == os.getpid():
+        return local.connection
+    local.pid = os.getpid()
+    local.connection = None
+    try:
+        connection = sqlite3.connect(SHARED_STORE_PATH, timeout=1.0, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SHARED_STORE_SCHEMA:
+            connection.execute(statement)
+        local.connection = connection
+    except Exception as e:
+        print(f"⚠️ Shared store unavailable at {SHARED_STORE_PATH}: {e}")
+    return local.connection
+
+# === METRICS ===
+# Prometheus text exposition at /metrics, summed over every gunicorn worker on the instance.
+# Workers count in memory (no I/O on the request path); a background flusher copies this
+# worker's samples into the shared store every flush_seconds. /metrics only reads: the other
+# workers' last flushed rows plus this worker's in-memory samples.
+# Counters of a worker that has exited stay in the store (folded into "retired" after an
+# hour), so totals don't go backwards when gunicorn replaces a worker; gauges only count
+# from workers that flushed recently. Ratios (cache hit rate, error rate, cost per request)
+# are left to PromQL over the counters.
+METRICS_CONFIG = {
+    "flush_seconds": 10,
+    "gauge_stale_seconds": 60,      # Gauges from a worker that hasn't flushed this long are dropped
+    "retire_after_seconds": 3600    # Counters of a worker this quiet are folded into "retired"
+}
+METRIC_FAMILIES = {
+    "knowledge_layer_requests_total": ("counter", "/ask requests by intent, synthesis model, cache status and HTTP status"),
+    "knowledge_layer_request_duration_seconds": ("histogram", "/ask latency by intent and synthesis model"),
+    "knowledge_layer_stage_duration_seconds": ("histogram", "/ask latency per traced stage and intent"),
+    "knowledge_layer_in_flight_requests": ("gauge", "/ask requests being answered"),
+    "knowledge_layer_upstream_calls_total": ("counter", "Upstream calls by source and outcome (success, failure, timeout, rejected)"),
+    "knowledge_layer_upstream_deadline_drops_total": ("counter", "Upstream results abandoned at the request deadline"),
+    "knowledge_layer_llm_tokens_total": ("counter", "LLM tokens by provider, model and direction (Gemini counts are estimates)"),
+    "knowledge_layer_llm_cost_usd_total": ("counter", "Estimated LLM spend in USD by provider and model"),
+    "knowledge_layer_response_cache_events_total": ("counter", "Response cache lookups and writes by result"),
+    "knowledge_layer_response_cache_entries": ("gauge", "Answers held in the response cache"),
+    "knowledge_layer_retrieval_cache_events_total": ("counter", "Retrieval cache lookups and writes by source and result"),
+    "knowledge_layer_coalescing_events_total": ("counter", "Requests and upstream fetches that led or joined an in-flight computation"),
+    "knowledge_layer_bulkhead_active": ("gauge", "Calls running inside an upstream bulkhead"),
+    "knowledge_layer_bulkhead_queued": ("gauge", "Calls waiting for a bulkhead slot (executor queue depth)"),
+    "knowledge_layer_bulkhead_calls_total": ("counter", "Bulkhead calls by result (completed, rejected)"),
+    "knowledge_layer_bulkhead_queue_wait_seconds_total": ("counter", "Time calls spent queued for a bulkhead slot")
+}
+_METRIC_COUNTERS = {}    # (family, labels) -> value, labels a sorted tuple of (name, value)
+_METRIC_GAUGES = {}
+_METRIC_HISTOGRAMS = {}  # (family, labels) -> {"buckets": [count per bucket, +Inf last], "count", "sum"}
+_METRICS_LOCK = threading.Lock()
+_METRICS_STATE = {"pid": None, "worker": None, "flusher": None, "flushed_at": None}
+
+def _metrics_for_this_worker():
+    """Start from empty counters in a forked worker (caller holds _METRICS_LOCK)"""
+    if _METRICS_STATE["pid"] != os.getpid():
+        _METRIC_COUNTERS.clear()
+        _METRIC_GAUGES.clear()
+        _METRIC_HISTOGRAMS.clear()
+        _METRICS_STATE.update({"pid": os.getpid(), "worker": f"{os.getpid()}-{uuid.uuid4().hex[:8]}", "flusher": None, "flushed_at": None})
+
+def metric_inc(family: str, amount: float = 1, **labels):
+    key = (family, tuple(sorted(labels.items())))
+    with _METRICS_LOCK:
+        _metrics_for_this_worker()
+        _METRIC_COUNTERS[key] = _METRIC_COUNTERS.get(key, 0) + amount
+
+def metric_gauge_add(family: str, amount: float, **labels):
+    key = (family, tuple(sorted(labels.items())))
+    with _METRICS_LOCK:
+        _metrics_for_this_worker()
+        _METRIC_GAUGES[key] = _METRIC_GAUGES.get(key, 0) + amount
+
+def metric_observe(family: str, seconds: float, **labels):
+    """Add an observation to a histogram with the LATENCY_BUCKETS_SECONDS buckets"""
+    key = (family, tuple(sorted(labels.items())))
+    with _METRICS_LOCK:
+        _metrics_for_this_worker()
+        histogram = _METRIC_HISTOGRAMS.get(key)
+        if histogram is None:
+            histogram = {"buckets": [0] * (len(LATENCY_BUCKETS_SECONDS) + 1), "count": 0, "sum": 0.0}
+            _METRIC_HISTOGRAMS[key] = histogram
+        histogram["buckets"][_latency_bucket_index(seconds)] += 1
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+
+def record_upstream_outcome(source: str, outcome: str):
+    metric_inc("knowledge_layer_upstream_calls_total", source=source, outcome=outcome)
+
+def record_llm_usage(provider: str, model: str, input_tokens: float, output_tokens: float, cost_usd: float):
+    metric_inc("knowledge_layer_llm_tokens_total", int(input_tokens), provider=provider, model=model, direction="input")
+    metric_inc("knowledge_layer_llm_tokens_total", int(output_tokens), provider=provider, model=model, direction="output")
+    metric_inc("knowledge_layer_llm_cost_usd_total", cost_usd, provider=provider, model=model)
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_metric_labels(labels) -> str:
+    return ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in labels)
+
+def _histogram_samples(family: str, labels, histogram: dict) -> list:
+    """Cumulative _bucket series plus _count and _sum, as (family, name, labels, le, value, gauge)"""
+    rendered = _format_metric_labels(labels)
+    samples = []
+    cumulative = 0
+    for bound, bucket_count in zip(LATENCY_BUCKETS_SECONDS + (math.inf,), histogram["buckets"]):
+        cumulative += bucket_count
+        samples.append((family, f"{family}_bucket", rendered, bound, cumulative, 0))
+    samples.append((family, f"{family}_count", rendered, None, histogram["count"], 0))
+    samples.append((family, f"{family}_sum", rendered, None, histogram["sum"], 0))
+    return samples
+
+def _collect_metric_samples() -> list:
+    """This worker's samples: the registry plus stats the rest of the module already keeps"""
+    counters, gauges = {}, {}
+    with _METRICS_LOCK:
+        _metrics_for_this_worker()
+        counters.update(_METRIC_COUNTERS)
+        gauges.update(_METRIC_GAUGES)
+        histograms = {key: dict(h, buckets=list(h["buckets"])) for key, h in _METRIC_HISTOGRAMS.items()}
+    with _LATENCY_LOCK:
+        for (stage, intent), h in _LATENCY_HISTOGRAMS.items():
+            histograms[("knowledge_layer_stage_duration_seconds", (("intent", intent), ("stage", stage)))] = dict(h, buckets=list(h["buckets"]))
+
+    response_cache = get_response_cache_stats()
+    for result in ("hits", "misses", "bypassed", "stores", "evictions"):
+        counters[("knowledge_layer_response_cache_events_total", (("result", result),))] = response_cache[result]
+    gauges[("knowledge_layer_response_cache_entries", ())] = response_cache["entries"]
+    with _RETRIEVAL_CACHE_STATS_LOCK:
+        retrieval_cache = {source: dict(counts) for source, counts in _RETRIEVAL_CACHE_STATS.items()}
+    for source, counts in retrieval_cache.items():
+        for result, count in counts.items():
+            counters[("knowledge_layer_retrieval_cache_events_total", (("result", result), ("source", source)))] = count
+    coalescing = get_coalescing_stats()
+    for scope, stats in coalescing.items():
+        for event, count in stats.items():
+            if event != "in_flight":
+                counters[("knowledge_layer_coalescing_events_total", (("event", event), ("scope", scope)))] = count
+    for name, stats in get_bulkhead_stats().items():
+        upstream = (("upstream", name),)
+        gauges[("knowledge_layer_bulkhead_active", upstream)] = stats["active"]
+        gauges[("knowledge_layer_bulkhead_queued", upstream)] = stats["queued"]
+        counters[("knowledge_layer_bulkhead_calls_total", (("result", "completed"),) + upstream)] = stats["completed"]
+        counters[("knowledge_layer_bulkhead_calls_total", (("result", "rejected"),) + upstream)] = stats["rejected"]
+        counters[("knowledge_layer_bulkhead_queue_wait_seconds_total", upstream)] = stats["queue_wait_total_seconds"]
+
+    samples = []
+    for (family, labels), value in counters.items():
+        samples.append((family, family, _format_metric_labels(labels), None, value, 0))
+    for (family, labels), value in gauges.items():
+        samples.append((family, family, _format_metric_labels(labels), None, value, 1))
+    for (family, labels), histogram in histograms.items():
+        samples.extend(_histogram_samples(family, labels, histogram))
+    return samples
+
+def _retire_stale_workers(connection, now: float):
+    """Fold the counters of workers that stopped flushing into one "retired" set"""
+    stale = [row[0] for row in connection.execute(
+        "SELECT worker FROM metrics_workers WHERE worker != 'retired' AND flushed_at < ?",
+        (now - METRICS_CONFIG["retire_after_seconds"],)
+    )]
+    if not stale:
+        return
+    workers = stale + ["retired"]
+    placeholders = ",".join("?" * len(workers))
+    totals = connection.execute(
+        f"SELECT family, name, labels, le, SUM(value) FROM metrics WHERE gauge = 0 AND worker IN ({placeholders}) GROUP BY family, name, labels, le",
+        workers
+    ).fetchall()
+    connection.execute(f"DELETE FROM metrics WHERE worker IN ({placeholders})", workers)
+    connection.execute(f"DELETE FROM metrics_workers WHERE worker IN ({placeholders})", workers)
+    connection.executemany("INSERT INTO metrics (worker, family, name, labels, le, value, gauge) VALUES ('retired', ?, ?, ?, ?, ?, 0)", totals)
+    connection.execute("INSERT INTO metrics_workers (worker, pid, flushed_at) VALUES ('retired', 0, ?)", (now,))
+    print(f"📊 Retired metrics of {len(stale)} stopped worker(s)")
+
+def flush_metrics(final: bool = False) -> bool:
+    """Replace this worker's rows in the shared store with its current samples
+    final (worker exit) writes counters only, so the worker's gauges stop counting at once"""
+    samples = [sample for sample in _collect_metric_samples() if not (final and sample[5])]
+    connection = _get_shared_store()
+    if connection is None:
+        return False
+    now = time.time()
+    worker = _METRICS_STATE["worker"]
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM metrics WHERE worker = ?", (worker,))
+            connection.executemany(
+                "INSERT INTO metrics (worker, family, name, labels, le, value, gauge) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(worker,) + sample for sample in samples]
+            )
+            connection.execute("INSERT OR REPLACE INTO metrics_workers (worker, pid, flushed_at) VALUES (?, ?, ?)", (worker, os.getpid(), now))
+            _retire_stale_workers(connection, now)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+    except Exception as e:
+        print(f"⚠️ Metrics flush failed: {e}")
+        return False
+    _METRICS_STATE["flushed_at"] = now
+    return True
+
+def _metrics_flush_loop():
+    while True:
+        time.sleep(METRICS_CONFIG["flush_seconds"])
+        try:
+            flush_metrics()
+        except Exception as e:
+            print(f"⚠️ Metrics flusher error: {e}")
+
+def _ensure_metrics_flusher():
+    """Start this worker's flusher thread (again after a fork, or if it has stopped)"""
+    thread = _METRICS_STATE["flusher"]
+    if _METRICS_STATE["pid"] == os.getpid() and thread is not None and thread.is_alive():
+        return
+    with _METRICS_LOCK:
+        _metrics_for_this_worker()
+        thread = _METRICS_STATE["flusher"]
+        if thread is not None and thread.is_alive():
+            return
+        thread = threading.Thread(target=_metrics_flush_loop, name="metrics-flusher", daemon=True)
+        _METRICS_STATE["flusher"] = thread
+        thread.start()
+
+def _format_metric_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def render_metrics() -> str:
+    """Prometheus text format (0.0.4) for the whole instance, or this worker alone without the shared store
+    Never writes - a scrape must not contend with the cache writers for the store's write lock"""
+    _ensure_metrics_flusher()
+    local_samples = _collect_metric_samples()
+    totals = {}
+    connection = _get_shared_store()
+    if connection is not None:
+        try:
+            # This worker's rows are older than its in-memory samples - use those instead
+            totals = {(family, name, labels, le): value for family, name, labels, le, value in connection.execute(
+                """SELECT m.family, m.name, m.labels, m.le, SUM(m.value)
+                   FROM metrics m JOIN metrics_workers w ON w.worker = m.worker
+                   WHERE m.worker != ? AND (m.gauge = 0 OR w.flushed_at > ?)
+                   GROUP BY m.family, m.name, m.labels, m.le""",
+                (_METRICS_STATE["worker"], time.time() - METRICS_CONFIG["gauge_stale_seconds"])
+            )}
+        except Exception as e:
+            print(f"⚠️ Metrics read failed: {e}")
+    for family, name, labels, le, value, _ in local_samples:
+        key = (family, name, labels, le)
+        totals[key] = totals.get(key, 0) + value
+    rows = sorted(
+        (key + (value,) for key, value in totals.items()),
+        key=lambda row: (row[0], row[2], row[1], -1 if row[3] is None else row[3])
+    )
+
+    lines = []
+    family_seen = None
+    for family, name, labels, le, value in rows:
+        if family != family_seen:
+            metric_type, help_text = METRIC_FAMILIES.get(family, ("untyped", family))
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {metric_type}")
+            family_seen = family
+        if le is not None:
+            labels = ",".join(part for part in (labels, f'le="{_format_metric_value(le)}"') if part)
+        lines.append(f"{name}{{{labels}}} {_format_metric_value(value)}" if labels else f"{name} {_format_metric_value(value)}")
+    return "\n".join(lines) + "\n"
+
+# === RETRIEVAL CACHE ===
+# Upstream search results keyed by the exact outgoing request, in the shared store, so
+# questions that resolve to the same search ("AO factors" variants) skip the upstream hop
+# in every worker. Only successful responses are stored.
+RETRIEVAL_CACHE_TTL_SECONDS = {
+    'confluence': 1800,
+    'git_api': 3600,
+    'document360': 3600,   # Knowledge base articles change rarely
+    'jira_v4': 300         # Ticket status/sprint fields move during the day
+}
+RETRIEVAL_CACHE_MAX_ROWS = 5000
+RETRIEVAL_CACHE_PURGE_EVERY = 100  # Writes between expired-row purges
+_RETRIEVAL_CACHE_STATS = {}  # source -> {"hits", "misses", "stores", "errors"} for this worker
+_RETRIEVAL_CACHE_WRITES = {"count": 0, "purging": False}
+# SQLite calls block (up to the 1s busy timeout while another worker writes), so the event
+# loop hands them to these threads instead of stalling every fan-out in the worker
+_SHARED_STORE_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="shared-store")
+
+_RETRIEVAL_CACHE_STATS_LOCK = threading.Lock()
+
+def _retrieval_cache_record(source: str, field: str):
+    with _RETRIEVAL_CACHE_STATS_LOCK:
+        stats = _RETRIEVAL_CACHE_STATS.setdefault(source, {"hits": 0, "misses": 0, "stores": 0, "errors": 0})
+        stats[field] += 1
+
+def _retrieval_cache_key(source: str, method: str, url: str, payload: dict) -> str:
+    request_repr = json.dumps([source, method, url, payload], sort_keys=True, default=str)
+    return hashlib.sha256(request_repr.encode('utf-8')).hexdigest()
+
+def retrieval_cache_get(source: str, key: str):
+    """Cached parsed response for a request key, or None"""
+    connection = _get_shared_store()
+    if connection is None:
+        return None
+    try:
+        row = connection.execute(
+            "SELECT value FROM retrieval_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+    except Exception as e:
+        _retrieval_cache_record(source, "errors")
+        print(f"⚠️ Retrieval cache read failed: {e}")
+        return None
+    if row is None:
+        _retrieval_cache_record(source, "misses")
+        return None
+    _retrieval_cache_record(source, "hits")
+    return json.loads(row[0])
+
+def retrieval_cache_put(source: str, key: str, value):
+    _retrieval_cache_write(source, key, json.dumps(value))
+
+def _retrieval_cache_write(source: str, key: str, value_json: str):
+    """Store an already-serialized response (serialized by the caller, before it can be mutated)"""
+    connection = _get_shared_store()
+    if connection is None:
+        return
+    now = time.time()
+    try:
+        connection.execute(
+            "INSERT OR REPLACE INTO retrieval_cache (key, source, value, stored_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (key, source, value_json, now, now + RETRIEVAL_CACHE_TTL_SECONDS.get(source, 600))
+        )
+        _retrieval_cache_record(source, "stores")
+        with _RETRIEVAL_CACHE_STATS_LOCK:
+            _RETRIEVAL_CACHE_WRITES["count"] += 1
+            purge = _RETRIEVAL_CACHE_WRITES["count"] % RETRIEVAL_CACHE_PURGE_EVERY == 0 and not _RETRIEVAL_CACHE_WRITES["purging"]
+            if purge:
+                _RETRIEVAL_CACHE_WRITES["purging"] = True
+        if purge:
+            threading.Thread(target=_purge_retrieval_cache, name="retrieval-cache-purge", daemon=True).start()
+    except Exception as e:
+        _retrieval_cache_record(source, "errors")
+        print(f"⚠️ Retrieval cache write failed: {e}")
+
+def _purge_retrieval_cache():
+    """Drop expired rows and trim to RETRIEVAL_CACHE_MAX_ROWS (own thread - never on a request)"""
+    try:
+        connection = _get_shared_store()
+        if connection is not None:
+            connection.execute("DELETE FROM retrieval_cache WHERE expires_at <= ?", (time.time(),))
+            connection.execute(
+                "DELETE FROM retrieval_cache WHERE key IN (SELECT key FROM retrieval_cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                (RETRIEVAL_CACHE_MAX_ROWS,)
+            )
+    except Exception as e:
+        print(f"⚠️ Retrieval cache purge failed: {e}")
+    finally:
+        _RETRIEVAL_CACHE_WRITES["purging"] = False
+
+def get_retrieval_cache_stats() -> dict:
+    stats = {"path": SHARED_STORE_PATH, "sources": {name: dict(counts) for name, counts in _RETRIEVAL_CACHE_STATS.items()}}
+    connection = _get_shared_store()
+    if connection is not None:
+        try:
+            stats["rows"] = connection.execute("SELECT COUNT(*) FROM retrieval_cache WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+        except Exception:
+            pass
+    return stats
+
+async def _cached_upstream_json_async(source: str, method: str, url: str, payload: dict, timeout: float, idempotent: bool = True):
+    """
+    Upstream JSON call through the retrieval cache and the source's bulkhead
+    Identical calls already in flight on this worker (e.g. two questions that produce
+    the same Confluence payload) share that fetch instead of making their own
+    """
+    key = _retrieval_cache_key(source, method, url, payload)
+    loop = asyncio.get_running_loop()
+    cached = await loop.run_in_executor(_SHARED_STORE_EXECUTOR, retrieval_cache_get, source, key)
+    if cached is not None:
+        print(f"⚡ {source} retrieval cache hit")
+        return cached
+
+    in_flight = _UPSTREAM_IN_FLIGHT.get(key)
+    if in_flight is not None:
+        _UPSTREAM_COALESCE_STATS["coalesced"] += 1
+        print(f"🔗 {source} call already in flight - sharing it")
+        # Shielded so one caller hitting its deadline doesn't cancel the fetch for the others
+        return await asyncio.shield(in_flight)
+
+    async def fetch():
+        if method == "GET":
+            request_coro = _http_get_json_async(url, payload, timeout=timeout)
+        else:
+            request_coro = _http_post_json_async(url, payload, timeout=timeout, idempotent=idempotent)
+        try:
+            response = await UPSTREAM_BULKHEADS[source].run_async(request_coro)
+        except BulkheadFullError:
+            record_upstream_outcome(source, "rejected")
+            raise
+        except UPSTREAM_TIMEOUT_ERRORS as e:
+            record_upstream_outcome(source, "timeout")
+            print(f"⏱️ {source} timed out: {e!r}")
+            return None
+        record_upstream_outcome(source, "success" if response else "failure")
+        if response:
+            # Not awaited - callers get the response without waiting on the write
+            loop.run_in_executor(_SHARED_STORE_EXECUTOR, _retrieval_cache_write, source, key, json.dumps(response))
+        return response
+
+    task = asyncio.ensure_future(fetch())
+    _UPSTREAM_IN_FLIGHT[key] = task
+    _UPSTREAM_COALESCE_STATS["fetches"] += 1
+    task.add_done_callback(lambda _: _UPSTREAM_IN_FLIGHT.pop(key, None))
+    return await asyncio.shield(task)
+
 def generate_session_id(question: str) -> str:
     """Generate a session ID based on question content and timestamp"""
     timestamp = str(int(time.time()))
     question_hash = hashlib.md5(question.encode()).hexdigest()[:8]
     return f"session_{timestamp}_{question_hash}"
 
-def load_gpt_context_files() -> dict:
-    """
-    Load GPT context files from GitHub repository
-    Always called first to understand user queries and provide context
-    """
-    global GPT_CONTEXT
-    current_time = time.time()
-    
-    # Check if cache is still valid (6 hours TTL)
-    if GPT_CONTEXT.get('last_loaded', 0) + GPT_CONTEXT.get('ttl_seconds', 21600) > current_time:
-        print("✅ Using cached GPT context files")
-        return GPT_CONTEXT
-    
-    print("📥 Loading GPT context files from GitHub...")
-    try:
-        # Load all GPT context files
-        files_to_load = {
-            'acronyms': 'acronyms.json',
-            'products': 'products.json',
-            'stream_leads': 'stream_leads.json',
-            'official_sources': 'official_sources.json',
-            'workflow_instructions': 'workflow_instructions.json',
-            'jira_field_definitions': 'jira_field_definitions.json'
-        }
-        
-        loaded_files = {}
-        for key, filename in files_to_load.items():
-            try:
-                url = f"https://raw.githubusercontent.com/pulsepointinc/product/main/GPT/{filename}"
-                response = requests.get(url, timeout=10)
-                if response.status_code == 200:
-                    loaded_files[key] = response.json()
-                    print(f"✅ Loaded {filename}")
-                else:
-                    print(f"⚠️ Failed to load {filename}: HTTP {response.status_code}")
-                    loaded_files[key] = {}
-            except Exception as e:
-                print(f"⚠️ Error loading {filename}: {e}")
-                loaded_files[key] = {}
-        
-        # Update cache
-        GPT_CONTEXT.update({
-            'last_loaded': current_time,
-            'files': loaded_files
-        })
-        
-        print(f"✅ GPT context files loaded: {len([f for f in loaded_files.values() if f])} files")
-        return GPT_CONTEXT
-        
-    except Exception as e:
-        print(f"❌ Error loading GPT context files: {e}")
-        return GPT_CONTEXT
+async def _list_gpt_context_files_async() -> list:
+    """List GPT/*.json in the repo, falling back to the known context files"""
+    headers = {"Accept": "application/vnd.github.v3+json"}
+    if GPT_CONTEXT['etags'].get('__listing__'):
+        headers["If-None-Match"] = GPT_CONTEXT['etags']['__listing__']
+    try:
+        response = await _http_request_async("GET", GPT_REPO_API, headers=headers, timeout=10)
+        if response.status_code == 304 and GPT_CONTEXT['files']:
+            return [f"{key}.json" for key in GPT_CONTEXT['files'].keys()]
+        if response.status_code == 200:
+            GPT_CONTEXT['etags']['__listing__'] = response.headers.get('ETag')
+            filenames = [
+                entry['name'] for entry in response.json()
+                if entry.get('type') == 'file' and entry['name'].endswith('.json') and entry['name'] not in GPT_CONTEXT_SKIP_FILES
+            ]
+            if filenames:
+                return filenames
+        print(f"⚠️ GPT directory listing returned HTTP {response.status_code} - using default file list")
+    except Exception as e:
+        print(f"⚠️ GPT directory listing failed: {e} - using default file list")
+    return list(GPT_CONTEXT_DEFAULT_FILES)
+
+async def _fetch_gpt_context_file_async(filename: str) -> tuple:
+    """Fetch one context file, revalidating with If-None-Match. Returns (filename, data or None if unchanged/failed, etag)"""
+    headers = {}
+    etag = GPT_CONTEXT['etags'].get(filename)
+    if etag and filename[:-len('.json')] in GPT_CONTEXT['files']:
+        headers["If-None-Match"] = etag
+    try:
+        response = await _http_request_async("GET", f"{GPT_RAW_BASE}/{filename}", headers=headers, timeout=10)
+        if response.status_code == 304:
+            return (filename, None, etag)
+        if response.status_code == 200:
+            print(f"✅ Loaded {filename}")
+            return (filename, response.json(), response.headers.get('ETag'))
+        print(f"⚠️ Failed to load {filename}: HTTP {response.status_code}")
+    except Exception as e:
+        print(f"⚠️ Error loading {filename}: {e}")
+    return (filename, None, None)
+
+async def _refresh_gpt_context_async():
+    """Load every GPT/*.json file in parallel and swap the new set into GPT_CONTEXT"""
+    filenames = await _list_gpt_context_files_async()
+    results = await asyncio.gather(*[_fetch_gpt_context_file_async(filename) for filename in filenames])
+
+    files = dict(GPT_CONTEXT['files'])
+    etags = dict(GPT_CONTEXT['etags'])
+    changed = []
+    for filename, data, etag in results:
+        key = filename[:-len('.json')]
+        if data is not None:
+            files[key] = data
+            etags[filename] = etag
+            changed.append(filename)
+        elif key not in files:
+            files[key] = {}  # Never loaded - keep the key so callers can rely on it
+        # Unchanged (304) or transient failure: keep serving the copy we have
+
+    # Acronym/product/stream lookups are rebuilt only when one of their files changed
+    term_index = GPT_CONTEXT.get('term_index')
+    if term_index is None or set(changed) & {'acronyms.json', 'products.json', 'stream_leads.json'}:
+        term_index = build_term_index(files)
+
+    # Swap in whole dicts so concurrent readers never see a half-refreshed context
+    GPT_CONTEXT.update({
+        'last_loaded': time.time(),
+        'files': files,
+        'etags': etags,
+        'term_index': term_index
+    })
+    print(f"✅ GPT context files loaded: {len([f for f in files.values() if f])} files ({len(changed)} changed)")
+
+    # The Document360 snapshot is too big for the per-request context - revalidate its search index alongside
+    _refresh_document360_index_in_background()
+
+def _refresh_gpt_context_in_background():
+    """Revalidate the context off the request path; only one refresh runs at a time"""
+    with _GPT_CONTEXT_LOCK:
+        if GPT_CONTEXT['refreshing']:
+            return
+        GPT_CONTEXT['refreshing'] = True
+
+    async def _refresh():
+        try:
+            await _refresh_gpt_context_async()
+        except Exception as e:
+            print(f"❌ Background GPT context refresh failed: {e}")
+        finally:
+            GPT_CONTEXT['refreshing'] = False
+
+    print("🔄 GPT context TTL expired - refreshing in background")
+    asyncio.run_coroutine_threadsafe(_refresh(), _get_async_loop())
+
+def load_gpt_context_files() -> dict:
+    """
+    Load GPT context files from GitHub repository
+    Always called first to understand user queries and provide context
+    Only the very first call blocks; afterwards the in-memory copy is served and
+    refreshed in the background once the TTL expires
+    """
+    if not GPT_CONTEXT.get('last_loaded'):
+        if _on_async_loop_thread():
+            # The cold load runs on this loop - waiting for it here (and under the lock) would hang the worker
+            print("⚠️ GPT context not loaded yet - load_gpt_context_files called from the event loop, serving it empty")
+            return GPT_CONTEXT
+        with _GPT_CONTEXT_LOCK:
+            # Another request may have finished the cold load while we waited
+            if not GPT_CONTEXT.get('last_loaded'):
+                print("📥 Loading GPT context files from GitHub...")
+                try:
+                    _run_async(_refresh_gpt_context_async(), timeout=30)
+                except Exception as e:
+                    print(f"❌ Error loading GPT context files: {e}")
+        return GPT_CONTEXT
+
+    if GPT_CONTEXT.get('last_loaded', 0) + GPT_CONTEXT.get('ttl_seconds', 21600) <= time.time():
+        _refresh_gpt_context_in_background()
+    else:
+        print("✅ Using cached GPT context files")
+    return GPT_CONTEXT
+
+# === QUERY MATCHER ===
+# Every keyword list used to classify a question, matched on whole words in a single
+# pass over the question (so "ao" no longer matches inside "board" and "get" no longer
+# matches inside "target"). A keyword also matches the plural of its last word, and the
+# forms in QUERY_PHRASE_VARIANTS - the ones the old substring checks caught for free.
+QUERY_KEYWORD_GROUPS = {
+    # Intent detection
+    'workflow': ['workflow', 'work flow', 'process', 'how does', 'how do', 'explain', 'describe', 'what is'],
+    'workflow_explicit': ['workflow', 'work flow', 'how does', 'how do'],
+    'diagram': ['diagram', 'flowchart', 'mermaid', 'dataflow', 'data flow', 'architecture', 'flow'],
+    'the_process': ['the process'],
+    'jira': ['ticket', 'issue', 'story', 'stories', 'epic', 'bug', 'task'],
+    'aggregation': ['count', 'sum', 'total', 'how many', 'aggregate'],
+    'listing': ['list', 'show', 'find', 'get', 'all'],
+    'comparison': ['difference', 'compare', 'vs', 'versus'],
+    'current': ['current', 'this', 'sprint'],
+    'technical': ['technical', 'architecture', 'code', 'github', 'repository', 'repositories'],
+    'story_query': ['points', 'story points', 'stories', 'count of tickets'],
+    # Teams
+    'team_front_end': ['front end portal development', 'front end', 'frontend'],
+    'team_backend': ['backend', 'back end'],
+    'team_data_analysis': ['data analysis', 'data analytics'],
+    # Sprint / release / year periods
+    'current_sprint': ['current sprint', 'this sprint'],
+    'last_sprint': ['last sprint', 'previous sprint'],
+    'next_sprint': ['next sprint'],
+    'next_3_sprints': ['next 3 sprints', 'next three sprints'],
+    'next_2_sprints': ['next 2 sprints', 'next two sprints'],
+    'current_release': ['current release', 'this release'],
+    'last_release': ['last release', 'previous release'],
+    'next_release': ['next release'],
+    'last_3_releases': ['last 3 releases', 'last three releases'],
+    'next_3_releases': ['next 3 releases', 'next three releases'],
+    'releases': ['releases'],
+    'ytd': ['ytd', 'year to date'],
+    'rest_of_year': ['rest of the year', 'rest of this year', 'remainder of the year', 'remainder of this year'],
+    'this_year': ['this year'],
+    # JIRA / Confluence search hints
+    'omnichannel': ['omnichannel'],
+    'audience': ['audience'],
+    # Each AO check keeps the trigger words it had as a substring check
+    'jira_ao': ['ao', 'adaptive optimization', 'adaptive'],
+    'confluence_ao': ['ao'],
+    'confluence_ao_context': ['ao', 'adaptive optimization'],
+    'factor': ['factor'],
+    'roadmap': ['roadmap', 'epic', 'timeline', 'planned'],
+    'jira_fields': ['count', 'sum', 'total', 'breakdown', 'aggregate', 'points', 'story points'],
+    'broad_jira': ['roadmap', 'latest', 'omnichannel', 'stream', 'planned', 'rest of', 'remainder'],
+    'dataflow': ['workflow', 'dataflow'],
+    'sprint': ['sprint', 'planned this'],
+    'engineering': ['tech debt', 'technical debt', 'engineering', 'bug']
+}
+QUERY_PHRASE_VARIANTS = {
+    'process': ['processing', 'processed'],
+    'current': ['currently'],
+    'explain': ['explained', 'explaining'],
+    'describe': ['described', 'describing'],
+    'compare': ['compared'],
+    'flow': ['flowing'],
+    'count': ['counted', 'counting'],
+    'total': ['totaled', 'totaling'],
+    'aggregate': ['aggregated'],
+    'list': ['listed', 'listing'],
+    'show': ['showing', 'shown'],
+    'find': ['finding']
+}
+
+_MATCH_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Common words that say nothing about what the question is about
+QUERY_STOP_WORDS = {
+    'what', 'is', 'the', 'of', 'in', 'to', 'for', 'with', 'on', 'at', 'by', 'from',
+    'and', 'or', 'but', 'can', 'you', 'tell', 'me', 'about', 'details', 'information',
+    'how', 'does', 'work', 'show', 'list', 'find', 'get', 'all', 'any', 'some',
+    'please', 'provide', 'detailed', 'including'
+}
+
+def _match_tokens(text: str) -> list:
+    return _MATCH_TOKEN_RE.findall(text.lower())
+
+def _clean_mapping_name(name: str) -> str:
+    """products.json keys carry JSON-list debris like '["API"' - strip it"""
+    return name.strip().strip('[]"').strip()
+
+class QueryMatcher:
+    """
+    Token trie over every keyword, product, stream and acronym. match() walks the
+    question once and returns intent groups and entities, in order of appearance.
+    """
+
+    def __init__(self):
+        self._trie = {}
+        self.phrase_count = 0
+
+    def add(self, phrase: str, label: tuple):
+        tokens = _match_tokens(phrase)
+        if not tokens:
+            return
+        node = self._trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node.setdefault(None, []).append(label)  # None holds the labels ending at this node
+        self.phrase_count += 1
+
+    def match(self, text: str) -> dict:
+        tokens = _match_tokens(text)
+        result = {
+            'groups': set(),
+            'products': [],
+            'product_managers': [],
+            'streams': [],
+            'acronyms': []
+        }
+        for start in range(len(tokens)):
+            node = self._trie
+            for token in tokens[start:]:
+                node = node.get(token)
+                if node is None:
+                    break
+                for kind, value in node.get(None, ()):
+                    if kind == 'group':
+                        result['groups'].add(value)
+                    elif value not in result[kind]:
+                        result[kind].append(value)
+        return result
+
+# === TERM INDEX ===
+def _term_key(term: str) -> str:
+    """Case- and punctuation-normalised lookup key ("Analytics-Platform-and-Workspaces" -> "analytics platform and workspaces")"""
+    return ' '.join(_match_tokens(term))
+
+class TermIndex(dict):
+    """build_term_index's result: term key -> entry, plus what is compiled from it - the JIRA
+    filter rules, and the query matcher once _get_query_matcher first needs it"""
+
+    def __init__(self, entries: dict = None, jira_filter_rules: dict = None):
+        super().__init__(entries or {})
+        self.jira_filter_rules = jira_filter_rules or {}
+        self.matcher = None
+
+def _compile_jira_filter_rules(files: dict) -> dict:
+    """
+    The JIRA filter scans over products.json, stream_leads.json and acronyms.json, compiled
+    once: each name is matched as a whole word (so "ao" no longer fires inside "board") but
+    otherwise exactly as before - raw names in file order, first product and stream win,
+    every matching acronyms.json section adds its name and contents to search_terms
+    """
+    # Filed under each name's first token: a question can only mention names whose first token it contains
+    by_first_token = {}
+    for kind in ('products', 'stream_leads', 'acronyms'):
+        for order, (name, value) in enumerate((files.get(kind) or {}).items()):
+            if not name:
+                continue
+            tokens = _match_tokens(name)
+            pattern = re.compile(r'(?<!\w)' + re.escape(name.lower()) + r'(?!\w)')
+            by_first_token.setdefault(tokens[0] if tokens else '', []).append((kind, order, pattern, name, value))
+    return by_first_token
+
+def _jira_rule_hits(rules: dict, question_lower: str) -> dict:
+    """kind -> [(name, value)] for every mapping name the question mentions, in file order"""
+    candidates = list(rules.get('', ()))
+    for token in set(_match_tokens(question_lower)):
+        candidates.extend(rules.get(token, ()))
+    hits = {'products': [], 'stream_leads': [], 'acronyms': []}
+    if candidates:
+        candidates.sort(key=lambda rule: rule[1])
+        for kind, _, pattern, name, value in candidates:
+            if pattern.search(question_lower):
+                hits[kind].append((name, value))
+    return hits
+
+def build_term_index(files: dict) -> dict:
+    """
+    Flat index over acronyms.json, products.json and stream_leads.json, built once per
+    GPT context refresh: term key -> {term, definition, section, product, product_manager,
+    stream, products, streams}. 'products'/'streams' link an acronym to the products and
+    streams named in its definition (AO -> Adaptive Optimization).
+    """
+    index = {}
+
+    def entry_for(key: str) -> dict:
+        return index.setdefault(key, {
+            'term': None,
+            'definition': None,
+            'section': None,
+            'product': None,
+            'product_manager': None,
+            'stream': None,
+            'products': [],
+            'streams': []
+        })
+
+    # Products and streams first, so acronym definitions can be linked to them
+    names = QueryMatcher()
+    for product_name, product_info in (files.get('products') or {}).items():
+        field = product_info.get('field', 'product') if isinstance(product_info, dict) else 'product'
+        clean_name = _clean_mapping_name(product_name)
+        key = _term_key(clean_name)
+        if not key:
+            continue
+        entry = entry_for(key)
+        entry['term'] = entry['term'] or clean_name
+        if field == 'product_manager':
+            entry['product_manager'] = clean_name
+        else:
+            entry['product'] = clean_name
+            names.add(clean_name, ('products', clean_name))
+    for stream_name in (files.get('stream_leads') or {}):
+        key = _term_key(stream_name)
+        if key:
+            entry = entry_for(key)
+            entry['term'] = entry['term'] or stream_name
+            entry['stream'] = stream_name
+            names.add(stream_name, ('streams', stream_name))
+
+    for section, terms in (files.get('acronyms') or {}).items():
+        if not isinstance(terms, dict):
+            continue
+        for term, definition in terms.items():
+            linked = names.match(f"{term} {definition}")
+            # "CPM (Cost-Per-Mille)" is asked about as "CPM"
+            for key in {_term_key(term), _term_key(term.split('(')[0])}:
+                if not key:
+                    continue
+                entry = entry_for(key)
+                if entry['definition'] is not None:
+                    continue  # First section wins (QAR is defined twice)
+                entry.update({
+                    'term': term,
+                    'definition': definition,
+                    'section': section,
+                    'products': linked['products'],
+                    'streams': linked['streams']
+                })
+    return TermIndex(index, _compile_jira_filter_rules(files))
+
+def get_term_index(gpt_context: dict = None) -> dict:
+    """Term index for a GPT context (default: the live store), built on first use if the refresh has not"""
+    if gpt_context is None:
+        gpt_context = load_gpt_context_files()
+    term_index = gpt_context.get('term_index')
+    if term_index is None:
+        files = gpt_context.get('files', {})
+        term_index = build_term_index(files)
+        # A refresh that landed meanwhile brought its own index - don't overwrite it with a stale one
+        if gpt_context.get('files') is files:
+            gpt_context.setdefault('term_index', term_index)
+    return term_index
+
+def lookup_term(term: str, term_index: dict = None) -> dict:
+    """Index entry for an acronym, product or stream name, or None"""
+    if term_index is None:
+        term_index = get_term_index()
+    return term_index.get(_term_key(term))
+
+def _plural(word: str) -> str:
+    if word.endswith('s') and not word.endswith('ss'):
+        return word  # Already plural ('stories'), or 'this' / 'vs'
+    if word.endswith(('ss', 'x', 'z', 'ch', 'sh')):
+        return word + 'es'
+    if len(word) > 2 and word.endswith('y') and word[-2] not in 'aeiou':
+        return word[:-1] + 'ies'
+    return word + 's'
+
+def _phrase_variants(phrase: str) -> set:
+    head, _, last = phrase.rpartition(' ')
+    variants = {phrase, f"{head} {_plural(last)}".strip()}
+    variants.update(QUERY_PHRASE_VARIANTS.get(phrase, []))
+    return variants
+
+def _build_query_matcher(term_index: dict) -> QueryMatcher:
+    matcher = QueryMatcher()
+    for group, phrases in QUERY_KEYWORD_GROUPS.items():
+        for phrase in phrases:
+            for variant in _phrase_variants(phrase):
+                matcher.add(variant, ('group', group))
+    for key, entry in term_index.items():
+        if entry['product']:
+            matcher.add(key, ('products', entry['product']))
+        if entry['product_manager']:
+            matcher.add(key, ('product_managers', entry['product_manager']))
+        if entry['stream']:
+            matcher.add(key, ('streams', entry['stream']))
+        if entry['definition'] is not None:
+            matcher.add(key, ('acronyms', entry['term']))
+    return matcher
+
+# Keyword groups only - for text that is not the question itself (conversation history)
+_KEYWORD_MATCHER = _build_query_matcher({})
+
+def _get_query_matcher(term_index: dict) -> QueryMatcher:
+    """Matcher for a term index, compiled once and kept on the index - a refresh that swaps
+    in a new index brings a new matcher with it"""
+    if not isinstance(term_index, TermIndex):
+        return _build_query_matcher(term_index)  # Not from build_term_index - nowhere to keep it
+    matcher = term_index.matcher
+    if matcher is None:
+        # Two threads may both compile on a cold index; either result is the same matcher
+        matcher = _build_query_matcher(term_index)
+        term_index.matcher = matcher
+        print(f"🧩 Compiled query matcher ({matcher.phrase_count} phrases)")
+    return matcher
+
+def _jira_filters_from_match(question: str, match: dict, term_index: dict) -> dict:
+    """JIRA filters from the product mapping files (see _compile_jira_filter_rules)"""
+    filters = {}
+    groups = match['groups']
+    hits = _jira_rule_hits(getattr(term_index, 'jira_filter_rules', {}), question.lower())
+
+    # Check products.json for product filter
+    if hits['products']:
+        filters['product'] = hits['products'][0][0]
+
+    # Check stream_leads.json for stream filter
+    if hits['stream_leads']:
+        filters['stream'] = hits['stream_leads'][0][0]
+
+    # Check acronyms.json for related keywords
+    for acronym, definition in hits['acronyms']:
+        # Add related keywords to search
+        if 'search_terms' not in filters:
+            filters['search_terms'] = []
+        filters['search_terms'].append(acronym)
+        filters['search_terms'].append(definition)
+
+    # Special handling for "Omnichannel" queries
+    if 'omnichannel' in groups:
+        # For Omnichannel queries, use summary search to get ALL Omnichannel work
+        # The stream filter doesn't work reliably, so we use summary instead
+        filters['summary'] = 'Omnichannel'
+        # Don't restrict by product - we want all products with Omnichannel in the summary
+        if 'audience' in groups:
+            filters['search_terms'] = ['omnichannel', 'audience', 'OA']
+
+    return filters
 
 def intelligent_query_analysis(question: str, gpt_context: dict = None) -> dict:
     """
@@ -364,33 +2061,23 @@ def intelligent_query_analysis(question: str, gpt_context: dict = None) -> dict:
     import re
     words = re.findall(r'\b\w+\b', question_lower)
     
-    # Remove common stop words
-    stop_words = {
-        'what', 'is', 'the', 'of', 'in', 'to', 'for', 'with', 'on', 'at', 'by', 'from', 
-        'and', 'or', 'but', 'can', 'you', 'tell', 'me', 'about', 'details', 'information',
-        'how', 'does', 'work', 'show', 'list', 'find', 'get', 'all', 'any', 'some',
-        'please', 'provide', 'detailed', 'including'
-    }
-    
     # Extract meaningful keywords (remove stop words and duplicates)
-    keywords = list(dict.fromkeys([word for word in words if word not in stop_words and len(word) > 1]))
+    keywords = list(dict.fromkeys([word for word in words if word not in QUERY_STOP_WORDS and len(word) > 1]))
     
     # Check GPT context for acronyms/products to expand keywords
-    acronyms = gpt_context.get('files', {}).get('acronyms', {})
-    products = gpt_context.get('files', {}).get('products', {})
-    
-    # Expand keywords with known acronyms/products
+    term_index = get_term_index(gpt_context)
+
+    # One pass over the question for intent keywords, periods, teams and entities
+    match = _get_query_matcher(term_index).match(question)
+    groups = match['groups']
+
+    # Expand keywords with known acronyms
     expanded_keywords = keywords.copy()
     for keyword in keywords:
-        # Check if keyword matches an acronym
-        for section, terms in acronyms.items():
-            if isinstance(terms, dict):
-                if keyword.upper() in terms:
-                    expanded_keywords.append(terms[keyword.upper()])
-        # Check if keyword matches a product
-        if keyword in products:
-            expanded_keywords.append(keyword)
-    
+        entry = term_index.get(keyword)
+        if entry and entry['definition'] is not None:
+            expanded_keywords.append(entry['definition'])
+
     # Limit to most relevant keywords
     keywords = expanded_keywords[:5]
     
@@ -398,24 +2085,22 @@ def intelligent_query_analysis(question: str, gpt_context: dict = None) -> dict:
     intent = "general"
     
     # Detect workflow/diagram/dataflow questions (e.g., "tell me the workflow of PRTS", "ad serving dataflow diagram", "mermaid diagram")
-    workflow_keywords = ['workflow', 'work flow', 'process', 'how does', 'how do', 'explain', 'describe', 'what is']
-    diagram_keywords = ['diagram', 'flowchart', 'mermaid', 'dataflow', 'data flow', 'architecture', 'flow']
     # Check if question contains workflow or diagram keywords
-    if any(keyword in question_lower for keyword in workflow_keywords + diagram_keywords):
+    if 'workflow' in groups or 'diagram' in groups:
         # Also check if it mentions "the process" or contains an acronym (likely a process name) or asks for a diagram
-        if 'the process' in question_lower or any(word.isupper() and len(word) >= 2 for word in question.split()) or any(keyword in question_lower for keyword in diagram_keywords):
+        if 'the_process' in groups or any(word.isupper() and len(word) >= 2 for word in question.split()) or 'diagram' in groups:
             intent = "workflow"
-        elif any(keyword in question_lower for keyword in ['workflow', 'work flow', 'how does', 'how do']):
+        elif 'workflow_explicit' in groups:
             intent = "workflow"
-    elif any(word in question_lower for word in ['ticket', 'tickets', 'issue', 'issues', 'story', 'stories', 'epic', 'epics', 'bug', 'bugs', 'task', 'tasks']):
+    elif 'jira' in groups:
         intent = "jira_only"
-    elif any(word in question_lower for word in ['count', 'sum', 'total', 'how many', 'aggregate']):
+    elif 'aggregation' in groups:
         intent = "aggregation"
-    elif any(word in question_lower for word in ['list', 'show', 'find', 'get', 'all']):
+    elif 'listing' in groups:
         intent = "listing"
-    elif any(word in question_lower for word in ['difference', 'compare', 'vs', 'versus']):
+    elif 'comparison' in groups:
         intent = "comparison"
-    elif any(word in question_lower for word in ['current', 'this', 'sprint']):
+    elif 'current' in groups:
         intent = "current_sprint"
     
     # Extract date information for JIRA queries - DYNAMIC based on current date
@@ -429,13 +2114,13 @@ def intelligent_query_analysis(question: str, gpt_context: dict = None) -> dict:
     
     # Detect if query is about specific team
     team_detected = None
-    if 'front end portal development' in question_lower or 'front end' in question_lower or 'frontend' in question_lower:
+    if 'team_front_end' in groups:
         team_detected = 'Front End Portal Development'
         jira_params['team'] = 'Front End Portal Development'
-    elif 'backend' in question_lower or 'back end' in question_lower:
+    elif 'team_backend' in groups:
         team_detected = 'Backend'
         jira_params['team'] = 'Backend'
-    elif 'data analysis' in question_lower or 'data analytics' in question_lower:
+    elif 'team_data_analysis' in groups:
         team_detected = 'Data Analysis'
         jira_params['team'] = 'Data Analysis'
     
@@ -443,23 +2128,23 @@ def intelligent_query_analysis(question: str, gpt_context: dict = None) -> dict:
     # Determine if we should query Stories or Epics based on the question
     # If asking about points, stories, or specific teams → use Stories
     # If asking about epics, roadmap, planned work → use Epics
-    query_for_stories = any(word in question_lower for word in ['points', 'story points', 'stories', 'count of tickets']) or team_detected is not None
+    query_for_stories = 'story_query' in groups or team_detected is not None
     
-    if 'current sprint' in question_lower or 'this sprint' in question_lower:
+    if 'current_sprint' in groups:
         jira_params['sprint_date'] = current_month_year
         if not query_for_stories:
             jira_params['issue_type_name'] = 'Epic'
-    elif 'last sprint' in question_lower or 'previous sprint' in question_lower:
+    elif 'last_sprint' in groups:
         last_month = current_date - relativedelta(months=1)
         jira_params['sprint_date'] = last_month.strftime('%B %Y')
         if not query_for_stories:
             jira_params['issue_type_name'] = 'Epic'
-    elif 'next sprint' in question_lower:
+    elif 'next_sprint' in groups:
         next_month = current_date + relativedelta(months=1)
         jira_params['sprint_date'] = next_month.strftime('%B %Y')
         if not query_for_stories:
             jira_params['issue_type_name'] = 'Epic'
-    elif 'next 3 sprints' in question_lower or 'next three sprints' in question_lower:
+    elif 'next_3_sprints' in groups:
         sprints = []
         for i in range(1, 4):  # Next 3 months
             future_month = current_date + relativedelta(months=i)
@@ -467,7 +2152,7 @@ def intelligent_query_analysis(question: str, gpt_context: dict = None) -> dict:
         jira_params['sprint_date'] = ', '.join(sprints)
         if not query_for_stories:
             jira_params['issue_type_name'] = 'Epic'
-    elif 'next 2 sprints' in question_lower or 'next two sprints' in question_lower:
+    elif 'next_2_sprints' in groups:
         sprints = []
         for i in range(1, 3):  # Next 2 months
             future_month = current_date + relativedelta(months=i)
@@ -477,37 +2162,37 @@ def intelligent_query_analysis(question: str, gpt_context: dict = None) -> dict:
             jira_params['issue_type_name'] = 'Epic'
     
     # Release-based queries
-    elif 'current release' in question_lower or 'this release' in question_lower:
+    elif 'current_release' in groups:
         jira_params['release_date'] = current_month_year
         jira_params['issue_type_name'] = 'Epic'
-    elif 'last release' in question_lower or 'previous release' in question_lower:
+    elif 'last_release' in groups:
         last_month = current_date - relativedelta(months=1)
         jira_params['release_date'] = last_month.strftime('%B %Y')
         jira_params['issue_type_name'] = 'Epic'
-    elif 'next release' in question_lower:
+    elif 'next_release' in groups:
         next_month = current_date + relativedelta(months=1)
         jira_params['release_date'] = next_month.strftime('%B %Y')
         jira_params['issue_type_name'] = 'Epic'
-    elif 'last 3 releases' in question_lower or 'last three releases' in question_lower:
+    elif 'last_3_releases' in groups:
         releases = []
         for i in range(2, -1, -1):  # Last 3 months (including current)
             past_month = current_date - relativedelta(months=i)
             releases.append(past_month.strftime('%B %Y'))
         jira_params['release_date'] = ', '.join(releases)
         jira_params['issue_type_name'] = 'Epic'
-    elif 'next 3 releases' in question_lower or 'next three releases' in question_lower:
+    elif 'next_3_releases' in groups:
         releases = []
         for i in range(1, 4):  # Next 3 months
             future_month = current_date + relativedelta(months=i)
             releases.append(future_month.strftime('%B %Y'))
         jira_params['release_date'] = ', '.join(releases)
         jira_params['issue_type_name'] = 'Epic'
-    elif 'releases' in question_lower and ('ytd' in question_lower or 'year to date' in question_lower):
+    elif 'releases' in groups and 'ytd' in groups:
         jira_params['release_date'] = f'%{current_year}%'
         jira_params['issue_type_name'] = 'Epic'
     
     # Year-based queries
-    elif 'rest of the year' in question_lower or 'rest of this year' in question_lower or 'remainder of the year' in question_lower or 'remainder of this year' in question_lower:
+    elif 'rest_of_year' in groups:
         # Rest of year = current month + remaining months until December
         sprints = []
         months_remaining = 12 - current_date.month + 1  # Include current month
@@ -516,7 +2201,7 @@ def intelligent_query_analysis(question: str, gpt_context: dict = None) -> dict:
             sprints.append(future_month.strftime('%B %Y'))
         jira_params['sprint_date'] = ', '.join(sprints)
         jira_params['issue_type_name'] = 'Epic'
-    elif 'this year' in question_lower or 'ytd' in question_lower or 'year to date' in question_lower:
+    elif 'this_year' in groups or 'ytd' in groups:
         # Full year
         jira_params['sprint_date'] = f'%{current_year}%'
         jira_params['issue_type_name'] = 'Epic'
@@ -525,62 +2210,41 @@ def intelligent_query_analysis(question: str, gpt_context: dict = None) -> dict:
         'intent': intent,
         'keywords': keywords,
         'jira_params': jira_params,
-        'is_technical': any(word in question_lower for word in ['technical', 'architecture', 'code', 'github', 'repository'])
+        'entities': {
+            'products': match['products'],
+            'product_managers': match['product_managers'],
+            'streams': match['streams'],
+            'acronyms': match['acronyms']
+        },
+        'jira_filters': _jira_filters_from_match(question, match, term_index),
+        'is_technical': 'technical' in groups
     }
 
 def get_intelligent_jira_filters(question: str, product_mappings: dict) -> dict:
     """
     Get intelligent JIRA filters based on GitHub product mappings
     """
-    filters = {}
-    question_lower = question.lower()
-    
-    # Check products.json for product filter
-    products = product_mappings.get('products', {})
-    for product_name, product_info in products.items():
-        if product_name.lower() in question_lower:
-            filters['product'] = product_name
-            break
-    
-    # Check stream_leads.json for stream filter
-    stream_leads = product_mappings.get('stream_leads', {})
-    for stream_name, stream_info in stream_leads.items():
-        if stream_name.lower() in question_lower:
-            filters['stream'] = stream_name
-            break
-    
-    # Check acronyms.json for related keywords
-    acronyms = product_mappings.get('acronyms', {})
-    for acronym, definition in acronyms.items():
-        if acronym.lower() in question_lower:
-            # Add related keywords to search
-            if 'search_terms' not in filters:
-                filters['search_terms'] = []
-            filters['search_terms'].append(acronym)
-            filters['search_terms'].append(definition)
-    
-    # Special handling for "Omnichannel" queries
-    if 'omnichannel' in question_lower:
-        # For Omnichannel queries, use summary search to get ALL Omnichannel work
-        # The stream filter doesn't work reliably, so we use summary instead
-        filters['summary'] = 'Omnichannel'
-        # Don't restrict by product - we want all products with Omnichannel in the summary
-        if 'audience' in question_lower:
-            filters['search_terms'] = ['omnichannel', 'audience', 'OA']
-    
-    return filters
+    term_index = product_mappings.get('term_index')
+    if term_index is None:
+        # Kept on the mappings so repeated calls with them don't rebuild the index and matcher
+        term_index = build_term_index(product_mappings)
+        product_mappings['term_index'] = term_index
+    match = _get_query_matcher(term_index).match(question)
+    return _jira_filters_from_match(question, match, term_index)
 
-def call_jira_v4_api(question: str, max_results: int = 100, query_analysis: dict = None, product_mappings: dict = None) -> dict:  # Increased default from 50 to 100
+async def call_jira_v4_api_async(question: str, max_results: int = 100, query_analysis: dict = None, product_mappings: dict = None, deadline_at: float = None) -> dict:  # Increased default from 50 to 100
     """
     Call JIRA v4 API with intelligent parameter extraction
     Bryan's requirement: Use actual search parameters, not hardcoded responses
     """
     try:
+        groups = _KEYWORD_MATCHER.match(question)['groups']
+
         # For roadmap/stream queries, increase max_results to capture all relevant tickets
         # Increased limits for richer responses
-        if any(word in question.lower() for word in ['roadmap', 'latest', 'omnichannel', 'stream', 'planned', 'rest of', 'remainder']):
+        if 'broad_jira' in groups:
             max_results = max(max_results, 300)  # Increased from 200 to 300 for more comprehensive results
-        elif 'workflow' in question.lower() or 'dataflow' in question.lower():
+        elif 'dataflow' in groups:
             max_results = max(max_results, 100)  # Increased for workflow queries
         
         # Build intelligent parameters based on query analysis
@@ -591,12 +2255,16 @@ def call_jira_v4_api(question: str, max_results: int = 100, query_analysis: dict
         # Default to Product-driven work unless user explicitly asks for engineering/tech debt
         # Tech debt, engineering work, and bugs are handled by Engineering team
         # For sprint queries, be more inclusive to show all planned work
-        is_sprint_query = any(word in question.lower() for word in ['sprint', 'planned this', 'current sprint', 'this sprint'])
-        if not any(word in question.lower() for word in ['tech debt', 'technical debt', 'engineering', 'bug', 'bugs']) and not is_sprint_query:
+        is_sprint_query = 'sprint' in groups
+        if 'engineering' not in groups and not is_sprint_query:
             params['team_driving_work'] = 'Product'
+
         
         # Apply intelligent filters from GitHub product mappings
-        if product_mappings:
+        if query_analysis and 'jira_filters' in query_analysis:
+            # Already computed in the same pass as intent detection
+            params.update(query_analysis['jira_filters'])
+        elif product_mappings:
             intelligent_filters = get_intelligent_jira_filters(question, product_mappings)
             params.update(intelligent_filters)
         
@@ -611,23 +2279,23 @@ def call_jira_v4_api(question: str, max_results: int = 100, query_analysis: dict
             params['search_terms'] = search_terms
             
             # For AO queries, also search in summary field
-            if any(word in question.lower() for word in ['ao', 'adaptive optimization', 'adaptive']):
+            if 'jira_ao' in groups:
                 params['summary'] = 'AO'
         
         # For roadmap queries, search for epics
-        if any(word in question.lower() for word in ['roadmap', 'epic', 'timeline', 'planned']):
+        if 'roadmap' in groups:
             params['issue_type_name'] = 'Epic'
             # Don't override sprint_date if it was already set by intelligent_query_analysis
             if 'sprint_date' not in params:
                 params['sprint_date'] = '%2024%,%2025%'  # Default: Past 12 months
             # team_driving_work is already set to 'Product' by default above
             # For AO roadmaps, add specific product filter
-            if any(word in question.lower() for word in ['ao', 'adaptive optimization', 'adaptive']):
+            if 'jira_ao' in groups:
                 params['product'] = 'Adaptive Optimization'
                 params['stream'] = 'Optimization'
         
         # For aggregation queries and story point queries, explicitly request fields needed
-        if any(word in question.lower() for word in ['count', 'sum', 'total', 'breakdown', 'aggregate', 'points', 'story points']):
+        if 'jira_fields' in groups:
             params['select'] = 'issue_key,summary,story_points,product,stream,product_manager,team,current_assignee_name,issue_type_name,sprint_date,release_date'
         
         # If querying for stories (not epics), ensure we set issue_type_name correctly
@@ -639,7 +2307,9 @@ def call_jira_v4_api(question: str, max_results: int = 100, query_analysis: dict
         print(f"🔍 JIRA v4 API call with params: {params}")
         jira_start_time = time.time()
         
-        response = _http_post_json(JIRA_V4_API, params)
+        response = await _cached_upstream_json_async(
+            'jira_v4', "POST", JIRA_V4_API, params, timeout=_upstream_timeout(deadline_at, 40)
+        )  # Read-only search - safe to retry and cache
         jira_duration = time.time() - jira_start_time
         
         if response:
@@ -675,7 +2345,11 @@ def call_jira_v4_api(question: str, max_results: int = 100, query_analysis: dict
             'duration_seconds': jira_duration
         }
 
-def call_confluence_api(question: str, query_analysis: dict = None, conversation_history: list = None) -> dict:
+def call_jira_v4_api(question: str, max_results: int = 100, query_analysis: dict = None, product_mappings: dict = None, deadline_at: float = None) -> dict:
+    """Synchronous wrapper around call_jira_v4_api_async for callers outside the event loop"""
+    return _run_async(call_jira_v4_api_async(question, max_results, query_analysis, product_mappings, deadline_at))
+
+async def call_confluence_api_async(question: str, query_analysis: dict = None, conversation_history: list = None, deadline_at: float = None) -> dict:
     """
     Call Confluence API with intelligent search
     Bryan's requirement: Use actual search, not hardcoded responses
@@ -684,17 +2358,17 @@ def call_confluence_api(question: str, query_analysis: dict = None, conversation
     try:
         # Extract search terms from query analysis - use full query for better matching
         search_terms = question
-        question_lower = question.lower()
+        groups = _KEYWORD_MATCHER.match(question)['groups']
         
         # Check conversation history for context
         has_ao_context = False
         has_omnichannel_context = False
         if conversation_history:
             for msg in conversation_history[-3:]:  # Check last 3 messages
-                content = msg.get('content', '').lower()
-                if 'ao' in content or 'adaptive optimization' in content:
+                content_groups = _KEYWORD_MATCHER.match(msg.get('content', ''))['groups']
+                if 'confluence_ao_context' in content_groups:
                     has_ao_context = True
-                if 'omnichannel' in content or 'audience' in content:
+                if 'omnichannel' in content_groups or 'audience' in content_groups:
                     has_omnichannel_context = True
         
         # For workflow questions, extract the main subject (e.g., "PRTS" from "workflow of PRTS" or "what is PRTS the process")
@@ -730,14 +2404,14 @@ def call_confluence_api(question: str, query_analysis: dict = None, conversation
         elif query_analysis and query_analysis.get('keywords'):
             keywords = query_analysis['keywords']
             # For specific queries like "AO factors", use the full query
-            if 'ao' in question_lower and 'factor' in question_lower:
+            if 'confluence_ao' in groups and 'factor' in groups:
                 search_terms = 'AO factors'
-            elif 'ao' in question_lower:
+            elif 'confluence_ao' in groups:
                 search_terms = 'AO'
-            elif 'factor' in question_lower and has_ao_context:
+            elif 'factor' in groups and has_ao_context:
                 # If just "factors" but we have AO context, search for "AO factors"
                 search_terms = 'AO factors'
-            elif 'omnichannel' in question_lower or 'audience' in question_lower:
+            elif 'omnichannel' in groups or 'audience' in groups:
                 # For omnichannel queries, search for relevant terms
                 search_terms = 'omnichannel audience OA'
             elif has_omnichannel_context:
@@ -761,7 +2435,9 @@ def call_confluence_api(question: str, query_analysis: dict = None, conversation
         
         print(f"🔍 Confluence API call with payload: {payload}")
         
-        response = _http_post_json(f"{CONFLUENCE_API}/search", payload)
+        response = await _cached_upstream_json_async(
+            'confluence', "POST", f"{CONFLUENCE_API}/search", payload, timeout=_upstream_timeout(deadline_at, 30)
+        )  # Read-only search - safe to retry and cache
         
         if response:
             results = response.get('results', [])
@@ -796,38 +2472,27 @@ def call_confluence_api(question: str, query_analysis: dict = None, conversation
             'duration_seconds': duration
         }
 
-def get_product_mappings_from_github() -> dict:
+def call_confluence_api(question: str, query_analysis: dict = None, conversation_history: list = None, deadline_at: float = None) -> dict:
+    """Synchronous wrapper around call_confluence_api_async for callers outside the event loop"""
+    return _run_async(call_confluence_api_async(question, query_analysis, conversation_history, deadline_at))
+
+def get_product_mappings_from_github(gpt_context: dict = None) -> dict:
     """
     Get product mappings from GitHub files for intelligent JIRA filtering
+    Served from the in-memory GPT context store - no network on the request path
     """
-    try:
-        # Get products.json
-        products_response = requests.get("https://raw.githubusercontent.com/pulsepointinc/product/main/GPT/products.json", timeout=10)
-        products_data = products_response.json() if products_response.status_code == 200 else {}
-        
-        # Get stream_leads.json
-        stream_response = requests.get("https://raw.githubusercontent.com/pulsepointinc/product/main/GPT/stream_leads.json", timeout=10)
-        stream_data = stream_response.json() if stream_response.status_code == 200 else {}
-        
-        # Get acronyms.json
-        acronyms_response = requests.get("https://raw.githubusercontent.com/pulsepointinc/product/main/GPT/acronyms.json", timeout=10)
-        acronyms_data = acronyms_response.json() if acronyms_response.status_code == 200 else {}
-        
-        # Get jira_field_definitions.json
-        jira_fields_response = requests.get("https://raw.githubusercontent.com/pulsepointinc/product/main/GPT/jira_field_definitions.json", timeout=10)
-        jira_fields_data = jira_fields_response.json() if jira_fields_response.status_code == 200 else {}
-        
-        return {
-            'products': products_data,
-            'stream_leads': stream_data,
-            'acronyms': acronyms_data,
-            'jira_fields': jira_fields_data
-        }
-    except Exception as e:
-        print(f"❌ Error fetching GitHub product mappings: {e}")
-        return {}
+    if gpt_context is None:
+        gpt_context = load_gpt_context_files()
+    files = gpt_context.get('files', {})
+    return {
+        'products': files.get('products', {}),
+        'stream_leads': files.get('stream_leads', {}),
+        'acronyms': files.get('acronyms', {}),
+        'jira_fields': files.get('jira_field_definitions', {}),
+        'term_index': get_term_index(gpt_context)
+    }
 
-def call_github_api(question: str, query_analysis: dict = None) -> dict:
+async def call_github_api_async(question: str, query_analysis: dict = None, deadline_at: float = None) -> dict:
     """
     Call GitHub API with intelligent search
     Bryan's requirement: Use actual search, not hardcoded responses
@@ -852,7 +2517,9 @@ def call_github_api(question: str, query_analysis: dict = None) -> dict:
         
         print(f"🔍 GitHub API call with payload: {payload}")
         
-        response = _http_post_json(GIT_API, payload)
+        response = await _cached_upstream_json_async(
+            'git_api', "POST", GIT_API, payload, timeout=_upstream_timeout(deadline_at, 30)
+        )  # Read-only search - safe to retry and cache
         
         if response:
             repositories = response.get('repositories', [])
@@ -881,7 +2548,398 @@ def call_github_api(question: str, query_analysis: dict = None) -> dict:
             'search_terms': question
         }
 
-def call_document360_api(question: str, query_analysis: dict = None) -> dict:
+def call_github_api(question: str, query_analysis: dict = None, deadline_at: float = None) -> dict:
+    """Synchronous wrapper around call_github_api_async for callers outside the event loop"""
+    return _run_async(call_github_api_async(question, query_analysis, deadline_at))
+
+# === LOCAL DOCUMENT360 INDEX ===
+# GPT/document360_knowledge_base.json is a snapshot of every Document360 article. It is
+# loaded into an in-process BM25 inverted index (title, search keywords, category, content)
+# so Document360 questions are answered in milliseconds without a network round trip.
+# A prebuilt compact index file is used when deployed; otherwise the snapshot is read from
+# a local checkout or downloaded from GitHub. Either is revalidated whenever the GPT
+# context refreshes.
+DOCUMENT360_INDEX_CONFIG = {
+    'snapshot_file': 'document360_knowledge_base.json',
+    'compact_paths': [
+        os.getenv('DOCUMENT360_INDEX_PATH', ''),
+        "/app/document360_index.bin",
+        "./document360_index.bin"
+    ],
+    'local_paths': [
+        os.getenv('DOCUMENT360_SNAPSHOT_PATH', ''),
+        "/app/GPT/document360_knowledge_base.json",
+        "./GPT/document360_knowledge_base.json",
+        "../GPT/document360_knowledge_base.json"
+    ],
+    'field_weights': {'title': 3.0, 'keywords': 2.0, 'category': 2.0, 'content': 1.0},
+    'bm25_k1': 1.2,
+    'bm25_b': 0.75,
+    'min_coverage': 0.5,          # Share of the query's idf weight a hit must match - below it is a miss, ask the remote API
+    'max_age_seconds': 86400,     # Not revalidated for this long - treat as stale, use the remote API
+    'file_check_seconds': 60      # How often a local snapshot file is checked for changes
+}
+# Question words left in the ranking terms that would otherwise count toward coverage as
+# terms the snapshot "misses" - only the local Document360 search drops them
+DOCUMENT360_COVERAGE_STOP_WORDS = {
+    'who', 'which', 'where', 'when', 'why', 'many', 'much', 'are', 'do', 'an', 'there', 'this', 'that'
+}
+DOCUMENT360_INDEX = {
+    "index": None,
+    "source": None,        # Where the index was loaded from: .bin path, snapshot path, or "github"
+    "snapshot": None,      # The JSON snapshot it was last checked against: local path, or "github"
+    "etag": None,
+    "mtime": None,         # Of the local snapshot file
+    "extracted_at": None,  # From the snapshot's metadata
+    "verified_at": 0.0,    # Last time the snapshot was confirmed current
+    "checked_at": 0.0,
+    "refreshing": False
+}
+_DOCUMENT360_INDEX_LOCK = threading.Lock()
+
+def build_document360_index(snapshot: dict) -> dict:
+    """BM25 inverted index over a Document360 snapshot: term -> [(doc, weighted tf)]"""
+    weights = DOCUMENT360_INDEX_CONFIG['field_weights']
+    keywords_by_id = {entry.get('id'): entry.get('keywords') or [] for entry in snapshot.get('search_index') or []}
+    docs = []
+    lengths = []
+    postings = {}
+    total_length = 0.0
+    for article in snapshot.get('articles') or []:
+        category = (article.get('category') or '').split('/', 1)[-1]  # 'En/Targeting' -> 'Targeting'
+        fields = {
+            'title': _match_tokens(article.get('title') or ''),
+            'keywords': _match_tokens(' '.join(keywords_by_id.get(article.get('id'), []))),
+            'category': _match_tokens(category),
+            'content': _match_tokens(article.get('content') or '')
+        }
+        term_freq = Counter()
+        length = 0.0
+        for field, tokens in fields.items():
+            for token in tokens:
+                term_freq[token] += weights[field]
+            length += weights[field] * len(tokens)
+        doc = len(docs)
+        docs.append({
+            "id": article.get('id'),
+            "title": article.get('title') or 'No title',
+            "url": article.get('url') or '#',
+            "category": article.get('category'),
+            "content": article.get('content') or '',
+            "modified_at": article.get('modified_at')
+        })
+        lengths.append(length)
+        total_length += length
+        for term, tf in term_freq.items():
+            postings.setdefault(term, []).append((doc, tf))
+    return {
+        "docs": docs,
+        "postings": postings,
+        "lengths": lengths,
+        "avg_length": (total_length / len(docs)) if docs else 1.0
+    }
+
+# Compact index file (build_document360_index.py): the index above, prebuilt, text only.
+# Layout: magic, uint32 header length, JSON header with section offsets, then 8-byte
+# aligned sections - docs (JSON metadata), lengths (float32), content_offsets (uint64),
+# content (zlib-compressed UTF-8 per article), terms (JSON term -> [first posting, count]),
+# postings ((uint16 doc, float16 tf) pairs). Workers mmap it: only the small JSON sections
+# are parsed at open; postings and article text are read when a query touches them.
+DOCUMENT360_INDEX_MAGIC = b"D360IDX\x01"
+_POSTING = struct.Struct("<He")
+
+def write_document360_index_file(snapshot: dict, path: str) -> dict:
+    """Build the index for a snapshot and write it as a compact file; returns the header"""
+    index = build_document360_index(snapshot)
+    docs = index['docs']
+    if len(docs) > 0xFFFF:
+        raise ValueError(f"{len(docs)} articles do not fit the uint16 postings format")
+    content = bytearray()
+    content_offsets = array('Q', [0])
+    for doc in docs:
+        content += zlib.compress(doc['content'].encode('utf-8'), 6)
+        content_offsets.append(len(content))
+    terms = {}
+    postings = bytearray()
+    for term in sorted(index['postings']):
+        term_postings = index['postings'][term]
+        terms[term] = [len(postings) // _POSTING.size, len(term_postings)]
+        for doc, tf in term_postings:
+            postings += _POSTING.pack(doc, tf)
+    sections = [
+        ("docs", json.dumps([[d['id'], d['title'], d['url'], d['category'], d['modified_at']] for d in docs], separators=(',', ':')).encode('utf-8')),
+        ("lengths", array('f', index['lengths']).tobytes()),
+        ("content_offsets", content_offsets.tobytes()),
+        ("content", bytes(content)),
+        ("terms", json.dumps(terms, separators=(',', ':')).encode('utf-8')),
+        ("postings", bytes(postings))
+    ]
+    header = {
+        "version": 1,
+        "extracted_at": (snapshot.get('metadata') or {}).get('extracted_at'),
+        "article_count": len(docs),
+        "term_count": len(terms),
+        "avg_length": index['avg_length'],
+        "sections": {}
+    }
+    # Offsets depend on the header's own size - size it with placeholder offsets first
+    header["sections"] = {name: [0, len(data)] for name, data in sections}
+    offset = len(DOCUMENT360_INDEX_MAGIC) + 4 + len(json.dumps(header).encode('utf-8')) + 64
+    for name, data in sections:
+        offset += -offset % 8
+        header["sections"][name] = [offset, len(data)]
+        offset += len(data)
+    header_bytes = json.dumps(header).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(DOCUMENT360_INDEX_MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        for name, data in sections:
+            f.write(b"\0" * (header["sections"][name][0] - f.tell()))
+            f.write(data)
+    return header
+
+class _CompactDocs:
+    """Article metadata from the docs section; text is decoded only for articles returned"""
+
+    def __init__(self, buffer, meta: list, content_offsets, content_start: int):
+        self._buffer = buffer
+        self._meta = meta
+        self._content_offsets = content_offsets
+        self._content_start = content_start
+
+    def __len__(self):
+        return len(self._meta)
+
+    def __getitem__(self, doc: int) -> dict:
+        article_id, title, url, category, modified_at = self._meta[doc]
+        start = self._content_start + self._content_offsets[doc]
+        end = self._content_start + self._content_offsets[doc + 1]
+        return {
+            "id": article_id,
+            "title": title,
+            "url": url,
+            "category": category,
+            "content": zlib.decompress(self._buffer[start:end]).decode('utf-8'),
+            "modified_at": modified_at
+        }
+
+class _CompactPostings:
+    """term -> [(doc, tf)], unpacked from the postings section on lookup"""
+
+    def __init__(self, buffer, terms: dict, postings_start: int):
+        self._buffer = buffer
+        self._terms = terms
+        self._postings_start = postings_start
+
+    def __len__(self):
+        return len(self._terms)
+
+    def get(self, term: str, default=None):
+        entry = self._terms.get(term)
+        if entry is None:
+            return default
+        start = self._postings_start + entry[0] * _POSTING.size
+        return list(_POSTING.iter_unpack(self._buffer[start:start + entry[1] * _POSTING.size]))
+
+def open_document360_index_file(path: str) -> dict:
+    """mmap a compact index file into the same shape build_document360_index returns"""
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if buffer[:len(DOCUMENT360_INDEX_MAGIC)] != DOCUMENT360_INDEX_MAGIC:
+        raise ValueError(f"{path} is not a Document360 index file")
+    header_start = len(DOCUMENT360_INDEX_MAGIC) + 4
+    (header_length,) = struct.unpack_from("<I", buffer, len(DOCUMENT360_INDEX_MAGIC))
+    header = json.loads(buffer[header_start:header_start + header_length])
+    sections = header["sections"]
+
+    def section(name):
+        offset, length = sections[name]
+        return memoryview(buffer)[offset:offset + length]
+
+    return {
+        "docs": _CompactDocs(buffer, json.loads(bytes(section("docs"))), section("content_offsets").cast('Q'), sections["content"][0]),
+        "postings": _CompactPostings(buffer, json.loads(bytes(section("terms"))), sections["postings"][0]),
+        "lengths": section("lengths").cast('f'),
+        "avg_length": header["avg_length"],
+        "extracted_at": header.get("extracted_at")
+    }
+
+def search_document360_index(query_terms, limit: int = 10) -> list:
+    """
+    Top articles in the local index for the query terms, best first
+    Returns None when the index is not loaded or stale (callers use the remote API)
+    """
+    index = get_document360_index()
+    if index is None:
+        return None
+    k1 = DOCUMENT360_INDEX_CONFIG['bm25_k1']
+    b = DOCUMENT360_INDEX_CONFIG['bm25_b']
+    docs = index['docs']
+    lengths = index['lengths']
+    scores = {}
+    # Raw BM25 scores are unbounded, so confidence is judged on coverage instead: the share
+    # of the query's idf weight a doc matches. Terms no article contains still count.
+    matched_idf = {}
+    total_idf = 0.0
+    for term in set(query_terms) - DOCUMENT360_COVERAGE_STOP_WORDS:
+        postings = index['postings'].get(term) or []
+        idf = math.log(1 + (len(docs) - len(postings) + 0.5) / (len(postings) + 0.5))
+        total_idf += idf
+        for doc, tf in postings:
+            length_norm = k1 * (1 - b + b * lengths[doc] / index['avg_length'])
+            scores[doc] = scores.get(doc, 0.0) + idf * tf * (k1 + 1) / (tf + length_norm)
+            matched_idf[doc] = matched_idf.get(doc, 0.0) + idf
+    min_matched = total_idf * DOCUMENT360_INDEX_CONFIG['min_coverage']
+    confident = ((doc, score) for doc, score in scores.items() if matched_idf[doc] >= min_matched)
+    best = heapq.nlargest(limit, confident, key=lambda item: item[1])
+    return [
+        dict(docs[doc], score=round(score, 3), coverage=round(matched_idf[doc] / total_idf, 3))
+        for doc, score in best
+    ]
+
+def _first_existing_path(paths: list) -> str:
+    for path in paths:
+        if path and os.path.exists(path):
+            return path
+    return None
+
+def _read_json_file(path: str) -> dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _covers_snapshot(index_extracted_at, snapshot_extracted_at) -> bool:
+    """Whether an index built from one extraction is at least as new as the snapshot (ISO timestamps)"""
+    return bool(index_extracted_at and snapshot_extracted_at) and index_extracted_at >= snapshot_extracted_at
+
+async def _refresh_document360_index_async():
+    """
+    Load the index, or revalidate it against the JSON snapshot (file mtime / GitHub ETag),
+    rebuilding it only when the snapshot changed. A prebuilt .bin serves from cold start, but
+    the snapshot stays the source of truth: once a newer one shows up it is indexed instead.
+    """
+    state = DOCUMENT360_INDEX
+    loop = asyncio.get_running_loop()
+    if state['index'] is None:
+        compact_path = _first_existing_path(DOCUMENT360_INDEX_CONFIG['compact_paths'])
+        if compact_path:
+            # Prebuilt - nothing to parse or tokenize beyond the term dictionary. Serve it
+            # while the snapshot check below runs.
+            load_start = time.time()
+            index = open_document360_index_file(compact_path)
+            state.update({
+                "index": index,
+                "source": compact_path,
+                "extracted_at": index['extracted_at'],
+                "verified_at": time.time(),
+                "checked_at": time.time()
+            })
+            print(f"✅ Document360 index opened from {compact_path}: {len(index['docs'])} articles, {len(index['postings'])} terms in {(time.time() - load_start) * 1000:.1f}ms")
+
+    path = _first_existing_path(DOCUMENT360_INDEX_CONFIG['local_paths'])
+    etag = None
+    mtime = None
+    if path:
+        mtime = os.path.getmtime(path)
+        if state['snapshot'] == path and state['mtime'] == mtime:
+            state['verified_at'] = time.time()
+            return
+        snapshot = await loop.run_in_executor(None, _read_json_file, path)
+        source = path
+    else:
+        url = f"{GPT_RAW_BASE}/{DOCUMENT360_INDEX_CONFIG['snapshot_file']}"
+        headers = {}
+        if state['snapshot'] == "github" and state['etag']:
+            headers["If-None-Match"] = state['etag']
+        response = await _http_request_async("GET", url, headers=headers, timeout=60)
+        if response.status_code == 304:
+            state['verified_at'] = time.time()
+            return
+        if response.status_code != 200:
+            print(f"⚠️ Document360 snapshot download returned HTTP {response.status_code}")
+            return
+        snapshot = await loop.run_in_executor(None, json.loads, response.content)
+        etag = response.headers.get('ETag')
+        source = "github"
+
+    extracted_at = (snapshot.get('metadata') or {}).get('extracted_at')
+    if state['index'] is not None and _covers_snapshot(state['extracted_at'], extracted_at):
+        # Typically the prebuilt .bin, built from this same extraction
+        state.update({"snapshot": source, "etag": etag, "mtime": mtime, "verified_at": time.time()})
+        return
+    if state['index'] is not None:
+        print(f"🔄 Document360 snapshot from {source} ({extracted_at}) is newer than the index ({state['extracted_at']}) - rebuilding")
+
+    # Tokenizing ~500 articles takes a moment - keep it off the event loop
+    build_start = time.time()
+    index = await loop.run_in_executor(None, build_document360_index, snapshot)
+    state.update({
+        "index": index,
+        "source": source,
+        "snapshot": source,
+        "etag": etag,
+        "mtime": mtime,
+        "extracted_at": extracted_at,
+        "verified_at": time.time(),
+        "checked_at": time.time()
+    })
+    print(f"✅ Document360 index built from {source}: {len(index['docs'])} articles, {len(index['postings'])} terms in {time.time() - build_start:.2f}s")
+
+def _refresh_document360_index_in_background():
+    """Load/revalidate the snapshot off the request path; only one refresh runs at a time"""
+    with _DOCUMENT360_INDEX_LOCK:
+        if DOCUMENT360_INDEX['refreshing']:
+            return
+        DOCUMENT360_INDEX['refreshing'] = True
+
+    async def _refresh():
+        try:
+            await _refresh_document360_index_async()
+        except Exception as e:
+            print(f"❌ Document360 index refresh failed: {e}")
+        finally:
+            DOCUMENT360_INDEX['checked_at'] = time.time()
+            DOCUMENT360_INDEX['refreshing'] = False
+
+    asyncio.run_coroutine_threadsafe(_refresh(), _get_async_loop())
+
+def get_document360_index() -> dict:
+    """The loaded index, or None while it is loading or once it is stale"""
+    state = DOCUMENT360_INDEX
+    now = time.time()
+    if state['index'] is None:
+        _refresh_document360_index_in_background()
+        return None
+    # A local snapshot file is cheap to check - pick up a new one without waiting for the GPT context TTL
+    if state['mtime'] is not None and now - state['checked_at'] > DOCUMENT360_INDEX_CONFIG['file_check_seconds']:
+        state['checked_at'] = now
+        try:
+            if os.path.getmtime(state['snapshot']) != state['mtime']:
+                print("🔄 Document360 snapshot file changed - rebuilding index")
+                _refresh_document360_index_in_background()
+            else:
+                state['verified_at'] = now
+        except OSError:
+            pass
+    if now - state['verified_at'] > DOCUMENT360_INDEX_CONFIG['max_age_seconds']:
+        return None
+    return state['index']
+
+def get_document360_index_stats() -> dict:
+    state = DOCUMENT360_INDEX
+    index = state['index']
+    return {
+        "loaded": index is not None,
+        "source": state['source'],
+        "snapshot": state['snapshot'],
+        "articles": len(index['docs']) if index else 0,
+        "terms": len(index['postings']) if index else 0,
+        "extracted_at": state['extracted_at'],
+        "verified_age_seconds": round(time.time() - state['verified_at'], 1) if index else None,
+        "stale": bool(index) and time.time() - state['verified_at'] > DOCUMENT360_INDEX_CONFIG['max_age_seconds']
+    }
+
+async def call_document360_api_async(question: str, query_analysis: dict = None, deadline_at: float = None) -> dict:
     """
     Call Document360 API with intelligent search
     Bryan's requirement: Use actual search, not hardcoded responses
@@ -900,6 +2958,23 @@ def call_document360_api(question: str, query_analysis: dict = None) -> dict:
             important_words = [w for w in words if w not in ['please', 'provide', 'detailed', 'including', 'the', 'a', 'an', 'and', 'or', 'but'] and len(w) > 1]
             search_terms = " ".join(important_words[:3])
         
+        # Serve from the local snapshot index when it has a confident answer
+        local_terms = _ranking_terms(question)
+        if query_analysis and query_analysis.get('keywords'):
+            local_terms.update(_ranking_terms(" ".join(query_analysis['keywords'])))
+        local_start = time.time()
+        local_articles = search_document360_index(local_terms, limit=10)
+        if local_articles:
+            print(f"✅ Document360 local index: {len(local_articles)} articles in {(time.time() - local_start) * 1000:.1f}ms")
+            return {
+                'articles': local_articles,
+                'api_success': True,
+                'total_articles_found': len(local_articles),
+                'search_terms': search_terms,
+                'served_from': 'local_index'
+            }
+        print(f"🔍 Document360 local index {'miss' if local_articles is not None else 'not ready'} - querying the API")
+        
         # Use GET with query parameters
         params = {
             "query": search_terms,
@@ -908,7 +2983,9 @@ def call_document360_api(question: str, query_analysis: dict = None) -> dict:
         
         print(f"🔍 Document360 API call with params: {params}")
         
-        response = _http_get_json(f"{DOCUMENT360_API}/search", params)
+        response = await _cached_upstream_json_async(
+            'document360', "GET", f"{DOCUMENT360_API}/search", params, timeout=_upstream_timeout(deadline_at, 30)
+        )
         
         if response:
             articles = response.get('articles', [])
@@ -937,6 +3014,10 @@ def call_document360_api(question: str, query_analysis: dict = None) -> dict:
             'search_terms': question
         }
 
+def call_document360_api(question: str, query_analysis: dict = None, deadline_at: float = None) -> dict:
+    """Synchronous wrapper around call_document360_api_async for callers outside the event loop"""
+    return _run_async(call_document360_api_async(question, query_analysis, deadline_at))
+
 def create_jql_link_with_issue_ids(tickets: list) -> str:
     """Create JQL link with actual issue IDs from tickets"""
     if not tickets:
@@ -1000,11 +3081,549 @@ def _determine_model_for_query(question: str, query_intent: str, confluence_data
     # Default to GPT-4o-mini for cost efficiency
     return {"provider": "openai", "model": "gpt-4o-mini"}
 
-def synthesize_with_openai(question: str, jira_data: dict, confluence_data: dict, github_data: dict, document360_data: dict, conversation_history: list = None, jql_link: str = None, gpt_context: dict = None, query_intent: str = "general", model_preference: str = None) -> dict:
+def _select_model(question: str, query_intent: str, model_preference: str, confluence_data: dict, github_data: dict, jira_data: dict) -> tuple:
+    """
+    Pick the synthesis model: the user's preference when valid, otherwise the hybrid auto-selection
+    Returns: (provider, model)
+    """
+    print(f"🔍 Model preference received: {model_preference} (type: {type(model_preference)})")
+    if model_preference and model_preference != 'auto' and model_preference.strip():
+        # User has specified a model preference
+        print(f"🎯 Using user-specified model: {model_preference}")
+        model_pref_clean = model_preference.strip().lower()
+        if model_pref_clean == 'gemini-2.0-flash-001' or 'gemini' in model_pref_clean:
+            # Check Vertex AI availability (will try lazy import if needed)
+            if _check_vertex_ai_availability():
+                provider = "gemini"
+                selected_model = "gemini-2.0-flash-001"
+                print(f"✅ Selected Gemini 2.0 Flash (provider={provider}, model={selected_model})")
+            else:
+                print("⚠️ Gemini not available, falling back to GPT-4o")
+                provider = "openai"
+                selected_model = "gpt-4o"
+        elif 'gpt-4o-mini' in model_pref_clean or 'mini' in model_pref_clean:
+            provider = "openai"
+            selected_model = "gpt-4o-mini"
+            print(f"✅ Selected GPT-4o-mini")
+        elif 'gpt-4o' in model_pref_clean and 'mini' not in model_pref_clean:
+            provider = "openai"
+            selected_model = "gpt-4o"
+            print(f"✅ Selected GPT-4o")
+        else:
+            # Invalid preference, fall back to auto
+            print(f"⚠️ Invalid model preference '{model_preference}', using auto-selection")
+            model_selection = _determine_model_for_query(question, query_intent, confluence_data, github_data, jira_data)
+            provider = model_selection.get("provider", "openai")
+            selected_model = model_selection.get("model", "gpt-4o-mini")
+    else:
+        # Auto-select based on query complexity
+        print(f"🔄 Auto-selecting model based on query complexity")
+        model_selection = _determine_model_for_query(question, query_intent, confluence_data, github_data, jira_data)
+        provider = model_selection.get("provider", "openai")
+        selected_model = model_selection.get("model", "gpt-4o-mini")
+        print(f"🤖 Auto-selected: {provider}/{selected_model}")
+    return (provider, selected_model)
+
+class _LLMTokenGuard:
+    """
+    Forwards streamed tokens until the LLM call is abandoned. cancelled tells the worker thread
+    to close its stream; tokens it still produces after that are dropped, not published.
+    """
+
+    def __init__(self, on_token):
+        self.on_token = on_token
+        self.cancelled = threading.Event()
+        self.tokens = 0
+        self._lock = threading.Lock()
+
+    def forward(self, text: str):
+        with self._lock:
+            if self.cancelled.is_set():
+                return
+            self.tokens += 1
+            self.on_token(text)
+
+    def cancel(self) -> bool:
+        """Stop forwarding; True when some of the answer had already been streamed"""
+        with self._lock:
+            self.cancelled.set()
+            return self.tokens > 0
+
+def _close_llm_stream(stream):
+    close = getattr(stream, "close", None)
+    if close is not None:
+        try:
+            close()
+        except Exception as e:
+            print(f"⚠️ Closing abandoned LLM stream failed: {e}")
+
+def _generate_gemini_text(model, prompt: str, generation_config: dict, on_token=None, cancelled: threading.Event = None) -> str:
+    """
+    Gemini completion text. The SDK has no timeout, so it always streams: once cancelled is set
+    the stream is closed at the next chunk. With on_token, each chunk is forwarded as it arrives.
+    """
+    text_parts = []
+    stream = model.generate_content(prompt, generation_config=generation_config, stream=True)
+    try:
+        for chunk in stream:
+            if cancelled is not None and cancelled.is_set():
+                break
+            try:
+                chunk_text = chunk.text
+            except Exception:
+                continue  # Safety/metadata-only chunks carry no text
+            if chunk_text:
+                text_parts.append(chunk_text)
+                if on_token:
+                    on_token(chunk_text)
+    finally:
+        _close_llm_stream(stream)
+    return "".join(text_parts)
+
+def _create_openai_completion(client, on_token=None, cancelled: threading.Event = None, **kwargs) -> tuple:
+    """
+    OpenAI chat completion as (text, usage); with on_token, streams and forwards each delta
+    The SDK times out each read, not the whole stream - once cancelled is set the stream is closed.
+    """
+    if on_token is None:
+        response = client.chat.completions.create(**kwargs)
+        return (response.choices[0].message.content, response.usage)
+    text_parts = []
+    usage = None
+    stream = client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **kwargs)
+    try:
+        for chunk in stream:
+            if cancelled is not None and cancelled.is_set():
+                break
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage  # Final chunk, no choices
+            if chunk.choices and chunk.choices[0].delta.content:
+                delta = chunk.choices[0].delta.content
+                text_parts.append(delta)
+                on_token(delta)
+    finally:
+        _close_llm_stream(stream)
+    return ("".join(text_parts), usage)
+
+# === CONTEXT PACKER ===
+# Synthesis context is packed into a token budget per model and intent, counted with the
+# target model's tokenizer. Sources are packed in the intent's priority order, so when the
+# budget runs out it is the lowest-priority items that are dropped (and reported).
+CONTEXT_TOKEN_BUDGETS = {
+    'default': {'default': 8000, 'workflow': 16000, 'comparison': 12000, 'aggregation': 24000},
+    'gpt-4o-mini': {'default': 8000, 'workflow': 16000, 'comparison': 12000, 'aggregation': 24000},
+    'gpt-4o': {'default': 8000, 'workflow': 16000, 'comparison': 12000, 'aggregation': 24000},
+    'gemini-2.0-flash-001': {'default': 12000, 'workflow': 24000, 'comparison': 16000, 'aggregation': 32000}
+}
+CONTEXT_SOURCE_PRIORITY = {
+    'default': ['jira', 'confluence', 'github', 'document360'],
+    'workflow': ['confluence', 'github', 'jira', 'document360'],
+    'comparison': ['confluence', 'document360', 'jira', 'github'],
+    'aggregation': ['jira', 'confluence', 'github', 'document360']
+}
+# Order the packed sections appear in the prompt, whatever order they were packed in
+CONTEXT_SECTION_ORDER = ['gpt_context', 'jira', 'confluence', 'github', 'document360']
+# Tokenizer for models tiktoken does not know (Gemini) - close enough for budgeting
+DEFAULT_TOKEN_ENCODING = "o200k_base"
+_TOKEN_ENCODERS = {}  # model -> tiktoken encoding (None when unavailable)
+
+def _get_context_token_budget(model: str, query_intent: str) -> int:
+    """Token budget for the Available Data section of the synthesis prompt"""
+    budgets = CONTEXT_TOKEN_BUDGETS.get(model, CONTEXT_TOKEN_BUDGETS['default'])
+    return budgets.get(query_intent, budgets['default'])
+
+def _get_token_encoder(model: str):
+    """tiktoken encoding for a model, loaded once per worker; None falls back to estimates"""
+    if model in _TOKEN_ENCODERS:
+        return _TOKEN_ENCODERS[model]
+    encoder = None
+    if TIKTOKEN_AVAILABLE:
+        try:
+            try:
+                encoder = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoder = tiktoken.get_encoding(DEFAULT_TOKEN_ENCODING)
+        except Exception as e:
+            # The BPE files are downloaded on first use - don't retry on every request
+            print(f"⚠️ tiktoken encoding unavailable for {model}: {e} - estimating token counts")
+    _TOKEN_ENCODERS[model] = encoder
+    return encoder
+
+def count_tokens(text: str, model: str) -> int:
+    """Token count of text for the model (about 4 characters per token without tiktoken)"""
+    if not text:
+        return 0
+    encoder = _get_token_encoder(model)
+    if encoder is None:
+        return (len(text) + 3) // 4
+    return len(encoder.encode(text, disallowed_special=()))
+
+class ContextPacker:
+    """
+    Greedy token-budgeted builder for the synthesis context.
+    Items are added per section; an item that does not fit is dropped (smaller ones after
+    it may still fit). Section and group headers are only written along with their first
+    packed item, so an empty group costs nothing. Required text is always kept.
+    """
+
+    def __init__(self, model: str, budget_tokens: int):
+        self.model = model
+        self.budget_tokens = budget_tokens
+        self.used_tokens = 0
+        self._sections = {}
+        self._current = None
+        self._pending_header = ""
+        self._pending_group = ""
+
+    def begin_section(self, name: str, header: str = ""):
+        self._current = self._sections.setdefault(name, {"parts": [], "packed": 0, "dropped": 0, "tokens": 0})
+        self._pending_header = header
+        self._pending_group = ""
+
+    def begin_group(self, header: str):
+        self._pending_group = header
+
+    def _write(self, text: str, tokens: int):
+        self._current["parts"].append(text)
+        self._current["tokens"] += tokens
+        self.used_tokens += tokens
+
+    def add(self, text: str) -> bool:
+        """Pack one item if it fits in the remaining budget; returns whether it was packed"""
+        chunk = self._pending_header + self._pending_group + text
+        tokens = count_tokens(chunk, self.model)
+        if self.used_tokens + tokens > self.budget_tokens:
+            self._current["dropped"] += 1
+            return False
+        self._write(chunk, tokens)
+        self._current["packed"] += 1
+        self._pending_header = ""
+        self._pending_group = ""
+        return True
+
+    def add_required(self, text: str):
+        """Text the prompt must contain (instructions, totals, no-data notices) - never dropped"""
+        chunk = self._pending_header + text
+        self._write(chunk, count_tokens(chunk, self.model))
+        self._pending_header = ""
+
+    def end_section(self, dropped_label: str = "items"):
+        """Tell the model when items were left out, so it doesn't treat the context as complete"""
+        dropped = self._current["dropped"]
+        if dropped:
+            self.add_required(f"\n[{dropped} more {dropped_label} omitted to fit the context budget]\n")
+        self._current = None
+
+    def text(self) -> str:
+        sections = [
+            "".join(self._sections[name]["parts"])
+            for name in CONTEXT_SECTION_ORDER + [n for n in self._sections if n not in CONTEXT_SECTION_ORDER]
+            if name in self._sections and self._sections[name]["parts"]
+        ]
+        return "\n\n".join(sections)
+
+    def report(self) -> dict:
+        return {
+            "model": self.model,
+            "tokenizer": "tiktoken" if _get_token_encoder(self.model) is not None else "estimate",
+            "budget_tokens": self.budget_tokens,
+            "used_tokens": self.used_tokens,
+            "packed_items": sum(section["packed"] for section in self._sections.values()),
+            "dropped_items": sum(section["dropped"] for section in self._sections.values()),
+            "sections": {
+                name: {"packed": section["packed"], "dropped": section["dropped"], "tokens": section["tokens"]}
+                for name, section in self._sections.items()
+            }
+        }
+
+# === RELEVANCE FUSION ===
+# Every item retrieved from the four sources competes for a global top-K. Each item is
+# ranked twice - by its position in its source's own results and by lexical overlap with
+# the question across all sources - and the two ranks are combined with reciprocal rank
+# fusion. Only the top-K (with a small floor per source) reach the context packer.
+CONTEXT_FUSION_CONFIG = {
+    'rrf_k': 60,
+    'top_k': {'default': 40, 'workflow': 40, 'comparison': 30, 'aggregation': 30},
+    'min_per_source': 2,   # Keep a source's best items even when others outscore them
+    'title_weight': 2.0    # Question terms in a title/summary count double
+}
+
+def _ranking_terms(text: str) -> set:
+    return {token for token in _match_tokens(text) if token not in QUERY_STOP_WORDS and len(token) > 1}
+
+def _context_item_text(source: str, item: dict) -> tuple:
+    """(title, body) used to score an item against the question"""
+    if source == 'jira':
+        return (item.get('summary') or '', f"{item.get('issue_key', '')} {item.get('product') or ''} {item.get('stream') or ''} {item.get('product_manager') or ''}")
+    if source == 'confluence':
+        return (item.get('title') or '', item.get('content') or '')
+    if source == 'github':
+        return (item.get('repository_name') or item.get('name') or '', f"{item.get('description') or ''} {' '.join(item.get('topics') or [])}")
+    return (item.get('title') or '', item.get('content') or item.get('summary') or '')
+
+def _lexical_overlap(question_terms: set, title: str, body: str) -> float:
+    """Share of question terms found in the item, title matches weighted up"""
+    if not question_terms:
+        return 0.0
+    title_terms = _ranking_terms(title)
+    body_terms = _ranking_terms(body)
+    title_weight = CONTEXT_FUSION_CONFIG['title_weight']
+    score = sum(title_weight if term in title_terms else 1.0 for term in question_terms if term in title_terms or term in body_terms)
+    return score / (len(question_terms) * title_weight)
+
+def rank_context_items(question: str, query_intent: str, sources: dict, exempt: set = None) -> tuple:
+    """
+    Fuse results from all sources and keep the global top-K for the prompt
+    sources: source name -> items in the order the upstream returned them
+    exempt: sources passed through whole (e.g. JIRA for aggregations, whose totals need every ticket)
+    Returns: (source name -> selected items in fused order, report)
+    """
+    exempt = exempt or set()
+    rrf_k = CONTEXT_FUSION_CONFIG['rrf_k']
+    top_k = CONTEXT_FUSION_CONFIG['top_k'].get(query_intent, CONTEXT_FUSION_CONFIG['top_k']['default'])
+    question_terms = _ranking_terms(question)
+
+    candidates = []
+    for source, items in sources.items():
+        if source in exempt:
+            continue
+        for source_rank, item in enumerate(items):
+            title, body = _context_item_text(source, item)
+            candidates.append({
+                "source": source,
+                "item": item,
+                "source_rank": source_rank,
+                "overlap": _lexical_overlap(question_terms, title, body)
+            })
+
+    # Global lexical rank; ties keep the upstream order
+    by_overlap = sorted(candidates, key=lambda c: (-c["overlap"], c["source_rank"]))
+    for lexical_rank, candidate in enumerate(by_overlap):
+        candidate["score"] = 1.0 / (rrf_k + candidate["source_rank"] + 1) + 1.0 / (rrf_k + lexical_rank + 1)
+    fused = sorted(candidates, key=lambda c: -c["score"])
+
+    # Floor per source first, then fill the rest of K by fused score
+    selected = []
+    per_source = {}
+    for candidate in fused:
+        if per_source.get(candidate["source"], 0) < CONTEXT_FUSION_CONFIG['min_per_source']:
+            candidate["selected"] = True
+            selected.append(candidate)
+            per_source[candidate["source"]] = per_source.get(candidate["source"], 0) + 1
+    for candidate in fused:
+        if len(selected) >= top_k:
+            break
+        if not candidate.get("selected"):
+            candidate["selected"] = True
+            selected.append(candidate)
+    selected.sort(key=lambda c: -c["score"])
+
+    ranked = {source: list(items) if source in exempt else [] for source, items in sources.items()}
+    for candidate in selected:
+        ranked[candidate["source"]].append(candidate["item"])
+    report = {
+        "candidates": len(candidates),
+        "top_k": top_k,
+        "selected": {source: len(items) for source, items in ranked.items()},
+        "exempt": sorted(exempt)
+    }
+    return (ranked, report)
+
+# === PASSAGE EXTRACTION ===
+# Long Confluence pages are split into passages and only the passages that best match the
+# question (BM25 over question + entity terms) are sent, instead of the page's first N chars.
+PASSAGE_CONFIG = {
+    'passage_chars': 800,   # Target passage size; paragraphs are merged up to this
+    'page_tokens': {'default': 750, 'workflow': 1000},  # Passage tokens sent per page
+    'bm25_k1': 1.2,
+    'bm25_b': 0.75
+}
+_PASSAGE_BREAK_RE = re.compile(r'\n\s*\n|\n(?=#{1,6} )')
+
+def bm25_scores(query_terms, documents_terms: list, k1: float = 1.2, b: float = 0.75) -> list:
+    """BM25 score of each tokenized document for the query terms"""
+    if not documents_terms:
+        return []
+    doc_count = len(documents_terms)
+    avg_length = (sum(len(terms) for terms in documents_terms) / doc_count) or 1.0
+    doc_freq = Counter()
+    for terms in documents_terms:
+        doc_freq.update(set(terms))
+    scores = []
+    for terms in documents_terms:
+        term_freq = Counter(terms)
+        length_norm = k1 * (1 - b + b * len(terms) / avg_length)
+        score = 0.0
+        for term in query_terms:
+            tf = term_freq.get(term)
+            if tf:
+                idf = math.log(1 + (doc_count - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + length_norm)
+        scores.append(score)
+    return scores
+
+def _split_passages(content: str, target_chars: int) -> list:
+    """Split page text on paragraphs/headings, merging short blocks and cutting long ones at sentence ends"""
+    passages = []
+    current = ""
+    for block in _PASSAGE_BREAK_RE.split(content):
+        block = block.strip()
+        if not block:
+            continue
+        while len(block) > target_chars:
+            cut = block.rfind('. ', 0, target_chars)
+            if cut < target_chars // 2:
+                cut = block.rfind(' ', 0, target_chars)
+            if cut <= 0:
+                cut = target_chars - 1
+            if current:
+                passages.append(current)
+                current = ""
+            passages.append(block[:cut + 1].strip())
+            block = block[cut + 1:].strip()
+        if current and len(current) + len(block) + 1 > target_chars:
+            passages.append(current)
+            current = block
+        else:
+            current = f"{current}\n{block}" if current else block
+    if current:
+        passages.append(current)
+    return passages
+
+def passage_query_terms(question: str, gpt_context: dict = None) -> set:
+    """Question terms plus the products, streams and acronym expansions it mentions"""
+    terms = _ranking_terms(question)
+    term_index = get_term_index(gpt_context)
+    match = _get_query_matcher(term_index).match(question)
+    for name in match['products'] + match['streams']:
+        terms.update(_ranking_terms(name))
+    for acronym in match['acronyms']:
+        entry = lookup_term(acronym, term_index)
+        if entry and isinstance(entry.get('definition'), str):
+            terms.update(_ranking_terms(entry['definition']))
+    return terms
+
+def extract_relevant_passages(content: str, query_terms: set, model: str, token_limit: int) -> str:
+    """Best-matching passages of a page within token_limit, in page order"""
+    passages = _split_passages(content, PASSAGE_CONFIG['passage_chars'])
+    if not passages:
+        return ""
+    scores = bm25_scores(query_terms, [_match_tokens(passage) for passage in passages],
+                         PASSAGE_CONFIG['bm25_k1'], PASSAGE_CONFIG['bm25_b'])
+    if max(scores) > 0:
+        order = sorted((i for i in range(len(passages)) if scores[i] > 0), key=lambda i: -scores[i])
+    else:
+        order = range(len(passages))  # Nothing matched - the page opening is the best guess
+    chosen = []
+    used_tokens = 0
+    for i in order:
+        tokens = count_tokens(passages[i], model)
+        if used_tokens + tokens > token_limit:
+            continue
+        chosen.append(i)
+        used_tokens += tokens
+    return "\n...\n".join(passages[i] for i in sorted(chosen))
+
+# === NEAR-DUPLICATE SUPPRESSION ===
+# The same material often comes back from Confluence and Document360, or as several copies
+# of one page. Items are compared with bottom-k MinHash sketches of their word shingles
+# (title + content); near-duplicates collapse into the copy from the source that ranks
+# highest for the intent, which keeps links to the others.
+DEDUP_CONFIG = {
+    'sources': ['confluence', 'document360', 'github'],
+    'shingle_words': 5,
+    'sketch_size': 64,
+    'min_shingles': 10,       # Too little text to judge - never treated as a duplicate
+    'max_chars': 20000,       # Only the start of very long pages is sketched
+    'threshold': 0.7          # Estimated Jaccard similarity at which items are duplicates
+}
+
+def _minhash_sketch(text: str) -> frozenset:
+    """Bottom-k MinHash sketch of the text's word shingles (None when too short to compare)"""
+    tokens = _match_tokens(text[:DEDUP_CONFIG['max_chars']])
+    size = DEDUP_CONFIG['shingle_words']
+    shingles = {' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+    if len(shingles) < DEDUP_CONFIG['min_shingles']:
+        return None
+    # hash() is salted per process, which is fine - sketches are only compared within a request
+    return frozenset(heapq.nsmallest(DEDUP_CONFIG['sketch_size'], {hash(shingle) for shingle in shingles}))
+
+def _estimate_jaccard(sketch_a: frozenset, sketch_b: frozenset) -> float:
+    union_bottom = heapq.nsmallest(DEDUP_CONFIG['sketch_size'], sketch_a | sketch_b)
+    both = sketch_a & sketch_b
+    return sum(1 for h in union_bottom if h in both) / len(union_bottom)
+
+def _context_item_link(source: str, item: dict) -> dict:
+    if source == 'confluence':
+        url = item.get('confluence_url', item.get('source_url', '#'))
+    elif source == 'github':
+        url = item.get('github_url', item.get('url', '#'))
+    else:
+        url = item.get('url', '#')
+    return {"source": source, "title": _context_item_text(source, item)[0] or 'No title', "url": url}
+
+def suppress_near_duplicates(query_intent: str, sources: dict) -> tuple:
+    """
+    Collapse near-duplicate items across Confluence, Document360 and GitHub
+    sources: source name -> items (other sources pass through untouched)
+    Returns: (sources with duplicates removed, report). A kept item that absorbed
+    duplicates is a copy carrying their links under 'duplicate_links'.
+    """
+    priority = CONTEXT_SOURCE_PRIORITY.get(query_intent, CONTEXT_SOURCE_PRIORITY['default'])
+    candidates = []
+    for source in DEDUP_CONFIG['sources']:
+        for rank, item in enumerate(sources.get(source) or []):
+            title, body = _context_item_text(source, item)
+            candidates.append({"source": source, "rank": rank, "item": item, "sketch": _minhash_sketch(f"{title}\n{body}")})
+    # Best-sourced copies first, so they are the ones kept
+    candidates.sort(key=lambda c: (priority.index(c["source"]) if c["source"] in priority else len(priority), c["rank"]))
+
+    kept = []
+    removed = {}
+    for candidate in candidates:
+        original = None
+        if candidate["sketch"] is not None:
+            for other in kept:
+                if other["sketch"] is not None and _estimate_jaccard(candidate["sketch"], other["sketch"]) >= DEDUP_CONFIG['threshold']:
+                    original = other
+                    break
+        if original is None:
+            kept.append(candidate)
+            continue
+        if "links" not in original:
+            original["links"] = []
+        original["links"].append(_context_item_link(candidate["source"], candidate["item"]))
+        removed[candidate["source"]] = removed.get(candidate["source"], 0) + 1
+
+    deduped = dict(sources)
+    for source in DEDUP_CONFIG['sources']:
+        if source in sources:
+            deduped[source] = []
+    for candidate in sorted(kept, key=lambda c: c["rank"]):
+        item = candidate["item"]
+        if candidate.get("links"):
+            item = dict(item, duplicate_links=candidate["links"])
+        deduped[candidate["source"]].append(item)
+    if removed:
+        print(f"🧹 Suppressed {sum(removed.values())} near-duplicate context items: {removed}")
+    return (deduped, {"removed": removed})
+
+def _duplicate_links_line(item: dict) -> str:
+    """Prompt line pointing at the copies of an item that were suppressed"""
+    links = item.get('duplicate_links')
+    if not links:
+        return ""
+    return "  Also at: " + ", ".join(f"[{link['title']}]({link['url']})" for link in links) + "\n"
+
+def synthesize_with_openai(question: str, jira_data: dict, confluence_data: dict, github_data: dict, document360_data: dict, conversation_history: list = None, jql_link: str = None, gpt_context: dict = None, query_intent: str = "general", model_preference: str = None, deadline_at: float = None, on_token=None, on_event=None) -> dict:
     """
     Synthesize comprehensive response using OpenAI
     Bryan's requirement: Intelligent synthesis combining all data sources
     Now includes GPT context and workflow-specific handling
+    deadline_at (time.monotonic) caps the LLM call; past it we return the fallback response
+    on_token(text), when given, receives the answer as the provider streams it (called from a worker thread)
+    on_event("reset", data) is sent when Gemini fails after streaming part of an answer, before
+    the OpenAI fallback streams its own, and when a partly streamed answer misses the deadline
     """
     print(f"🔍 synthesize_with_openai called with intent: {query_intent}")
     print(f"🔍 OPENAI_AVAILABLE at start: {OPENAI_AVAILABLE}")
@@ -1040,7 +3659,7 @@ def synthesize_with_openai(question: str, jira_data: dict, confluence_data: dict
     
     # Ensure openai module is imported
     try:
-        import openai
+        openai = _import_provider("openai")
     except ImportError as e:
         print(f"❌ OpenAI module not available: {e}")
         import traceback
@@ -1053,29 +3672,19 @@ def synthesize_with_openai(question: str, jira_data: dict, confluence_data: dict
             }
         }
     
-    # Set API key
-    try:
-        openai.api_key = api_key_runtime
-        print(f"✅ OpenAI API key set successfully")
-    except Exception as e:
-        print(f"❌ Failed to set OpenAI API key: {e}")
-        import traceback
-        print(f"❌ Traceback: {traceback.format_exc()}")
-        return {
-            "synthesis_response": {
-                "response": "Failed to set OpenAI API key",
-                "sources": [],
-                "synthesis_method": "fallback"
-            }
-        }
+    # The key is handed to the worker-wide client, never written to the shared openai.api_key -
+    # with threaded workers that global is visible to every in-flight request
     
     # Load GPT context if not provided
     if gpt_context is None:
         gpt_context = load_gpt_context_files()
     
     try:
-        # Build context from all data sources - ONLY include actual data
-        context_parts = []
+        # Build context from all data sources - ONLY include actual data, packed into the
+        # selected model's token budget for this intent in source priority order
+        prompt_span = trace_start("prompt_assembly")
+        provider, selected_model = _select_model(question, query_intent, model_preference, confluence_data, github_data, jira_data)
+        packer = ContextPacker(selected_model, _get_context_token_budget(selected_model, query_intent))
         
         # Add GPT context files FIRST (for understanding acronyms, products, etc.)
         gpt_context_str = "GPT Context Files (for reference):\n"
@@ -1085,149 +3694,195 @@ def synthesize_with_openai(question: str, jira_data: dict, confluence_data: dict
             gpt_context_str += f"- Products loaded: {len(gpt_context['files']['products'])} products\n"
         if gpt_context.get('files', {}).get('workflow_instructions'):
             gpt_context_str += f"- Workflow instructions available\n"
-        context_parts.append(gpt_context_str)
+        packer.begin_section('gpt_context')
+        packer.add_required(gpt_context_str)
+        packer.end_section()
         
-        # Add JIRA context - ONLY if we have actual tickets
-        if jira_data.get('tickets') and len(jira_data['tickets']) > 0:
-            # Check if this is an aggregation query
-            if 'count' in question.lower() or 'sum' in question.lower() or 'total' in question.lower() or 'breakdown' in question.lower() or 'points' in question.lower():
-                jira_context = "JIRA Tickets for Aggregation Analysis:\n"
-                jira_context += f"Total tickets available: {len(jira_data['tickets'])}\n"
-                
-                # Pre-calculate totals to ensure accuracy
-                total_points = sum([ticket.get('story_points', 0) or 0 for ticket in jira_data['tickets']])
-                jira_context += f"**PRE-CALCULATED TOTAL STORY POINTS: {total_points}**\n\n"
-                
-                # For aggregation, include ALL tickets (not just 30) so totals are accurate
-                for ticket in jira_data['tickets']:  # Include ALL tickets for accurate aggregation
-                    key = ticket.get('issue_key', 'N/A')
-                    story_points = ticket.get('story_points', 0) or 0
-                    product = ticket.get('product', 'N/A')
-                    stream = ticket.get('stream', 'N/A')
-                    product_manager = ticket.get('product_manager', 'N/A')
-                    
-                    jira_context += f"- {key}: {story_points} pts | PM: {product_manager} | Product: {product} | Stream: {stream}\n"
-            else:
-                jira_context = "JIRA Epics and Tickets (Roadmap Timeline):\n"
-                jira_context += f"Total tickets available: {len(jira_data['tickets'])}\n\n"
-                
-                # Group tickets by sprint_date for better organization
-                from collections import defaultdict
-                tickets_by_sprint = defaultdict(list)
-                for ticket in jira_data['tickets']:
-                    sprint_date = ticket.get('sprint_date') or 'Unknown'
-                    tickets_by_sprint[sprint_date].append(ticket)
-                
-                # Sort sprint dates chronologically (handle None and 'Unknown')
-                sorted_sprints = sorted(tickets_by_sprint.keys(), key=lambda x: ('ZZZZ' if x in ['Unknown', None] else x))
-                
-                # Include all tickets, organized by sprint
-                for sprint_date in sorted_sprints:
-                    tickets = tickets_by_sprint[sprint_date]
-                    jira_context += f"\n### Sprint: {sprint_date} ({len(tickets)} tickets)\n"
-                    for ticket in tickets[:20]:  # Limit to 20 per sprint to avoid token overflow
+        # Collapse near-duplicates, then rank items from every source together;
+        # only the global top-K are offered to the packer
+        is_aggregation_query = 'count' in question.lower() or 'sum' in question.lower() or 'total' in question.lower() or 'breakdown' in question.lower() or 'points' in question.lower()
+        candidate_items, dedup_report = suppress_near_duplicates(query_intent, {
+            'jira': jira_data.get('tickets') or [],
+            'confluence': confluence_data.get('results') or [],
+            'github': github_data.get('repositories') or [],
+            'document360': (document360_data.get('articles') or []) if query_intent != 'workflow' else []
+        })
+        ranked_items, ranking_report = rank_context_items(question, query_intent, candidate_items, exempt={'jira'} if is_aggregation_query else None)
+        
+        def pack_jira():
+            # Add JIRA context - ONLY if we have actual tickets
+            if jira_data.get('tickets') and len(jira_data['tickets']) > 0:
+                # Check if this is an aggregation query
+                if is_aggregation_query:
+                    # Pre-calculate totals over ALL tickets so they stay accurate even if lines are dropped
+                    total_points = sum([ticket.get('story_points', 0) or 0 for ticket in jira_data['tickets']])
+                    packer.begin_section('jira')
+                    packer.add_required(
+                        "JIRA Tickets for Aggregation Analysis:\n"
+                        f"Total tickets available: {len(jira_data['tickets'])}\n"
+                        f"**PRE-CALCULATED TOTAL STORY POINTS: {total_points}**\n\n"
+                    )
+                    for ticket in ranked_items['jira']:
                         key = ticket.get('issue_key', 'N/A')
-                        summary = ticket.get('summary', 'No summary')
-                        assignee = ticket.get('current_assignee_name', 'Unassigned')
-                        issue_type = ticket.get('issue_type_name', 'N/A')
-                        release_date = ticket.get('release_date', 'N/A')
+                        story_points = ticket.get('story_points', 0) or 0
                         product = ticket.get('product', 'N/A')
-                        
-                        jira_context += f"- [{key}](https://ppinc.atlassian.net/browse/{key}): {summary}\n"
-                        jira_context += f"  Release: {release_date} | Product: {product} | Assignee: {assignee}\n"
-            context_parts.append(jira_context)
-        else:
-            context_parts.append("JIRA Data: No JIRA tickets found for this query.")
-        
-        # Add Confluence context - ONLY if we have actual results
-        # For workflow queries, prioritize Confluence content (include more)
-        # Increased limits for richer responses
-        confluence_limit = 20 if query_intent == 'workflow' else 15  # Increased from 10/5 to 20/15
-        confluence_content_limit = 4000 if query_intent == 'workflow' else 3000  # Increased from 2000/1000 to 4000/3000
-        
-        if confluence_data.get('results') and len(confluence_data['results']) > 0:
-            confluence_context = "Confluence Pages with Full Content (PRIMARY SOURCE for workflow questions):\n"
-            for page in confluence_data['results'][:confluence_limit]:
-                title = page.get('title', 'No title')
-                url = page.get('confluence_url', page.get('source_url', '#'))
-                content = page.get('content', 'No content available')
-                confluence_context += f"- [{title}]({url})\n"
-                confluence_context += f"  Content: {content[:confluence_content_limit]}...\n\n"
-            context_parts.append(confluence_context)
-        else:
-            context_parts.append("Confluence Data: No Confluence pages found for this query.")
+                        stream = ticket.get('stream', 'N/A')
+                        product_manager = ticket.get('product_manager', 'N/A')
+                        packer.add(f"- {key}: {story_points} pts | PM: {product_manager} | Product: {product} | Stream: {stream}\n")
+                else:
+                    packer.begin_section('jira', "JIRA Epics and Tickets (Roadmap Timeline):\n"
+                                                 f"Total tickets available: {len(jira_data['tickets'])}\n\n")
+                    
+                    # Group the top-ranked tickets by sprint_date for better organization
+                    from collections import defaultdict
+                    sprint_counts = defaultdict(int)
+                    for ticket in jira_data['tickets']:
+                        sprint_counts[ticket.get('sprint_date') or 'Unknown'] += 1
+                    tickets_by_sprint = defaultdict(list)
+                    for ticket in ranked_items['jira']:
+                        sprint_date = ticket.get('sprint_date') or 'Unknown'
+                        tickets_by_sprint[sprint_date].append(ticket)
+                    
+                    # Sort sprint dates chronologically (handle None and 'Unknown')
+                    sorted_sprints = sorted(tickets_by_sprint.keys(), key=lambda x: ('ZZZZ' if x in ['Unknown', None] else x))
+                    
+                    # Include tickets organized by sprint (most relevant first), as many as the budget allows
+                    for sprint_date in sorted_sprints:
+                        tickets = tickets_by_sprint[sprint_date]
+                        packer.begin_group(f"\n### Sprint: {sprint_date} ({sprint_counts[sprint_date]} tickets)\n")
+                        for ticket in tickets:
+                            key = ticket.get('issue_key', 'N/A')
+                            summary = ticket.get('summary', 'No summary')
+                            assignee = ticket.get('current_assignee_name', 'Unassigned')
+                            release_date = ticket.get('release_date', 'N/A')
+                            product = ticket.get('product', 'N/A')
+                            packer.add(
+                                f"- [{key}](https://ppinc.atlassian.net/browse/{key}): {summary}\n"
+                                f"  Release: {release_date} | Product: {product} | Assignee: {assignee}\n"
+                            )
+                packer.end_section("JIRA tickets")
+            else:
+                packer.begin_section('jira')
+                packer.add_required("JIRA Data: No JIRA tickets found for this query.")
+                packer.end_section()
         
-        # Add GitHub context - ONLY if we have actual repositories
-        # For workflow/diagram queries, prioritize GitHub content (include more)
-        # Increased limits for richer responses
-        is_diagram_query = 'diagram' in question.lower() or 'flowchart' in question.lower() or 'dataflow' in question.lower() or 'data flow' in question.lower() or 'mermaid' in question.lower()
-        github_limit = 20 if (query_intent == 'workflow' or is_diagram_query) else 15  # Increased from 10/5 to 20/15
+        def pack_confluence():
+            # Add Confluence context - ONLY if we have actual results
+            # Send the passages of each page that best match the question, not just its opening
+            # For workflow queries, prioritize Confluence content (include more)
+            page_tokens = PASSAGE_CONFIG['page_tokens'].get(query_intent, PASSAGE_CONFIG['page_tokens']['default'])
+            
+            if confluence_data.get('results') and len(confluence_data['results']) > 0:
+                query_terms = passage_query_terms(question, gpt_context)
+                packer.begin_section('confluence', "Confluence Pages - Most Relevant Passages (PRIMARY SOURCE for workflow questions):\n")
+                for page in ranked_items['confluence']:
+                    title = page.get('title', 'No title')
+                    url = page.get('confluence_url', page.get('source_url', '#'))
+                    content = extract_relevant_passages(page.get('content') or '', query_terms, packer.model, page_tokens) or 'No content available'
+                    packer.add(
+                        f"- [{title}]({url})\n"
+                        f"{_duplicate_links_line(page)}"
+                        f"  Content: {content}\n\n"
+                    )
+                packer.end_section("Confluence pages")
+            else:
+                packer.begin_section('confluence')
+                packer.add_required("Confluence Data: No Confluence pages found for this query.")
+                packer.end_section()
         
-        if github_data.get('repositories') and len(github_data['repositories']) > 0:
-            # Emphasize GitHub for diagram/dataflow questions
-            if is_diagram_query:
-                github_context = "=== GITHUB REPOSITORIES (PRIMARY SOURCE - USE THIS DATA TO GENERATE COMPREHENSIVE, DETAILED DIAGRAM) ===\n"
-                github_context += "CRITICAL INSTRUCTIONS FOR DIAGRAM GENERATION:\n"
-                github_context += "1. Create COMPREHENSIVE diagrams with ALL major steps, decision points, and components\n"
-                github_context += "2. Include ALL decision points with yes/no branches - every decision must have both paths\n"
-                github_context += "3. Show COMPLETE flows from start to finish with every intermediate step\n"
-                github_context += "4. Use subgraphs to group components by repository (e.g., subgraph pulsepointinc/ad-serving)\n"
-                github_context += "5. Use descriptive, specific component names based on repository descriptions\n"
-                github_context += "6. Include error/rejection paths for all decision points\n"
-                github_context += "7. Map each component to its repository in subgraph labels\n"
-                github_context += "8. Do NOT create simplified diagrams - show granular detail with all steps\n\n"
-                github_context += "Repository Data (use descriptions to infer component names and flows):\n\n"
+        def pack_github():
+            # Add GitHub context - ONLY if we have actual repositories
+            if github_data.get('repositories') and len(github_data['repositories']) > 0:
+                # Emphasize GitHub for diagram/dataflow questions
+                if is_diagram_query:
+                    github_context = "=== GITHUB REPOSITORIES (PRIMARY SOURCE - USE THIS DATA TO GENERATE COMPREHENSIVE, DETAILED DIAGRAM) ===\n"
+                    github_context += "CRITICAL INSTRUCTIONS FOR DIAGRAM GENERATION:\n"
+                    github_context += "1. Create COMPREHENSIVE diagrams with ALL major steps, decision points, and components\n"
+                    github_context += "2. Include ALL decision points with yes/no branches - every decision must have both paths\n"
+                    github_context += "3. Show COMPLETE flows from start to finish with every intermediate step\n"
+                    github_context += "4. Use subgraphs to group components by repository (e.g., subgraph pulsepointinc/ad-serving)\n"
+                    github_context += "5. Use descriptive, specific component names based on repository descriptions\n"
+                    github_context += "6. Include error/rejection paths for all decision points\n"
+                    github_context += "7. Map each component to its repository in subgraph labels\n"
+                    github_context += "8. Do NOT create simplified diagrams - show granular detail with all steps\n\n"
+                    github_context += "Repository Data (use descriptions to infer component names and flows):\n\n"
+                else:
+                    github_context = "GitHub Repositories with Details (PRIMARY SOURCE for workflow questions):\n"
+                packer.begin_section('github', github_context)
+                for repo in ranked_items['github']:
+                    name = repo.get('repository_name', repo.get('name', 'No name'))
+                    url = repo.get('github_url', repo.get('url', '#'))
+                    description = repo.get('description', 'No description')
+                    language = repo.get('main_language', 'Unknown')
+                    file_count = repo.get('file_count', 'Unknown')
+                    total_lines = repo.get('total_lines', 'Unknown')
+                    repo_context = f"**Repository: {name}**\n"
+                    repo_context += f"- URL: {url}\n"
+                    repo_context += f"- Description: {description}\n"
+                    repo_context += f"- Language: {language}\n"
+                    repo_context += _duplicate_links_line(repo)
+                    if file_count != 'Unknown':
+                        repo_context += f"- File Count: {file_count}\n"
+                    if total_lines != 'Unknown':
+                        repo_context += f"- Total Lines: {total_lines}\n"
+                    # Include additional repo details if available
+                    if repo.get('topics'):
+                        repo_context += f"- Topics: {', '.join(repo.get('topics', []))}\n"
+                    repo_context += f"\n**Use this repository's description to infer:**\n"
+                    repo_context += f"- Component names and processes (extract from description: '{description}')\n"
+                    repo_context += f"- Functional areas and responsibilities\n"
+                    repo_context += f"- How this repository fits into the overall flow\n"
+                    repo_context += f"- Decision points and validation steps this repository might handle\n\n"
+                    packer.add(repo_context)
+                packer.end_section("GitHub repositories")
             else:
-                github_context = "GitHub Repositories with Details (PRIMARY SOURCE for workflow questions):\n"
-            for repo in github_data['repositories'][:github_limit]:
-                name = repo.get('repository_name', repo.get('name', 'No name'))
-                url = repo.get('github_url', repo.get('url', '#'))
-                description = repo.get('description', 'No description')
-                language = repo.get('main_language', 'Unknown')
-                file_count = repo.get('file_count', 'Unknown')
-                total_lines = repo.get('total_lines', 'Unknown')
-                github_context += f"**Repository: {name}**\n"
-                github_context += f"- URL: {url}\n"
-                github_context += f"- Description: {description}\n"
-                github_context += f"- Language: {language}\n"
-                if file_count != 'Unknown':
-                    github_context += f"- File Count: {file_count}\n"
-                if total_lines != 'Unknown':
-                    github_context += f"- Total Lines: {total_lines}\n"
-                # Include additional repo details if available
-                if repo.get('topics'):
-                    github_context += f"- Topics: {', '.join(repo.get('topics', []))}\n"
-                github_context += f"\n**Use this repository's description to infer:**\n"
-                github_context += f"- Component names and processes (extract from description: '{description}')\n"
-                github_context += f"- Functional areas and responsibilities\n"
-                github_context += f"- How this repository fits into the overall flow\n"
-                github_context += f"- Decision points and validation steps this repository might handle\n\n"
-            context_parts.append(github_context)
-        else:
-            if is_diagram_query:
-                context_parts.append("=== GITHUB DATA: WARNING - No GitHub repositories found for this diagram query. You should still attempt to generate a diagram based on the question, but note that it may not reflect actual implementation. ===")
+                packer.begin_section('github')
+                if is_diagram_query:
+                    packer.add_required("=== GITHUB DATA: WARNING - No GitHub repositories found for this diagram query. You should still attempt to generate a diagram based on the question, but note that it may not reflect actual implementation. ===")
+                else:
+                    packer.add_required("GitHub Data: No GitHub repositories found for this query.")
+                packer.end_section()
+        
+        def pack_document360():
+            # Add Document360 context - ONLY if we have actual articles
+            # Skip Document360 for workflow queries (internal processes)
+            if query_intent != 'workflow' and document360_data.get('articles') and len(document360_data['articles']) > 0:
+                packer.begin_section('document360', "Document360 Articles with Content:\n")
+                for article in ranked_items['document360']:
+                    title = article.get('title', 'No title')
+                    url = article.get('url', '#')
+                    content = article.get('content', article.get('summary', 'No content available'))
+                    packer.add(
+                        f"- [{title}]({url})\n"
+                        f"{_duplicate_links_line(article)}"
+                        f"  Content: {content[:500]}...\n\n"  # Include first 500 chars
+                    )
+                packer.end_section("Document360 articles")
+            elif query_intent == 'workflow':
+                packer.begin_section('document360')
+                packer.add_required("Document360 Data: Skipped for internal process/workflow questions (Document360 is for client-facing documentation).")
+                packer.end_section()
             else:
-                context_parts.append("GitHub Data: No GitHub repositories found for this query.")
+                packer.begin_section('document360')
+                packer.add_required("Document360 Data: No Document360 articles found for this query.")
+                packer.end_section()
         
-        # Add Document360 context - ONLY if we have actual articles
-        # Skip Document360 for workflow queries (internal processes)
-        # Increased limits for richer responses
-        if query_intent != 'workflow' and document360_data.get('articles') and len(document360_data['articles']) > 0:
-            doc360_context = "Document360 Articles with Content:\n"
-            for article in document360_data['articles'][:15]:  # Increased from 5 to 15 articles
-                title = article.get('title', 'No title')
-                url = article.get('url', '#')
-                content = article.get('content', article.get('summary', 'No content available'))
-                doc360_context += f"- [{title}]({url})\n"
-                doc360_context += f"  Content: {content[:500]}...\n\n"  # Include first 500 chars
-            context_parts.append(doc360_context)
-        elif query_intent == 'workflow':
-            context_parts.append("Document360 Data: Skipped for internal process/workflow questions (Document360 is for client-facing documentation).")
-        else:
-            context_parts.append("Document360 Data: No Document360 articles found for this query.")
+        is_diagram_query = 'diagram' in question.lower() or 'flowchart' in question.lower() or 'dataflow' in question.lower() or 'data flow' in question.lower() or 'mermaid' in question.lower()
+        source_packers = {
+            'jira': pack_jira,
+            'confluence': pack_confluence,
+            'github': pack_github,
+            'document360': pack_document360
+        }
+        for source in CONTEXT_SOURCE_PRIORITY.get(query_intent, CONTEXT_SOURCE_PRIORITY['default']):
+            source_packers[source]()
         
-        # Combine all context
-        full_context = "\n\n".join(context_parts)
+        # Combine all context (rendered in the usual section order, whatever the packing order)
+        full_context = packer.text()
+        context_packing = packer.report()
+        context_packing['ranking'] = ranking_report
+        context_packing['duplicates'] = dedup_report
+        print(f"📦 Context packed: {context_packing['used_tokens']}/{context_packing['budget_tokens']} tokens ({context_packing['tokenizer']}), {context_packing['packed_items']} items packed, {context_packing['dropped_items']} dropped")
         
         # Fetch GPT instructions (custom + core) from Firestore
         gpt_instructions, disclaimer_text = _get_gpt_instructions()
@@ -1347,64 +4002,18 @@ IMPORTANT FORMATTING NOTES:
 - Keep the conversational tone friendly and helpful, similar to ChatGPT
 """
         
+        trace_end(prompt_span, model=selected_model, context_tokens=context_packing['used_tokens'])
+        
         # Call OpenAI API (v1.0+ compatible) with optimized parameters and timeout
         synthesis_start_time = time.time()
         try:
-            # Get API key using comprehensive method (should already be set above, but double-check)
-            api_key = openai.api_key or _get_openai_api_key()
-            if not api_key:
-                print("❌ OpenAI API key not found - checked all sources")
-                print(f"🔍 openai.api_key: {'SET' if openai.api_key else 'NOT SET'}")
-                print(f"🔍 _get_openai_api_key(): {'RETURNED KEY' if _get_openai_api_key() else 'RETURNED NONE'}")
-                return _generate_fallback_response(question, jira_data, confluence_data, github_data, document360_data, jql_link)
-            
-            # Ensure openai.api_key is set
-            if not openai.api_key:
-                openai.api_key = api_key
-                print(f"✅ Set openai.api_key from retrieved key")
-            
-            # Determine which model to use (hybrid approach or user preference)
-            print(f"🔍 Model preference received: {model_preference} (type: {type(model_preference)})")
-            if model_preference and model_preference != 'auto' and model_preference.strip():
-                # User has specified a model preference
-                print(f"🎯 Using user-specified model: {model_preference}")
-                model_pref_clean = model_preference.strip().lower()
-                if model_pref_clean == 'gemini-2.0-flash-001' or 'gemini' in model_pref_clean:
-                    # Check Vertex AI availability (will try lazy import if needed)
-                    if _check_vertex_ai_availability():
-                        provider = "gemini"
-                        selected_model = "gemini-2.0-flash-001"
-                        print(f"✅ Selected Gemini 2.0 Flash (provider={provider}, model={selected_model})")
-                    else:
-                        print("⚠️ Gemini not available, falling back to GPT-4o")
-                        provider = "openai"
-                        selected_model = "gpt-4o"
-                elif 'gpt-4o-mini' in model_pref_clean or 'mini' in model_pref_clean:
-                    provider = "openai"
-                    selected_model = "gpt-4o-mini"
-                    print(f"✅ Selected GPT-4o-mini")
-                elif 'gpt-4o' in model_pref_clean and 'mini' not in model_pref_clean:
-                    provider = "openai"
-                    selected_model = "gpt-4o"
-                    print(f"✅ Selected GPT-4o")
-                else:
-                    # Invalid preference, fall back to auto
-                    print(f"⚠️ Invalid model preference '{model_preference}', using auto-selection")
-                    model_selection = _determine_model_for_query(question, query_intent, confluence_data, github_data, jira_data)
-                    provider = model_selection.get("provider", "openai")
-                    selected_model = model_selection.get("model", "gpt-4o-mini")
-            else:
-                # Auto-select based on query complexity
-                print(f"🔄 Auto-selecting model based on query complexity")
-                model_selection = _determine_model_for_query(question, query_intent, confluence_data, github_data, jira_data)
-                provider = model_selection.get("provider", "openai")
-                selected_model = model_selection.get("model", "gpt-4o-mini")
-                print(f"🤖 Auto-selected: {provider}/{selected_model}")
+            # Key resolved at the top of this call (env var, cache or Secret Manager)
+            api_key = api_key_runtime
             
             print(f"🔍 Using {provider} with model: {selected_model}")
             print(f"🔍 Query intent: {query_intent}")
             print(f"🔍 Prompt length: {len(synthesis_prompt)} characters")
-            print(f"🔍 Context parts: {len(context_parts)}")
+            print(f"🔍 Context tokens: {context_packing['used_tokens']}/{context_packing['budget_tokens']}")
             print(f"🔍 Data sources: Confluence={len(confluence_data.get('results', []))}, GitHub={len(github_data.get('repositories', []))}, JIRA={len(jira_data.get('tickets', []))}")
             
             # Increase max_tokens for workflow questions to allow comprehensive answers
@@ -1422,30 +4031,42 @@ IMPORTANT FORMATTING NOTES:
                     selected_model = "gpt-4o" if query_intent in ['workflow', 'comparison'] else "gpt-4o-mini"
                 else:
                     try:
+                        gemini_tokens = _LLMTokenGuard(on_token)
                         gemini_start = time.time()
-                        print(f"🚀 Initializing Vertex AI for Gemini...")
-                        # Initialize Vertex AI
-                        vertexai.init(project="pulsepoint-bitstrapped-ai", location="us-east4")
-                        print(f"✅ Vertex AI initialized")
-                        model = GenerativeModel(selected_model)
-                        print(f"✅ GenerativeModel created: {selected_model}")
+                        model = _get_gemini_model(selected_model)
                         
-                        # Call Gemini
-                        response = model.generate_content(
-                            synthesis_prompt,
-                            generation_config={
-                                "max_output_tokens": max_tokens,
-                                "temperature": 0.5,
-                            }
-                        )
+                        # Call Gemini - the SDK has no per-call timeout, so wait on it
+                        # from a worker thread and abandon it at the request deadline
+                        with trace_span("llm", provider="gemini", model=selected_model) as llm_span:
+                            gemini_future = UPSTREAM_BULKHEADS['gemini'].submit(
+                                _generate_gemini_text,
+                                model,
+                                synthesis_prompt,
+                                {
+                                    "max_output_tokens": max_tokens,
+                                    "temperature": 0.5,
+                                },
+                                gemini_tokens.forward if on_token else None,
+                                gemini_tokens.cancelled
+                            )
+                            try:
+                                synthesized_response = gemini_future.result(timeout=_upstream_timeout(deadline_at, 60))
+                            except FutureTimeoutError:
+                                gemini_future.cancel()
+                                # Free the bulkhead slot and silence the abandoned stream
+                                if gemini_tokens.cancel() and on_event:
+                                    on_event("reset", {"reason": "deadline", "provider": "gemini", "model": selected_model})
+                                trace_end(llm_span, status="timeout")
+                                print(f"⏱️ Gemini synthesis missed the request deadline after {time.time() - gemini_start:.2f}s - abandoning")
+                                return _deadline_fallback_response(question, jira_data, confluence_data, github_data, document360_data, jql_link)
                         gemini_duration = time.time() - gemini_start
                         print(f"⏱️ Gemini synthesis took {gemini_duration:.2f}s")
                         
-                        synthesized_response = response.text
-                        
                         # Append disclaimer if present
                         if disclaimer_text and disclaimer_text not in synthesized_response:
                             synthesized_response = f"{synthesized_response}\n\n---\n\n{disclaimer_text}"
+                            if on_token:
+                                on_token(f"\n\n---\n\n{disclaimer_text}")
                         
                         # Track usage for cost monitoring (Gemini pricing)
                         # Gemini 2.0 Flash: $0.075 per 1M input tokens, $0.30 per 1M output tokens
@@ -1454,8 +4075,10 @@ IMPORTANT FORMATTING NOTES:
                         total_tokens = input_tokens + output_tokens
                         
                         print(f"✅ Gemini synthesis successful: {len(synthesized_response)} characters")
+                        cost = (input_tokens * 0.075 + output_tokens * 0.30) / 1_000_000
                         print(f"📊 Estimated token usage: {int(input_tokens)} input + {int(output_tokens)} output = {int(total_tokens)} total")
-                        print(f"💰 Estimated cost: ${(input_tokens * 0.075 + output_tokens * 0.30) / 1_000_000:.6f}")
+                        print(f"💰 Estimated cost: ${cost:.6f}")
+                        record_llm_usage("gemini", selected_model, input_tokens, output_tokens, cost)
                         
                         synthesis_method = f"gemini_{selected_model.replace('-', '_')}"
                         
@@ -1475,7 +4098,8 @@ IMPORTANT FORMATTING NOTES:
                                     "input_tokens": int(input_tokens),
                                     "output_tokens": int(output_tokens),
                                     "total_tokens": int(total_tokens)
-                                }
+                                },
+                                "context_packing": context_packing
                             }
                         }
                     except Exception as e:
@@ -1486,10 +4110,13 @@ IMPORTANT FORMATTING NOTES:
                         print("⚠️ Falling back to OpenAI GPT-4o")
                         provider = "openai"
                         selected_model = "gpt-4o"
+                        if gemini_tokens.cancel() and on_event:
+                            # Clients drop the partial Gemini text before the OpenAI answer streams
+                            on_event("reset", {"reason": "provider_fallback", "provider": provider, "model": selected_model})
             
             # Use OpenAI (default or fallback)
             openai_start = time.time()
-            client = openai.OpenAI(api_key=api_key, timeout=60.0)  # Increased to 60 seconds for workflow questions
+            client = _get_openai_client(api_key)
             
             # Use GPT instructions as system message for better adherence
             system_message = "You are a helpful assistant for PulsePoint employees."
@@ -1512,23 +4139,43 @@ IMPORTANT FORMATTING NOTES:
             # Add current question
             messages.append({"role": "user", "content": synthesis_prompt})
             
-            response = client.chat.completions.create(
-                model=selected_model,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=0.5   # Reduced from 0.7 for more focused responses
-            )
+            if deadline_at is not None and _time_left(deadline_at) < 1.0:
+                print("⏱️ No time left in the request deadline for OpenAI synthesis")
+                return _deadline_fallback_response(question, jira_data, confluence_data, github_data, document360_data, jql_link)
+            openai_timeout = _upstream_timeout(deadline_at, 60.0)
+            openai_tokens = _LLMTokenGuard(on_token)
+            with trace_span("llm", provider="openai", model=selected_model) as llm_span:
+                openai_future = UPSTREAM_BULKHEADS['openai'].submit(
+                    _create_openai_completion,
+                    client,
+                    openai_tokens.forward if on_token else None,
+                    openai_tokens.cancelled,
+                    model=selected_model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=0.5,   # Reduced from 0.7 for more focused responses
+                    timeout=openai_timeout
+                )
+                try:
+                    # The SDK enforces openai_timeout itself; the margin covers time spent queued in the bulkhead
+                    synthesized_response, usage = openai_future.result(timeout=openai_timeout + 5)
+                except FutureTimeoutError:
+                    openai_future.cancel()
+                    if openai_tokens.cancel() and on_event:
+                        on_event("reset", {"reason": "deadline", "provider": "openai", "model": selected_model})
+                    trace_end(llm_span, status="timeout")
+                    print(f"⏱️ OpenAI synthesis did not finish within {openai_timeout:.1f}s - abandoning")
+                    return _deadline_fallback_response(question, jira_data, confluence_data, github_data, document360_data, jql_link)
             openai_duration = time.time() - openai_start
             print(f"⏱️ OpenAI synthesis took {openai_duration:.2f}s")
             
-            synthesized_response = response.choices[0].message.content
-            
             # Append disclaimer if present
             if disclaimer_text and disclaimer_text not in synthesized_response:
                 synthesized_response = f"{synthesized_response}\n\n---\n\n{disclaimer_text}"
-            
+                if on_token:
+                    on_token(f"\n\n---\n\n{disclaimer_text}")
+
             # Track usage for cost monitoring
-            usage = response.usage
             input_tokens = usage.prompt_tokens if usage else 0
             output_tokens = usage.completion_tokens if usage else 0
             total_tokens = usage.total_tokens if usage else 0
@@ -1546,6 +4193,7 @@ IMPORTANT FORMATTING NOTES:
                 cost = (input_tokens * 2.50 + output_tokens * 10.00) / 1_000_000  # Default to GPT-4o pricing
             
             print(f"💰 Estimated cost: ${cost:.6f}")
+            record_llm_usage(provider, selected_model, input_tokens, output_tokens, cost)
             
             synthesis_method = f"{provider}_{selected_model.replace('-', '_')}"
             
@@ -1566,7 +4214,8 @@ IMPORTANT FORMATTING NOTES:
                         "output_tokens": output_tokens,
                         "total_tokens": total_tokens
                     },
-                    "duration_seconds": total_synthesis_duration
+                    "duration_seconds": total_synthesis_duration,
+                    "context_packing": context_packing
                 }
             }
         except openai.APITimeoutError as e:
@@ -1574,11 +4223,15 @@ IMPORTANT FORMATTING NOTES:
             import traceback
             print(f"❌ Traceback: {traceback.format_exc()}")
             # Return a fallback response with the data we have
+            if deadline_at is not None and _time_left(deadline_at) < 1.0:
+                return _deadline_fallback_response(question, jira_data, confluence_data, github_data, document360_data, jql_link)
             return _generate_fallback_response(question, jira_data, confluence_data, github_data, document360_data, jql_link)
         except openai.AuthenticationError as e:
             print(f"❌ OpenAI Authentication error: {e}")
             import traceback
             print(f"❌ Traceback: {traceback.format_exc()}")
+            # The key may have been rotated - fetch it again on the next request
+            _invalidate_openai_api_key()
             return _generate_fallback_response(question, jira_data, confluence_data, github_data, document360_data, jql_link)
         except Exception as e:
             print(f"❌ OpenAI API error: {e}")
@@ -1642,14 +4295,1050 @@ def _generate_fallback_response(question: str, jira_data: dict, confluence_data:
         }
     }
 
+# === REQUEST DEADLINES ===
+# One end-to-end budget per /ask, split between the upstream fan-out and LLM synthesis.
+# Upstream calls still running when their share expires are cancelled and synthesis
+# proceeds with whatever arrived. Override with ASK_DEADLINE_SECONDS_<INTENT>.
+ASK_DEADLINE_CONFIG = {
+    # intent -> total seconds for the request, seconds reserved for synthesis
+    'default': {'total_seconds': 45, 'synthesis_seconds': 25},
+    'workflow': {'total_seconds': 90, 'synthesis_seconds': 60},    # Long Gemini/GPT-4o diagram answers
+    'comparison': {'total_seconds': 60, 'synthesis_seconds': 35},
+    'jira_only': {'total_seconds': 40, 'synthesis_seconds': 20},
+    'aggregation': {'total_seconds': 60, 'synthesis_seconds': 30}   # Aggregations send every ticket to the LLM
+}
+
+def _get_deadline_config(intent: str) -> dict:
+    config = dict(ASK_DEADLINE_CONFIG.get(intent, ASK_DEADLINE_CONFIG['default']))
+    env_total = os.environ.get(f"ASK_DEADLINE_SECONDS_{intent.upper()}")
+    if env_total:
+        try:
+            total = float(env_total)
+            # Keep the same fan-out/synthesis split when only the total is overridden
+            config['synthesis_seconds'] = total * config['synthesis_seconds'] / config['total_seconds']
+            config['total_seconds'] = total
+        except ValueError:
+            print(f"⚠️ Ignoring invalid ASK_DEADLINE_SECONDS_{intent.upper()}={env_total}")
+    return config
+
+def _time_left(deadline_at: float, default: float = None) -> float:
+    """Seconds until a time.monotonic() deadline, or default when there is no deadline"""
+    if deadline_at is None:
+        return default
+    return max(0.0, deadline_at - time.monotonic())
+
+def _upstream_timeout(deadline_at: float, default: float) -> float:
+    """HTTP timeout for one upstream call: its usual timeout, capped by the request deadline"""
+    if deadline_at is None:
+        return default
+    return max(0.1, min(default, _time_left(deadline_at)))
+
+# === RESPONSE CACHE ===
+# Completed /ask responses, per worker, so the questions asked over and over during the day
+# ("current sprint roadmap", "AO roadmap") skip the fan-out and the LLM call. Keys include
+# the date-resolved JIRA params, so "current sprint" answers roll over with the month.
+# Requests may send "cache": "bypass" (neither read nor write) or "refresh" (recompute and store).
+RESPONSE_CACHE_CONFIG = {
+    'max_entries': int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "256")),
+    # intent -> seconds a cached answer stays fresh
+    'ttl_seconds': {
+        'default': 900,
+        'workflow': 3600,        # Process documentation changes rarely
+        'comparison': 1800,
+        'general': 900,
+        'listing': 600,
+        'jira_only': 300,        # Ticket state moves during the day
+        'aggregation': 300,
+        'current_sprint': 300
+    }
+}
+_RESPONSE_CACHE = OrderedDict()  # key -> {"payload", "stored_at", "expires_at", "intent"}
+_RESPONSE_CACHE_LOCK = threading.Lock()
+_RESPONSE_CACHE_STATS = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evictions": 0}
+
+def _normalize_question(question: str) -> str:
+    """Case, punctuation and whitespace-insensitive form of a question"""
+    return ' '.join(_match_tokens(question))
+
+def _response_cache_key(question: str, model_preference, max_results, query_analysis: dict) -> str:
+    key_parts = {
+        "question": _normalize_question(question),
+        "model_preference": model_preference,
+        "max_results": max_results,
+        "intent": query_analysis.get('intent', 'general'),
+        "jira_params": query_analysis.get('jira_params', {})
+    }
+    return hashlib.sha256(json.dumps(key_parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def _response_cache_get(key: str) -> tuple:
+    """Returns (payload copy, age_seconds) for a fresh entry, else (None, None)"""
+    now = time.time()
+    with _RESPONSE_CACHE_LOCK:
+        entry = _RESPONSE_CACHE.get(key)
+        if entry is None or entry["expires_at"] <= now:
+            if entry is not None:
+                del _RESPONSE_CACHE[key]
+            _RESPONSE_CACHE_STATS["misses"] += 1
+            return (None, None)
+        _RESPONSE_CACHE.move_to_end(key)
+        _RESPONSE_CACHE_STATS["hits"] += 1
+        payload, stored_at = entry["payload"], entry["stored_at"]
+    return (copy.deepcopy(payload), now - stored_at)
+
+def _response_cache_put(key: str, payload: dict, intent: str):
+    ttl = RESPONSE_CACHE_CONFIG['ttl_seconds'].get(intent, RESPONSE_CACHE_CONFIG['ttl_seconds']['default'])
+    now = time.time()
+    entry = {"payload": copy.deepcopy(payload), "stored_at": now, "expires_at": now + ttl, "intent": intent}
+    with _RESPONSE_CACHE_LOCK:
+        _RESPONSE_CACHE[key] = entry
+        _RESPONSE_CACHE.move_to_end(key)
+        _RESPONSE_CACHE_STATS["stores"] += 1
+        while len(_RESPONSE_CACHE) > RESPONSE_CACHE_CONFIG['max_entries']:
+            _RESPONSE_CACHE.popitem(last=False)
+            _RESPONSE_CACHE_STATS["evictions"] += 1
+
+def _is_cacheable_response(payload: dict) -> bool:
+    """Only complete LLM answers are cached - never fallbacks, errors, or ones that dropped a source"""
+    synthesis_response = payload.get("synthesis_response", {})
+    if payload.get("error") or synthesis_response.get("deadline_exceeded"):
+        return False
+    if synthesis_response.get("synthesis_method") in ("fallback", "error", None):
+        return False
+    return not synthesis_response.get("dropped_sources", payload.get("dropped_sources"))
+
+def get_response_cache_stats() -> dict:
+    with _RESPONSE_CACHE_LOCK:
+        stats = dict(_RESPONSE_CACHE_STATS)
+        stats["entries"] = len(_RESPONSE_CACHE)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    stats["max_entries"] = RESPONSE_CACHE_CONFIG['max_entries']
+    return stats
+
+def _cache_response(payload: dict, cache_status: str, age_seconds: float = None, status_code: int = 200):
+    """jsonify with X-Cache (HIT, MISS, REFRESH, BYPASS) and, on hits, X-Cache-Age headers
+    The request's timings block is added here, to a copy - cached and shared payloads never carry one.
+    Error results go through here too, so they are timed the same way."""
+    trace = current_trace()
+    if trace is not None:
+        payload = dict(payload, timings=trace.timings())
+    with trace_span("serialization"):
+        response = jsonify(payload)
+    response.status_code = status_code
+    response.headers["X-Cache"] = cache_status
+    if age_seconds is not None:
+        response.headers["X-Cache-Age"] = str(int(age_seconds))
+    return response
+
+# === REQUEST COALESCING ===
+# When the same standalone question arrives while it is already being answered (a roadmap
+# link shared in Slack), the newcomers attach to the in-flight computation instead of
+# starting their own: one fan-out, one LLM call, and every caller gets the result. Calls
+# are keyed like the response cache. A streaming caller that joins late has the events
+# emitted so far replayed, then receives the rest live.
+class InFlightCall:
+    """One in-flight /ask computation: its eventual (payload, status) and the events emitted so far"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.followers = 0
+        self._lock = threading.Lock()
+        self._history = []
+        self._subscribers = []
+
+    def publish(self, event: str, data):
+        with self._lock:
+            if self.done.is_set():
+                return  # Late tokens from an abandoned LLM call
+            self._history.append((event, data))
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.put((event, data))
+
+    def subscribe(self) -> queue.Queue:
+        events = queue.Queue()
+        with self._lock:
+            for item in self._history:
+                events.put(item)
+            self._subscribers.append(events)
+        return events
+
+    def unsubscribe(self, events: queue.Queue):
+        with self._lock:
+            if events in self._subscribers:
+                self._subscribers.remove(events)
+
+    def finish(self, result: tuple):
+        self.result = result
+        self.publish("done", result)
+        self.done.set()
+
+class SingleFlight:
+    """Per-worker registry of in-flight calls; the first caller for a key leads, the rest follow"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {"leaders": 0, "followers": 0, "follower_timeouts": 0}
+
+    def join(self, key: str) -> tuple:
+        """Returns (call, is_leader); the leader must call finish()"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self._stats["followers"] += 1
+                return (call, False)
+            call = InFlightCall()
+            self._calls[key] = call
+            self._stats["leaders"] += 1
+            return (call, True)
+
+    def finish(self, key: str, call: InFlightCall, result: tuple):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.finish(result)
+
+    def record_timeout(self):
+        with self._lock:
+            self._stats["follower_timeouts"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
+
+ASK_SINGLEFLIGHT = SingleFlight()
+# Upstream fetches in flight on the worker's event loop: retrieval cache key -> Task
+_UPSTREAM_IN_FLIGHT = {}
+_UPSTREAM_COALESCE_STATS = {"fetches": 0, "coalesced": 0}
+
+def _follower_wait_seconds(intent: str) -> float:
+    """How long a follower waits on the leader before computing the answer itself"""
+    return _get_deadline_config(intent)['total_seconds'] + 10
+
+def _with_session_id(payload: dict, session_id: str) -> dict:
+    """Copy of a shared payload with this caller's session_id"""
+    payload = copy.deepcopy(payload)
+    if "session_id" in payload.get("synthesis_response", {}):
+        payload["synthesis_response"]["session_id"] = session_id
+    return payload
+
+def get_coalescing_stats() -> dict:
+    return {"ask": ASK_SINGLEFLIGHT.stats(), "upstream": dict(_UPSTREAM_COALESCE_STATS, in_flight=len(_UPSTREAM_IN_FLIGHT))}
+
+# === ASYNC FAN-OUT ENGINE ===
+# Empty results used when a source is skipped for an intent or fails/times out
+EMPTY_CONFLUENCE_DATA = {'results': [], 'api_success': False, 'total_sources_found': 0}
+EMPTY_GITHUB_DATA = {'repositories': [], 'api_success': False, 'total_repos_found': 0}
+EMPTY_DOCUMENT360_DATA = {'articles': [], 'api_success': False, 'total_articles_found': 0}
+EMPTY_JIRA_DATA = {'tickets': [], 'summary': [], 'query_success': False, 'total_tickets': 0}
+
+def _extract_workflow_subject(question: str, query_analysis: dict) -> str:
+    """Extract the main subject of a workflow question (e.g. "PRTS" from "workflow of PRTS")"""
+    workflow_subject = None
+    # Pattern: "workflow of X" or "workflow of the X" or "what is X the process" or "describe X the process"
+    patterns = [
+        r'workflow\s+of\s+(?:the\s+)?([A-Z]+)',  # "workflow of PRTS"
+        r'what\s+is\s+([A-Z]+)\s+the\s+process',  # "what is PRTS the process"
+        r'describe\s+([A-Z]+)\s+the\s+process',  # "describe PRTS the process"
+        r'explain\s+([A-Z]+)\s+the\s+process',  # "explain PRTS the process"
+        r'(?:what|how|explain|describe).*?([A-Z]{2,})',  # Fallback: extract any uppercase acronym
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, question, re.IGNORECASE)
+        if match:
+            workflow_subject = match.group(1)
+            break  # Extract the acronym (e.g., "PRTS")
+    else:
+        # Pattern: "how does X work" or "explain X"
+        match = re.search(r'(?:how\s+does|explain|describe|tell\s+me\s+about)\s+([A-Z]+)', question, re.IGNORECASE)
+        if match:
+            workflow_subject = match.group(1)
+        elif query_analysis.get('keywords'):
+            # Use the first keyword that looks like an acronym/product name
+            keywords = query_analysis['keywords']
+            for kw in keywords:
+                if len(kw) >= 2 and kw.isupper():
+                    workflow_subject = kw
+                    break
+    return workflow_subject
+
+def _filter_workflow_tickets(tickets: list, workflow_subject: str) -> list:
+    """Tickets whose summary or key mentions the workflow subject (e.g. PRTS)"""
+    return [
+        ticket for ticket in tickets
+        if workflow_subject.upper() in ticket.get('summary', '').upper() or
+           workflow_subject.upper() in ticket.get('issue_key', '')
+    ]
+
+def _source_event(name: str, data: dict, workflow_subject: str = None) -> dict:
+    """Early "source" stream event: what a source returned, enough to render citations"""
+    event = {"source": name}
+    if name == 'confluence':
+        event.update({
+            "ok": data.get('api_success', False),
+            "count": len(data.get('results', [])),
+            "pages": [
+                {"title": page.get('title', 'No title'), "url": page.get('confluence_url', page.get('source_url', '#'))}
+                for page in data.get('results', [])[:20]
+            ]
+        })
+    elif name == 'jira':
+        tickets = data.get('tickets', [])
+        if workflow_subject:
+            tickets = _filter_workflow_tickets(tickets, workflow_subject)
+        event.update({
+            "ok": data.get('query_success', False),
+            "count": len(tickets),
+            "jql_link": create_jql_link_with_issue_ids(tickets) if tickets else ""
+        })
+    elif name == 'github':
+        event.update({
+            "ok": data.get('api_success', False),
+            "count": len(data.get('repositories', [])),
+            "repositories": [
+                {"name": repo.get('repository_name', repo.get('name', 'No name')), "url": repo.get('github_url', repo.get('url', '#'))}
+                for repo in data.get('repositories', [])[:20]
+            ]
+        })
+    elif name == 'document360':
+        event.update({
+            "ok": data.get('api_success', False),
+            "count": len(data.get('articles', [])),
+            "articles": [
+                {"title": article.get('title', 'No title'), "url": article.get('url', '#')}
+                for article in data.get('articles', [])[:20]
+            ]
+        })
+    return event
+
+async def _fan_out_sources_async(question: str, detected_intent: str, query_analysis: dict, conversation_history: list, max_results: int, deadline_at: float = None, on_event=None) -> dict:
+    """
+    Run every upstream call for a question as coroutines on the worker's event loop
+    Calls still running at deadline_at are cancelled and reported in dropped_sources
+    on_event(event, data), when given, receives a "source" event as each call completes
+    and "sources_complete" once the fan-out is over
+    Returns: {confluence, github, document360, jira, product_mappings, workflow_subject, dropped_sources}
+    """
+    fan_out_start = time.monotonic()
+
+    def _emit_source(name: str, data: dict):
+        if on_event:
+            event = _source_event(name, data, sources['workflow_subject'])
+            event["elapsed_seconds"] = round(time.monotonic() - fan_out_start, 3)
+            on_event("source", event)
+
+    def _on_task_done(name: str, task):
+        if task.cancelled():
+            return  # Reported in dropped_sources
+        if task.exception() is not None:
+            _emit_source(name, {})
+        else:
+            _emit_source(name, task.result())
+
+    sources = {
+        'confluence': dict(EMPTY_CONFLUENCE_DATA),
+        'github': dict(EMPTY_GITHUB_DATA),
+        'document360': dict(EMPTY_DOCUMENT360_DATA),
+        'jira': dict(EMPTY_JIRA_DATA),
+        'product_mappings': {},
+        'workflow_subject': None,
+        'dropped_sources': []
+    }
+
+    if detected_intent in ['jira_only', 'aggregation']:
+        if detected_intent == 'jira_only':
+            print("🔍 JIRA-only query - skipping other data sources")
+        else:
+            print("🔍 Aggregation query - JIRA-only for counts and sums")
+        # Get product mappings for JIRA filtering
+        sources['product_mappings'] = get_product_mappings_from_github(GPT_CONTEXT)
+        try:
+            sources['jira'] = await asyncio.wait_for(
+                traced_async("upstream_jira", call_jira_v4_api_async(question, max_results, query_analysis, sources['product_mappings'], deadline_at)),
+                timeout=_time_left(deadline_at)
+            )
+            _emit_source('jira', sources['jira'])
+        except asyncio.TimeoutError:
+            print("⚠️ JIRA API missed the deadline - dropped")
+            sources['dropped_sources'].append('jira')
+            metric_inc("knowledge_layer_upstream_deadline_drops_total", source='jira')
+        if on_event:
+            on_event("sources_complete", {"dropped_sources": sources['dropped_sources']})
+        return sources
+
+    if detected_intent == 'workflow':
+        # For workflow questions: Prioritize Confluence + GitHub, skip Document360 (internal process)
+        print("🔍 Workflow query - prioritizing Confluence + GitHub, skipping Document360 (internal process)")
+    else:
+        print("🔍 General query - calling all data sources concurrently...")
+    tasks = {
+        'confluence': asyncio.create_task(traced_async("upstream_confluence", call_confluence_api_async(question, query_analysis, conversation_history, deadline_at))),
+        'github': asyncio.create_task(traced_async("upstream_github", call_github_api_async(question, query_analysis, deadline_at)))
+    }
+    if detected_intent != 'workflow':
+        tasks['document360'] = asyncio.create_task(traced_async("upstream_document360", call_document360_api_async(question, query_analysis, deadline_at)))
+
+    # Product mappings are needed for JIRA filtering (in memory - no network)
+    sources['product_mappings'] = get_product_mappings_from_github(GPT_CONTEXT)
+
+    if detected_intent == 'workflow':
+        # JIRA call for context (but not primary source for workflow questions)
+        # For workflow queries, filter JIRA tickets by the main subject (e.g., PRTS)
+        workflow_subject = _extract_workflow_subject(question, query_analysis)
+        # If we found a workflow subject, add it to query_analysis for JIRA filtering
+        if workflow_subject and query_analysis:
+            if 'jira_params' not in query_analysis:
+                query_analysis['jira_params'] = {}
+            # Add search terms to filter JIRA tickets by the workflow subject
+            query_analysis['jira_params']['search_terms'] = workflow_subject
+            query_analysis['jira_params']['summary'] = workflow_subject  # Also search in summary field
+            print(f"🔍 Workflow query detected subject: {workflow_subject} - filtering JIRA tickets")
+        sources['workflow_subject'] = workflow_subject
+
+    # Start JIRA call with the product mappings
+    tasks['jira'] = asyncio.create_task(traced_async("upstream_jira", call_jira_v4_api_async(question, max_results, query_analysis, sources['product_mappings'], deadline_at)))
+    for name, task in tasks.items():
+        task.add_done_callback(functools.partial(_on_task_done, name))
+
+    # Wait for everything that can finish before the deadline; abandon the rest
+    done, pending = await asyncio.wait(tasks.values(), timeout=_time_left(deadline_at))
+    for name, task in tasks.items():
+        if task in pending:
+            task.cancel()
+            sources['dropped_sources'].append(name)
+            metric_inc("knowledge_layer_upstream_deadline_drops_total", source=name)
+            print(f"⚠️ {name} missed the request deadline - dropped from synthesis")
+            continue
+        try:
+            sources[name] = task.result()
+        except Exception as e:
+            print(f"⚠️ {name} error: {e!r}")
+    if detected_intent == 'workflow':
+        print(f"✅ JIRA data retrieved: {len(sources['jira'].get('tickets', []))} tickets")
+    if on_event:
+        on_event("sources_complete", {"dropped_sources": sources['dropped_sources']})
+    return sources
+
+def _deadline_fallback_response(question: str, jira_data: dict, confluence_data: dict, github_data: dict, document360_data: dict, jql_link: str = None) -> dict:
+    """Fallback response for an LLM call that ran out of request deadline"""
+    result = _generate_fallback_response(question, jira_data, confluence_data, github_data, document360_data, jql_link)
+    result["synthesis_response"]["deadline_exceeded"] = True
+    return result
+
+def _run_ask_pipeline(question: str, query_analysis: dict, conversation_history: list, max_results: int, model_preference: str, session_id: str, request_start: float, on_token=None, on_event=None) -> tuple:
+    """
+    Everything /ask does after query analysis: upstream fan-out, synthesis, response assembly
+    Returns (payload, status_code); for streamed answers on_event receives per-source
+    events from the fan-out and on_token the synthesized text
+    """
+    # Load GPT context files FIRST (always, for all queries)
+    with trace_span("context_load"):
+        gpt_context = load_gpt_context_files()
+    
+    # Get data sources based on query intent
+    detected_intent = query_analysis.get('intent', 'general')
+    print(f"🔍 Query intent: {detected_intent}")
+    
+    # One end-to-end deadline per request: upstream calls get what's left after the synthesis reserve
+    deadline_config = _get_deadline_config(detected_intent)
+    deadline_at = request_start + deadline_config['total_seconds']
+    fan_out_deadline_at = deadline_at - deadline_config['synthesis_seconds']
+    print(f"⏱️ Request deadline: {deadline_config['total_seconds']:.0f}s ({deadline_config['synthesis_seconds']:.0f}s reserved for synthesis)")
+    
+    with trace_span("fan_out"):
+        sources = _run_async(
+            _fan_out_sources_async(question, detected_intent, query_analysis, conversation_history, max_results, fan_out_deadline_at, on_event),
+            timeout=_time_left(fan_out_deadline_at) + 5
+        )
+    confluence_data = sources['confluence']
+    github_data = sources['github']
+    document360_data = sources['document360']
+    jira_data = sources['jira']
+    dropped_sources = list(sources['dropped_sources'])
+    
+    if detected_intent == 'workflow':
+        workflow_subject = sources['workflow_subject']
+        
+        # Skip to synthesis for workflow queries (already have all data)
+        # Create JQL link ONLY if we have PRTS-related tickets (filter out unrelated tickets)
+        jql_link = ''
+        if jira_data.get('tickets'):
+            # Filter tickets to only include those related to the workflow subject
+            if workflow_subject:
+                filtered_tickets = _filter_workflow_tickets(jira_data.get('tickets', []), workflow_subject)
+                if filtered_tickets:
+                    jql_link = create_jql_link_with_issue_ids(filtered_tickets)
+                    print(f"🔍 Filtered JIRA tickets: {len(filtered_tickets)} PRTS-related tickets out of {len(jira_data.get('tickets', []))} total")
+                else:
+                    print(f"⚠️ No PRTS-related tickets found in {len(jira_data.get('tickets', []))} tickets - not creating JQL link")
+            else:
+                # No workflow subject detected, use all tickets
+                jql_link = create_jql_link_with_issue_ids(jira_data.get('tickets', []))
+        
+        # Filter JIRA tickets BEFORE synthesis for workflow queries
+        # This ensures Gemini/OpenAI only see relevant tickets
+        filtered_jira_data = jira_data.copy()
+        if workflow_subject and jira_data.get('tickets'):
+            filtered_tickets = _filter_workflow_tickets(jira_data.get('tickets', []), workflow_subject)
+            filtered_jira_data['tickets'] = filtered_tickets
+            print(f"🔍 Filtered JIRA tickets for synthesis: {len(filtered_tickets)} {workflow_subject}-related tickets out of {len(jira_data.get('tickets', []))} total")
+        else:
+            filtered_jira_data = jira_data
+        
+        print(f"🔍 Workflow query - calling synthesis with:")
+        print(f"  - Confluence: {len(confluence_data.get('results', []))} pages")
+        print(f"  - GitHub: {len(github_data.get('repositories', []))} repos")
+        print(f"  - JIRA: {len(filtered_jira_data.get('tickets', []))} tickets (filtered for {workflow_subject if workflow_subject else 'all'})")
+        print(f"  - OpenAI available: {OPENAI_AVAILABLE}")
+        
+        synthesis_result = synthesize_with_openai(
+            question, filtered_jira_data, confluence_data, github_data, document360_data, 
+            conversation_history, jql_link, gpt_context, detected_intent, model_preference, deadline_at, on_token, on_event
+        )
+        
+        print(f"✅ Synthesis result method: {synthesis_result.get('synthesis_response', {}).get('synthesis_method', 'unknown')}")
+        
+        # Extract full synthesis_response to preserve model_used and provider
+        synthesis_response = synthesis_result.get("synthesis_response", {})
+        if synthesis_response.get("deadline_exceeded"):
+            dropped_sources.append("llm_synthesis")
+        synthesis_response["dropped_sources"] = dropped_sources
+        synthesis_response["deadline"] = {
+            "budget_seconds": deadline_config['total_seconds'],
+            "elapsed_seconds": round(time.monotonic() - request_start, 2)
+        }
+        response_payload = {
+            "response": synthesis_response.get("response", "No response generated"),
+            "sources": synthesis_response.get("sources", []),
+            "jql_link": jql_link,
+            "confluence_results": len(confluence_data.get('results', [])),
+            "github_repos": len(github_data.get('repositories', [])),
+            "jira_tickets": len(jira_data.get('tickets', [])),
+            "document360_articles": 0,  # Skipped for workflow queries
+            "query_intent": detected_intent,
+            "synthesis_method": synthesis_response.get("synthesis_method", "unknown"),
+            "model_used": synthesis_response.get("model_used", "unknown"),  # Include model_used
+            "provider": synthesis_response.get("provider", "unknown"),  # Include provider
+            "token_usage": synthesis_response.get("token_usage", {}),  # Include token_usage
+            "dropped_sources": dropped_sources,  # Sources abandoned at the request deadline
+            "synthesis_response": synthesis_response  # Include full synthesis_response for backend
+        }
+        return (response_payload, 200)
+
+    if not jira_data:
+        return ({
+            "error": "Failed to retrieve JIRA data",
+            "session_id": session_id,
+            "version": "5.0-FIXED-DATA-SOURCES"
+        }, 500)
+
+    # Process JIRA response
+    tickets = jira_data.get('tickets', [])
+    summary_data = jira_data.get('summary', [])
+
+    # Create JQL link with issue IDs
+    jql_link = create_jql_link_with_issue_ids(tickets)
+
+    # Synthesize response with OpenAI (include GPT context and query intent)
+    synthesis_result = synthesize_with_openai(
+        question, jira_data, confluence_data, github_data, document360_data,
+        conversation_history, jql_link, gpt_context, detected_intent, model_preference, deadline_at, on_token, on_event
+    )
+
+    # Build sources list
+    sources = []
+    if jql_link:
+        sources.append(jql_link)
+
+    # Response already synthesized above, use it
+    print("🧠 Using synthesized response...")
+    openai_response = synthesis_result
+
+    # Add session management and API status to OpenAI response
+    if "synthesis_response" in openai_response:
+        openai_response["synthesis_response"]["session_id"] = session_id
+        openai_response["synthesis_response"]["jql_link"] = jql_link
+        openai_response["synthesis_response"]["version"] = "5.0-FIXED-DATA-SOURCES"
+        openai_response["synthesis_response"]["api_status"] = {
+            "data_sources_queried": 4,
+            "data_sources_successful": sum([
+                1 if jira_data.get('query_success', False) else 0,
+                1 if confluence_data.get('api_success', False) else 0,
+                1 if github_data.get('api_success', False) else 0,
+                1 if document360_data.get('api_success', False) else 0
+            ]),
+            "jira_query_success": jira_data.get('query_success', False),
+            "confluence_api_success": confluence_data.get('api_success', False),
+            "github_api_success": github_data.get('api_success', False),
+            "document360_api_success": document360_data.get('api_success', False),
+            "confluence_sources": confluence_data["total_sources_found"],
+            "github_repos": github_data["total_repos_found"],
+            "document360_articles": document360_data["total_articles_found"]
+        }
+        if openai_response["synthesis_response"].get("deadline_exceeded"):
+            dropped_sources.append("llm_synthesis")
+        openai_response["synthesis_response"]["dropped_sources"] = dropped_sources
+        openai_response["synthesis_response"]["deadline"] = {
+            "budget_seconds": deadline_config['total_seconds'],
+            "elapsed_seconds": round(time.monotonic() - request_start, 2)
+        }
+
+    print(f"✅ v5 Response completed with OpenAI synthesis: {len(tickets)} JIRA tickets, {confluence_data['total_sources_found']} Confluence pages")
+    return (openai_response, 200)
+
+# === STREAMING ===
+# /ask streams when the request sends "stream": true (Server-Sent Events), "stream": "ndjson",
+# or Accept: text/event-stream. A "source" event arrives as each upstream finishes (pages,
+# repos, ticket count + JQL link) so citations render before synthesis starts, then
+# "sources_complete". "token" events carry answer text as the LLM emits it. A "reset" event
+# means the text streamed so far must be discarded, and any replacement tokens follow it: the
+# provider failed or missed the deadline mid-answer, or a coalesced stream gave up on its
+# leader. The last event ("final", or "error") carries the buffered response body plus
+# sources, jql_link, token_usage and timings. Its "response" is authoritative: after a deadline fallback it
+# replaces any partial text already streamed.
+STREAM_KEEPALIVE_SECONDS = 15
+
+def _requested_stream_format(request_data: dict, request) -> str:
+    """'sse', 'ndjson', or None for the buffered JSON response"""
+    stream = request_data.get('stream')
+    if isinstance(stream, str) and stream.lower() in ('sse', 'ndjson'):
+        return stream.lower()
+    if stream is True or str(stream).lower() == 'true':
+        return 'sse'
+    if 'text/event-stream' in request.headers.get('Accept', ''):
+        return 'sse'
+    return None
+
+def _format_stream_event(stream_format: str, event: str, data) -> str:
+    if stream_format == 'ndjson':
+        return json.dumps({"event": event, "data": data}, default=str) + "\n"
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def _final_stream_frame(payload: dict, timings: dict) -> dict:
+    """The buffered /ask body, with the fields a streaming client needs lifted to the top level"""
+    synthesis_response = payload.get("synthesis_response", {})
+    frame = dict(payload)
+    for field, default in (("response", ""), ("sources", []), ("jql_link", ""), ("token_usage", {}),
+                           ("model_used", "unknown"), ("provider", "unknown"), ("dropped_sources", [])):
+        frame.setdefault(field, synthesis_response.get(field, default))
+    frame["timings"] = timings
+    return frame
+
+def _streaming_response(stream_format: str, events, cache_status: str, age_seconds: float = None) -> Response:
+    mimetype = 'application/x-ndjson' if stream_format == 'ndjson' else 'text/event-stream'
+    response = Response(events, mimetype=mimetype)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # Don't let proxies buffer the stream
+    response.headers["X-Cache"] = cache_status
+    if age_seconds is not None:
+        response.headers["X-Cache-Age"] = str(int(age_seconds))
+    return response
+
+def _stream_cached_response(stream_format: str, payload: dict, age_seconds: float) -> Response:
+    frame = _final_stream_frame(payload, {"total_seconds": 0.0, "cached": True})
+    return _streaming_response(stream_format, iter([_format_stream_event(stream_format, "final", frame)]), "HIT", age_seconds)
+
+def _stream_ask_response(stream_format: str, pipeline_args: tuple, request_start: float, cache_key: str, cache_status: str, intent: str) -> Response:
+    """
+    Run the /ask pipeline on a worker thread and stream its events as they are produced
+    If the same question is already being answered, stream that computation's events instead
+    """
+    if cache_key:
+        call, is_leader = ASK_SINGLEFLIGHT.join(cache_key)
+    else:
+        call, is_leader = (InFlightCall(), True)
+    events = call.subscribe()
+    # The stream outlives the request context: the trace is finished when the response closes
+    trace = current_trace() or RequestTrace(intent)
+    trace.streaming = True
+    wait_span = None if is_leader else trace.start("coalesced_wait")
+
+    def run_pipeline(call, cache_key):
+        result = None
+        try:
+            with activate_trace(trace):
+                result = _run_ask_pipeline(*pipeline_args, on_token=lambda text: call.publish("token", {"text": text}), on_event=call.publish)
+        except Exception as e:
+            print(f"❌ v5 streaming error: {e}")
+            result = ({
+                "error": f"Internal server error: {str(e)}",
+                "version": "5.0-FIXED-DATA-SOURCES",
+                "timestamp": datetime.now().isoformat()
+            }, 500)
+        finally:
+            if result is None:
+                # Dying on a BaseException - subscribers still need a (payload, status) to end on
+                result = ({
+                    "error": "Internal server error: the answer was not completed",
+                    "version": "5.0-FIXED-DATA-SOURCES",
+                    "timestamp": datetime.now().isoformat()
+                }, 500)
+            if cache_key:
+                ASK_SINGLEFLIGHT.finish(cache_key, call, result)
+            else:
+                call.finish(result)
+
+    def start_pipeline(call, cache_key):
+        threading.Thread(target=run_pipeline, args=(call, cache_key), name="ask-stream", daemon=True).start()
+
+    if is_leader:
+        start_pipeline(call, cache_key)
+    else:
+        print(f"🔗 Streaming the in-flight answer to this question ({call.followers} joined)")
+        cache_status = "COALESCED"
+
+    def generate():
+        nonlocal call, events, is_leader, wait_span
+        first_token_at = None
+        follower_deadline = None if is_leader else time.monotonic() + _follower_wait_seconds(intent)
+        while True:
+            if follower_deadline is not None and time.monotonic() >= follower_deadline:
+                # Same bound as a buffered follower: stop waiting and answer on our own
+                ASK_SINGLEFLIGHT.record_timeout()
+                print("⏱️ In-flight answer did not arrive in time - answering this stream on its own")
+                call.unsubscribe(events)
+                trace.end(wait_span)
+                wait_span = None
+                follower_deadline = None
+                call, is_leader = (InFlightCall(), True)
+                events = call.subscribe()
+                start_pipeline(call, None)
+                yield _format_stream_event(stream_format, "reset", {"reason": "coalesced_timeout"})
+            wait_seconds = STREAM_KEEPALIVE_SECONDS
+            if follower_deadline is not None:
+                wait_seconds = max(0.0, min(wait_seconds, follower_deadline - time.monotonic()))
+            try:
+                event, data = events.get(timeout=wait_seconds)
+            except queue.Empty:
+                if follower_deadline is not None and time.monotonic() >= follower_deadline:
+                    continue
+                # Keep idle proxies from closing the connection while sources load
+                yield ": keep-alive\n\n" if stream_format == 'sse' else _format_stream_event(stream_format, "ping", {})
+                continue
+            if event != "done":
+                if event == "token" and first_token_at is None:
+                    first_token_at = time.monotonic()
+                    trace.record("first_token", trace.started, time.perf_counter())
+                yield _format_stream_event(stream_format, event, data)
+                continue
+
+            call.unsubscribe(events)
+            if wait_span is not None:
+                trace.end(wait_span)
+            payload, status_code = data
+            if status_code != 200:
+                trace.status_code = status_code
+                yield _format_stream_event(stream_format, "error", dict(payload, status_code=status_code))
+                return
+            if not is_leader:
+                payload = _with_session_id(payload, pipeline_args[5])
+            elif cache_key and _is_cacheable_response(payload):
+                _response_cache_put(cache_key, payload, intent)
+            timings = {
+                "first_token_seconds": round(first_token_at - request_start, 3) if first_token_at else None,
+                "total_seconds": round(time.monotonic() - request_start, 3)
+            }
+            timings.update(trace.timings())
+            yield _format_stream_event(stream_format, "final", _final_stream_frame(payload, timings))
+            return
+
+    def close():
+        # Final frame sent or client gone (even before the first event) - stop queueing events for it
+        call.unsubscribe(events)
+        trace.close()
+
+    response = _streaming_response(stream_format, generate(), cache_status)
+    response.call_on_close(close)
+    return response
+
+# === HEALTH CHECKS ===
+# Probes must be cheap: /healthz answers without touching anything, and /readyz only reads
+# the result of a background checker that each worker runs every interval_seconds. The
+# checker is what talks to upstreams and resolves the OpenAI key - never the probe itself.
+HEALTH_CHECK_CONFIG = {
+    "interval_seconds": 30,
+    "probe_timeout_seconds": 5,
+    "stale_after_seconds": 120  # A checker this far behind is restarted and reported not ready
+}
+HEALTH_STATE = {
+    "checked_at": None,
+    "report": None,
+    "thread": None,
+    "pid": None
+}
+_HEALTH_LOCK = threading.Lock()
+
+def _probe_upstreams() -> dict:
+    """OPTIONS each upstream (answered without running a search) - also opens its keep-alive connection"""
+    async def probe(url):
+        start = time.perf_counter()
+        try:
+            response = await _http_request_async("OPTIONS", url, idempotent=False, timeout=HEALTH_CHECK_CONFIG["probe_timeout_seconds"])
+            # Any answer short of a gateway error means the service is up (405/501 included)
+            return {"ok": response.status_code not in (502, 503, 504), "status": response.status_code,
+                    "ms": round((time.perf_counter() - start) * 1000, 1)}
+        except Exception as e:
+            return {"ok": False, "error": str(e)[:200], "ms": round((time.perf_counter() - start) * 1000, 1)}
+
+    upstreams = {'confluence': CONFLUENCE_API, 'jira_v4': JIRA_V4_API, 'git_api': GIT_API, 'document360': DOCUMENT360_API}
+
+    async def probe_all():
+        return await asyncio.gather(*[probe(url) for url in upstreams.values()])
+
+    results = _run_async(probe_all(), timeout=HEALTH_CHECK_CONFIG["probe_timeout_seconds"] * 2)
+    return dict(zip(upstreams.keys(), results))
+
+def _run_health_checks() -> dict:
+    """One pass of the background checker"""
+    upstreams = _probe_upstreams()
+    # Resolve the key only until it is cached - _get_openai_api_key logs on every call
+    openai_ready = OPENAI_AVAILABLE and bool(OPENAI_API_KEY_CACHE or _get_openai_api_key())
+    # Installed is not usable: Gemini counts once Vertex AI imports and its model is created
+    # (cached per worker, so later passes cost nothing)
+    gemini = {"ok": False, "installed": VERTEX_AI_AVAILABLE}
+    if _check_vertex_ai_availability():
+        try:
+            _get_gemini_model(WARMUP_CONFIG["gemini_model"])
+            gemini["ok"] = True
+        except Exception as e:
+            gemini["error"] = str(e)[:200]
+    providers = {
+        "openai": {"ok": openai_ready, "installed": OPENAI_AVAILABLE, "api_key": "found" if openai_ready else "not found"},
+        "gemini": gemini
+    }
+    if not GPT_CONTEXT.get('last_loaded'):
+        load_gpt_context_files()  # Not warmed up (WARMUP_ON_BOOT=0, Cloud Functions) - load it here, not on a request
+    local = {
+        "gpt_context": bool(GPT_CONTEXT.get('last_loaded')),
+        "document360_index": DOCUMENT360_INDEX['index'] is not None
+    }
+    # Ready = this worker can answer: context loaded and an LLM to synthesize with. A down
+    # upstream only degrades answers (the fan-out drops it), so it is reported, not gating -
+    # otherwise one upstream outage would pull every instance out of rotation.
+    return {
+        "ready": local["gpt_context"] and (providers["openai"]["ok"] or providers["gemini"]["ok"]),
+        "degraded": sorted(name for name, result in upstreams.items() if not result["ok"]),
+        "upstreams": upstreams,
+        "providers": providers,
+        "local": local
+    }
+
+def _health_check_loop():
+    while True:
+        try:
+            report = _run_health_checks()
+            HEALTH_STATE.update({"report": report, "checked_at": time.time()})
+            if report["degraded"]:
+                print(f"⚠️ Health check: degraded upstreams {report['degraded']}")
+        except Exception as e:
+            print(f"⚠️ Health check failed: {e}")
+        time.sleep(HEALTH_CHECK_CONFIG["interval_seconds"])
+
+def _ensure_health_checker():
+    """Start this worker's checker thread (again after a fork, or if it has stopped)"""
+    thread = HEALTH_STATE["thread"]
+    if HEALTH_STATE["pid"] == os.getpid() and thread is not None and thread.is_alive():
+        return
+    with _HEALTH_LOCK:
+        thread = HEALTH_STATE["thread"]
+        if HEALTH_STATE["pid"] == os.getpid() and thread is not None and thread.is_alive():
+            return
+        if HEALTH_STATE["pid"] != os.getpid():
+            HEALTH_STATE.update({"report": None, "checked_at": None})
+        thread = threading.Thread(target=_health_check_loop, name="health-checker", daemon=True)
+        HEALTH_STATE.update({"thread": thread, "pid": os.getpid()})
+        thread.start()
+
+def get_readiness() -> dict:
+    """Latest background check for this worker - reads cached state only"""
+    _ensure_health_checker()
+    report, checked_at = HEALTH_STATE["report"], HEALTH_STATE["checked_at"]
+    if report is None:
+        return {"ready": False, "reason": "first health check still running"}
+    age = time.time() - checked_at
+    readiness = dict(report, checked_seconds_ago=round(age, 1))
+    if age > HEALTH_CHECK_CONFIG["stale_after_seconds"]:
+        readiness.update({"ready": False, "reason": "health check is stale"})
+    return readiness
+
+# === WARMUP ===
+# Everything a first request would otherwise pay for - the OpenAI key from Secret Manager,
+# provider SDK imports and clients, the GPT context, the GPT instructions, the Document360
+# index and keep-alive connections to each upstream - primed once per worker. gunicorn runs
+# it in post_worker_init (before the worker accepts requests); /_warmup and App Engine's
+# /_ah/warmup run it on demand - until it has succeeded once in that worker, and at most
+# once per retry_seconds while it keeps failing (the route is unauthenticated).
+WARMUP_CONFIG = {
+    "budget_seconds": 60,           # No new step starts after this; keeps boot inside gunicorn's timeout
+    "document360_wait_seconds": 15, # How long to wait for the background index load
+    "retry_seconds": 60,            # /_warmup reruns a failed warmup at most this often
+    "gemini_model": "gemini-2.0-flash-001"
+}
+WARMUP_STATE = {"runs": 0, "last": None, "pid": None, "succeeded": False, "attempted_at": 0.0}
+_WARMUP_LOCK = threading.Lock()
+
+def _warm_openai_client():
+    api_key = _get_openai_api_key()
+    if not api_key or not OPENAI_AVAILABLE:
+        return "skipped (no API key)" if OPENAI_AVAILABLE else "skipped (openai not installed)"
+    _get_openai_client(api_key)
+    return "ready"
+
+def _warm_gemini_model():
+    if not _check_vertex_ai_availability():
+        return "skipped (vertexai not available)"
+    _get_gemini_model(WARMUP_CONFIG["gemini_model"])
+    return "ready"
+
+def _warm_document360_index():
+    deadline = time.time() + WARMUP_CONFIG["document360_wait_seconds"]
+    # The GPT context load has already started the background load; wait for it to land
+    while get_document360_index() is None and time.time() < deadline:
+        time.sleep(0.1)
+    index = DOCUMENT360_INDEX['index']
+    return f"{len(index['docs'])} articles" if index is not None else "not loaded"
+
+def _warm_connection_pools():
+    return {name: result.get("status", result.get("error")) for name, result in _probe_upstreams().items()}
+
+def warm_up() -> dict:
+    """Prime this worker's caches, clients and pools. Each step is timed; a failed step is reported, not raised."""
+    steps = [
+        ("openai_api_key", lambda: "found" if _get_openai_api_key() else "not found"),
+        ("openai_client", _warm_openai_client),
+        ("gemini_model", _warm_gemini_model),
+        ("gpt_context", lambda: f"{len([f for f in load_gpt_context_files().get('files', {}).values() if f])} files"),
+        ("gpt_instructions", lambda: f"{len(_get_gpt_instructions()[0])} chars"),
+        ("document360_index", _warm_document360_index),
+        ("connection_pools", _warm_connection_pools)
+    ]
+    with _WARMUP_LOCK:
+        attempted_at = time.time()
+        started = time.perf_counter()
+        report = {"pid": os.getpid(), "steps": {}}
+        for name, step in steps:
+            if time.perf_counter() - started > WARMUP_CONFIG["budget_seconds"]:
+                report["steps"][name] = {"result": "skipped (warmup budget spent)", "ms": 0}
+                continue
+            step_started = time.perf_counter()
+            try:
+                result = step()
+            except Exception as e:
+                result = f"error: {e}"
+            report["steps"][name] = {"result": result, "ms": round((time.perf_counter() - step_started) * 1000, 1)}
+        report["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        report["lazy_imports_ms"] = dict(IMPORT_TIMINGS["lazy"])
+        succeeded = not any(str(step["result"]).startswith(("error:", "skipped (warmup budget")) for step in report["steps"].values())
+        WARMUP_STATE.update({"runs": WARMUP_STATE["runs"] + 1, "last": report, "pid": os.getpid(),
+                             "succeeded": succeeded, "attempted_at": attempted_at})
+    print(f"🔥 Worker {os.getpid()} warmed up in {report['total_ms']:.0f} ms: "
+          + ", ".join(f"{name} {step['ms']:.0f} ms" for name, step in report["steps"].items()))
+    _ensure_health_checker()
+    _ensure_metrics_flusher()
+    return report
+
+def get_startup_stats() -> dict:
+    return {
+        "import_ms": IMPORT_TIMINGS,
+        "warmup": WARMUP_STATE["last"] if WARMUP_STATE["pid"] == os.getpid() else None
+    }
+
+@app.route('/_warmup', methods=['GET', 'POST'])
+@app.route('/_ah/warmup', methods=['GET'])
+def warmup_endpoint():
+    """Prime the worker that receives this request before it takes user traffic"""
+    # Unauthenticated - report the last run instead of redoing it once it has succeeded,
+    # while one is running, or when the last failed attempt is too recent to retry
+    if _WARMUP_LOCK.locked():
+        return jsonify({"pid": os.getpid(), "warming_up": True})
+    if WARMUP_STATE["pid"] == os.getpid():
+        if WARMUP_STATE["succeeded"]:
+            return jsonify(dict(WARMUP_STATE["last"], already_warm=True))
+        retry_in = WARMUP_STATE["attempted_at"] + WARMUP_CONFIG["retry_seconds"] - time.time()
+        if retry_in > 0:
+            return jsonify(dict(WARMUP_STATE["last"], retry_after_seconds=round(retry_in, 1)))
+    return jsonify(warm_up())
+
+@app.before_request
+def _start_request_trace():
+    # Only /ask answers are traced - probes and diagnostics stay free of bookkeeping
+    if _is_traced_request():
+        trace = RequestTrace()
+        trace.in_flight = True
+        metric_gauge_add("knowledge_layer_in_flight_requests", 1)
+        _ensure_metrics_flusher()
+        g.trace_token = _CURRENT_TRACE.set(trace)
+
+@app.after_request
+def _add_server_timing(response):
+    trace = current_trace()
+    if trace is not None:
+        response.headers["Server-Timing"] = trace.server_timing()
+        trace.status_code = response.status_code
+        trace.cache_status = response.headers.get("X-Cache")
+        if not trace.streaming:
+            trace.finish()
+        # Runs however the response ends, so the in-flight gauge can't leak
+        response.call_on_close(trace.close)
+    return response
+
+@app.teardown_request
+def _end_request_trace(exc):
+    token = g.pop("trace_token", None)
+    if token is not None:
+        _CURRENT_TRACE.reset(token)
+
+def _is_traced_request() -> bool:
+    from flask import request as flask_request
+    return flask_request.path == '/ask' and flask_request.method == 'POST'
+
+def _service_info() -> dict:
+    return {
+        "version": "5.0-FIXED-DATA-SOURCES",
+        "message": "Knowledge Layer v5 - Fixed Data Source Integration + Intelligent Synthesis",
+        "status": "healthy",
+        "diagnostics": "/debug/diagnostics"
+    }
+
 @app.route('/', methods=['GET'])
 def health_check():
-    """Health check endpoint with API key status"""
+    """Service status - constant time, safe for load balancer health checks"""
+    return jsonify(_service_info())
+
+@app.route('/healthz', methods=['GET'])
+def liveness_check():
+    """Liveness: the process is serving requests. Never touches upstreams, secrets or caches."""
+    return jsonify({"status": "alive"})
+
+@app.route('/readyz', methods=['GET'])
+def readiness_check():
+    """Readiness from the background checker's cached result (503 until this worker can answer)"""
+    readiness = get_readiness()
+    return jsonify(readiness), (200 if readiness["ready"] else 503)
+
+@app.route('/debug/latency', methods=['GET'])
+def debug_latency():
+    """Per-stage, per-intent latency histograms for this worker"""
+    return jsonify(get_latency_histograms())
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics summed over every worker on this instance"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/diagnostics', methods=['GET'])
+def debug_diagnostics():
+    """Full diagnostic dump: resolves the OpenAI key (may call Secret Manager) - not for probes"""
     # Check OpenAI API key status for debugging
     api_key_status = {
         "env_var": "SET" if os.getenv("OPENAI_API_KEY") else "NOT SET",
         "env_var_length": len(os.getenv("OPENAI_API_KEY", "")),
-        "openai_api_key_set": "SET" if hasattr(openai, 'api_key') and openai.api_key else "NOT SET",
+        "openai_api_key_set": "SET" if OPENAI_API_KEY_CACHE else "NOT SET",
         "openai_available": OPENAI_AVAILABLE,
         "secret_manager_available": SECRET_MANAGER_AVAILABLE,
         "cache_set": "SET" if OPENAI_API_KEY_CACHE else "NOT SET"
@@ -1673,6 +5362,15 @@ def health_check():
         "status": "healthy",
         "synthesis_type": "openai_powered_multi_source_synthesis",
         "openai_api_key_status": api_key_status,
+        "http_pool_stats": get_http_pool_stats(),
+        "bulkheads": get_bulkhead_stats(),
+        "response_cache": get_response_cache_stats(),
+        "retrieval_cache": get_retrieval_cache_stats(),
+        "document360_index": get_document360_index_stats(),
+        "coalescing": get_coalescing_stats(),
+        "startup": get_startup_stats(),
+        "readiness": get_readiness(),
+        "latency": get_latency_histograms(),
         "features": [
             "CRITICAL FIX: All data sources now use actual search instead of hardcoded responses",
             "CRITICAL FIX: Confluence API - POST with JSON body to /search endpoint",
@@ -1699,48 +5397,9 @@ def knowledge_orchestrator_v5():
     request = flask_request
 
     try:
-        # Handle GET request (health check + debug)
+        # Handle GET request (health check) - diagnostics live at /debug/diagnostics
         if request.method == 'GET':
-            # Check OpenAI API key status for debugging
-            api_key_status = {
-                "env_var": "SET" if os.getenv("OPENAI_API_KEY") else "NOT SET",
-                "env_var_length": len(os.getenv("OPENAI_API_KEY", "")),
-                "openai_api_key_set": "SET" if hasattr(openai, 'api_key') and openai.api_key else "NOT SET",
-                "openai_available": OPENAI_AVAILABLE,
-                "secret_manager_available": SECRET_MANAGER_AVAILABLE,
-                "cache_set": "SET" if OPENAI_API_KEY_CACHE else "NOT SET"
-            }
-            
-            # Try to get key using our function
-            try:
-                test_key = _get_openai_api_key()
-                api_key_status["_get_openai_api_key_result"] = "SUCCESS" if test_key else "FAILED"
-                api_key_status["retrieved_key_length"] = len(test_key) if test_key else 0
-            except Exception as e:
-                api_key_status["_get_openai_api_key_error"] = str(e)
-            
-            return jsonify({
-                "version": "5.0-FIXED-DATA-SOURCES",
-                "message": "Knowledge Layer v5 - Fixed Data Source Integration + Intelligent Synthesis",
-                "status": "healthy",
-                "synthesis_type": "openai_powered_multi_source_synthesis",
-                "openai_api_key_status": api_key_status,
-                "features": [
-                    "CRITICAL FIX: All data sources now use actual search instead of hardcoded responses",
-                    "CRITICAL FIX: Confluence API - POST with JSON body to /search endpoint",
-                    "CRITICAL FIX: Document360 API - GET with query parameters",
-                    "CRITICAL FIX: GitHub API - POST with question parameter",
-                    "CRITICAL FIX: JIRA API - Intelligent parameter extraction",
-                    "ENHANCED: Intelligent keyword extraction for complex questions",
-                    "ENHANCED: Comparison question handling (e.g., 'What is the difference between X and Y')",
-                    "ENHANCED: Better search query generation using extracted keywords",
-                    "ENHANCED: OpenAI-powered synthesis combining all data sources",
-                    "ENHANCED: Proper source attribution and clickable links",
-                    "ENHANCED: Session management and conversation history",
-                    "ENHANCED: Dynamic date detection and response optimization",
-                    "ENHANCED: JQL links with actual issue IDs"
-                ]
-            })
+            return jsonify(_service_info())
 
         # Handle POST request
         if request.method != 'POST':
@@ -1753,12 +5412,15 @@ def knowledge_orchestrator_v5():
         question = request_data.get('question')
         if not question:
             return jsonify({"error": "No question provided"}), 400
+        request_start = time.monotonic()
 
         # Enhanced session management
         session_id = request_data.get('session_id', generate_session_id(question))
         conversation_history = request_data.get('conversation_history', [])
         max_results = request_data.get('max_results', 100)  # Increased default from 50 to 100
         model_preference = request_data.get('model_preference')  # User's model preference (optional)
+        cache_mode = str(request_data.get('cache', '')).lower()  # "bypass" | "refresh" (optional)
+        stream_format = _requested_stream_format(request_data, request)  # "sse" | "ndjson" | None (buffered)
 
         print(f"🤖 v5 Query: {question}")
         print(f"🔄 Session ID: {session_id}")
@@ -1769,280 +5431,74 @@ def knowledge_orchestrator_v5():
             print(f"🎯 No model preference - will use auto-selection")
 
         # Intelligent query analysis with enhanced keyword extraction
-        query_analysis = intelligent_query_analysis(question)
+        with trace_span("query_analysis"):
+            query_analysis = intelligent_query_analysis(question)
+        if current_trace() is not None:
+            current_trace().intent = query_analysis.get('intent', 'general')
         print(f"🧠 Intelligent analysis: {query_analysis.get('intent', 'general')}")
         print(f"📅 Date extracted: {query_analysis.get('jira_params', {}).get('sprint_date', 'Not found')}")
         print(f"🔍 Keywords extracted: {query_analysis.get('keywords', [])}")
 
-        # Load GPT context files FIRST (always, for all queries)
-        gpt_context = load_gpt_context_files()
-        
-        # Get data sources based on query intent
-        detected_intent = query_analysis.get('intent', 'general')
-        print(f"🔍 Query intent: {detected_intent}")
-        
-        confluence_data = {}
-        github_data = {}
-        document360_data = {}
-        
-        if detected_intent == 'jira_only':
-            print("🔍 JIRA-only query - skipping other data sources")
-            confluence_data = {'results': [], 'api_success': False, 'total_sources_found': 0}
-            github_data = {'repositories': [], 'api_success': False, 'total_repos_found': 0}
-            document360_data = {'articles': [], 'api_success': False, 'total_articles_found': 0}
-        elif detected_intent == 'aggregation':
-            print("🔍 Aggregation query - JIRA-only for counts and sums")
-            confluence_data = {'results': [], 'api_success': False, 'total_sources_found': 0}
-            github_data = {'repositories': [], 'api_success': False, 'total_repos_found': 0}
-            document360_data = {'articles': [], 'api_success': False, 'total_articles_found': 0}
-        elif detected_intent == 'workflow':
-            print("🔍 Workflow query - prioritizing Confluence + GitHub, skipping Document360 (internal process)")
-            # For workflow questions: Prioritize Confluence + GitHub, skip Document360
-            with ThreadPoolExecutor(max_workers=6) as executor:  # Increased from 4 to 6 for better parallelism
-                confluence_future = executor.submit(call_confluence_api, question, query_analysis, conversation_history)
-                github_future = executor.submit(call_github_api, question, query_analysis)
-                product_mappings_future = executor.submit(get_product_mappings_from_github)
-                # Skip Document360 for workflow/internal process questions
-                document360_data = {'articles': [], 'api_success': False, 'total_articles_found': 0}
-                
-                # Get product mappings first (needed for JIRA)
-                try:
-                    product_mappings = product_mappings_future.result(timeout=10)
-                except Exception as e:
-                    print(f"⚠️ Product mappings timeout/error: {e}")
-                    product_mappings = {}
-                
-                # JIRA call for context (but not primary source for workflow questions)
-                # For workflow queries, filter JIRA tickets by the main subject (e.g., PRTS)
-                # Extract the main subject from the question to filter tickets
-                workflow_subject = None
-                import re
-                # Pattern: "workflow of X" or "workflow of the X" or "what is X the process" or "describe X the process"
-                patterns = [
-                    r'workflow\s+of\s+(?:the\s+)?([A-Z]+)',  # "workflow of PRTS"
-                    r'what\s+is\s+([A-Z]+)\s+the\s+process',  # "what is PRTS the process"
-                    r'describe\s+([A-Z]+)\s+the\s+process',  # "describe PRTS the process"
-                    r'explain\s+([A-Z]+)\s+the\s+process',  # "explain PRTS the process"
-                    r'(?:what|how|explain|describe).*?([A-Z]{2,})',  # Fallback: extract any uppercase acronym
-                ]
-                for pattern in patterns:
-                    match = re.search(pattern, question, re.IGNORECASE)
-                    if match:
-                        workflow_subject = match.group(1)
-                        break  # Extract the acronym (e.g., "PRTS")
-                else:
-                    # Pattern: "how does X work" or "explain X"
-                    match = re.search(r'(?:how\s+does|explain|describe|tell\s+me\s+about)\s+([A-Z]+)', question, re.IGNORECASE)
-                    if match:
-                        workflow_subject = match.group(1)
-                    elif query_analysis.get('keywords'):
-                        # Use the first keyword that looks like an acronym/product name
-                        keywords = query_analysis['keywords']
-                        for kw in keywords:
-                            if len(kw) >= 2 and kw.isupper():
-                                workflow_subject = kw
-                                break
-                
-                # If we found a workflow subject, add it to query_analysis for JIRA filtering
-                if workflow_subject and query_analysis:
-                    if 'jira_params' not in query_analysis:
-                        query_analysis['jira_params'] = {}
-                    # Add search terms to filter JIRA tickets by the workflow subject
-                    query_analysis['jira_params']['search_terms'] = workflow_subject
-                    query_analysis['jira_params']['summary'] = workflow_subject  # Also search in summary field
-                    print(f"🔍 Workflow query detected subject: {workflow_subject} - filtering JIRA tickets")
-                
-                jira_future = executor.submit(call_jira_v4_api, question, max_results, query_analysis, product_mappings)
-                
-                # Wait for Confluence and GitHub (primary sources) - increased timeouts
-                try:
-                    confluence_data = confluence_future.result(timeout=30)  # Increased from 15 to 30 seconds
-                except Exception as e:
-                    print(f"⚠️ Confluence API timeout/error: {e}")
-                    confluence_data = {'results': [], 'api_success': False, 'total_sources_found': 0}
-                
-                try:
-                    github_data = github_future.result(timeout=30)  # Increased from 15 to 30 seconds
-                except Exception as e:
-                    print(f"⚠️ GitHub API timeout/error: {e}")
-                    github_data = {'repositories': [], 'api_success': False, 'total_repos_found': 0}
-                
-                # Get JIRA data (for context, but not primary) - increased timeout
-                try:
-                    jira_data = jira_future.result(timeout=40)  # Increased from 20 to 40 seconds
-                    print(f"✅ JIRA data retrieved: {len(jira_data.get('tickets', []))} tickets")
-                except Exception as e:
-                    print(f"⚠️ JIRA API timeout/error: {e}")
-                    jira_data = {'tickets': [], 'api_success': False, 'total_tickets_found': 0}
-                
-                # Skip to synthesis for workflow queries (already have all data)
-                # Create JQL link ONLY if we have PRTS-related tickets (filter out unrelated tickets)
-                jql_link = ''
-                if jira_data.get('tickets'):
-                    # Filter tickets to only include those related to the workflow subject
-                    if workflow_subject:
-                        filtered_tickets = [
-                            ticket for ticket in jira_data.get('tickets', [])
-                            if workflow_subject.upper() in ticket.get('summary', '').upper() or 
-                               workflow_subject.upper() in ticket.get('issue_key', '')
-                        ]
-                        if filtered_tickets:
-                            jql_link = create_jql_link_with_issue_ids(filtered_tickets)
-                            print(f"🔍 Filtered JIRA tickets: {len(filtered_tickets)} PRTS-related tickets out of {len(jira_data.get('tickets', []))} total")
-                        else:
-                            print(f"⚠️ No PRTS-related tickets found in {len(jira_data.get('tickets', []))} tickets - not creating JQL link")
-                    else:
-                        # No workflow subject detected, use all tickets
-                        jql_link = create_jql_link_with_issue_ids(jira_data.get('tickets', []))
-                
-                # Filter JIRA tickets BEFORE synthesis for workflow queries
-                # This ensures Gemini/OpenAI only see relevant tickets
-                filtered_jira_data = jira_data.copy()
-                if workflow_subject and jira_data.get('tickets'):
-                    filtered_tickets = [
-                        ticket for ticket in jira_data.get('tickets', [])
-                        if workflow_subject.upper() in ticket.get('summary', '').upper() or 
-                           workflow_subject.upper() in ticket.get('issue_key', '')
-                    ]
-                    filtered_jira_data['tickets'] = filtered_tickets
-                    print(f"🔍 Filtered JIRA tickets for synthesis: {len(filtered_tickets)} {workflow_subject}-related tickets out of {len(jira_data.get('tickets', []))} total")
-                else:
-                    filtered_jira_data = jira_data
-                
-                print(f"🔍 Workflow query - calling synthesis with:")
-                print(f"  - Confluence: {len(confluence_data.get('results', []))} pages")
-                print(f"  - GitHub: {len(github_data.get('repositories', []))} repos")
-                print(f"  - JIRA: {len(filtered_jira_data.get('tickets', []))} tickets (filtered for {workflow_subject if workflow_subject else 'all'})")
-                print(f"  - OpenAI available: {OPENAI_AVAILABLE}")
-                
-                synthesis_result = synthesize_with_openai(
-                    question, filtered_jira_data, confluence_data, github_data, document360_data, 
-                    conversation_history, jql_link, gpt_context, detected_intent, model_preference
-                )
-                
-                print(f"✅ Synthesis result method: {synthesis_result.get('synthesis_response', {}).get('synthesis_method', 'unknown')}")
-                
-                # Extract full synthesis_response to preserve model_used and provider
-                synthesis_response = synthesis_result.get("synthesis_response", {})
-                return jsonify({
-                    "response": synthesis_response.get("response", "No response generated"),
-                    "sources": synthesis_response.get("sources", []),
-                    "jql_link": jql_link,
-                    "confluence_results": len(confluence_data.get('results', [])),
-                    "github_repos": len(github_data.get('repositories', [])),
-                    "jira_tickets": len(jira_data.get('tickets', [])),
-                    "document360_articles": 0,  # Skipped for workflow queries
-                    "query_intent": detected_intent,
-                    "synthesis_method": synthesis_response.get("synthesis_method", "unknown"),
-                    "model_used": synthesis_response.get("model_used", "unknown"),  # Include model_used
-                    "provider": synthesis_response.get("provider", "unknown"),  # Include provider
-                    "token_usage": synthesis_response.get("token_usage", {}),  # Include token_usage
-                    "synthesis_response": synthesis_response  # Include full synthesis_response for backend
-                })
-        else:
-            print("🔍 General query - calling all data sources concurrently...")
-            # Make API calls concurrently for faster response
-            with ThreadPoolExecutor(max_workers=8) as executor:  # Increased from 5 to 8 for better parallelism
-                # Submit all API calls concurrently
-                confluence_future = executor.submit(call_confluence_api, question, query_analysis, conversation_history)
-                github_future = executor.submit(call_github_api, question, query_analysis)
-                document360_future = executor.submit(call_document360_api, question, query_analysis)
-                product_mappings_future = executor.submit(get_product_mappings_from_github)
-                
-                # Get product mappings first (needed for JIRA), but don't block others
-                try:
-                    product_mappings = product_mappings_future.result(timeout=10)
-                except Exception as e:
-                    print(f"⚠️ Product mappings timeout/error: {e}")
-                    product_mappings = {}
-                
-                # Start JIRA call once we have product_mappings (or empty dict)
-                jira_future = executor.submit(call_jira_v4_api, question, max_results, query_analysis, product_mappings)
-                
-                # Wait for all to complete (with increased timeout for more data)
-                try:
-                    confluence_data = confluence_future.result(timeout=30)  # Increased from 15 to 30 seconds
-                except Exception as e:
-                    print(f"⚠️ Confluence API timeout/error: {e}")
-                    confluence_data = {'results': [], 'api_success': False, 'total_sources_found': 0}
-                
-                try:
-                    github_data = github_future.result(timeout=30)  # Increased from 15 to 30 seconds
-                except Exception as e:
-                    print(f"⚠️ GitHub API timeout/error: {e}")
-                    github_data = {'repositories': [], 'api_success': False, 'total_repos_found': 0}
-                
-                try:
-                    document360_data = document360_future.result(timeout=30)  # Increased from 15 to 30 seconds
-                except Exception as e:
-                    print(f"⚠️ Document360 API timeout/error: {e}")
-                    document360_data = {'articles': [], 'api_success': False, 'total_articles_found': 0}
-                
-                # Wait for JIRA (with increased timeout)
-                try:
-                    jira_data = jira_future.result(timeout=40)  # Increased from 20 to 40 seconds
-                except Exception as e:
-                    print(f"⚠️ JIRA API timeout/error: {e}")
-                    jira_data = {'tickets': [], 'summary': [], 'query_success': False, 'total_tickets': 0}
-        
-        # For jira_only and aggregation queries, still need to call JIRA
-        if detected_intent in ['jira_only', 'aggregation']:
-            # Get product mappings for JIRA filtering
-            product_mappings = get_product_mappings_from_github()
-            jira_data = call_jira_v4_api(question, max_results, query_analysis, product_mappings)
-
-        if not jira_data:
-            return jsonify({
-                "error": "Failed to retrieve JIRA data",
-                "session_id": session_id,
-                "version": "5.0-FIXED-DATA-SOURCES"
-            }), 500
-
-        # Process JIRA response
-        tickets = jira_data.get('tickets', [])
-        summary_data = jira_data.get('summary', [])
-
-        # Create JQL link with issue IDs
-        jql_link = create_jql_link_with_issue_ids(tickets)
-
-        # Synthesize response with OpenAI (include GPT context and query intent)
-        synthesis_result = synthesize_with_openai(
-            question, jira_data, confluence_data, github_data, document360_data,
-            conversation_history, jql_link, gpt_context, detected_intent, model_preference
-        )
+        # Serve repeated questions from the response cache. Follow-ups depend on the
+        # conversation, so only standalone questions are cached.
+        cache_key = None
+        cache_status = "BYPASS"
+        if cache_mode != 'bypass' and not conversation_history:
+            cache_key = _response_cache_key(question, model_preference, max_results, query_analysis)
+            if cache_mode == 'refresh':
+                cache_status = "REFRESH"
+            else:
+                cached_payload, cache_age = _response_cache_get(cache_key)
+                if cached_payload is not None:
+                    print(f"⚡ Response cache hit ({cache_age:.0f}s old)")
+                    cached_payload = _with_session_id(cached_payload, session_id)
+                    if stream_format:
+                        return _stream_cached_response(stream_format, cached_payload, cache_age)
+                    return _cache_response(cached_payload, "HIT", cache_age)
+                cache_status = "MISS"
+        if cache_status == "BYPASS":
+            with _RESPONSE_CACHE_LOCK:
+                _RESPONSE_CACHE_STATS["bypassed"] += 1
 
-        # Build sources list
-        sources = []
-        if jql_link:
-            sources.append(jql_link)
+        pipeline_args = (question, query_analysis, conversation_history, max_results, model_preference, session_id, request_start)
+        if stream_format:
+            print(f"📡 Streaming response ({stream_format})")
+            return _stream_ask_response(stream_format, pipeline_args, request_start, cache_key, cache_status, query_analysis.get('intent', 'general'))
 
-        # Response already synthesized above, use it
-        print("🧠 Using synthesized response...")
-        openai_response = synthesis_result
-
-        # Add session management and API status to OpenAI response
-        if "synthesis_response" in openai_response:
-            openai_response["synthesis_response"]["session_id"] = session_id
-            openai_response["synthesis_response"]["version"] = "5.0-FIXED-DATA-SOURCES"
-            openai_response["synthesis_response"]["api_status"] = {
-                "data_sources_queried": 4,
-                "data_sources_successful": sum([
-                    1 if jira_data.get('query_success', False) else 0,
-                    1 if confluence_data.get('api_success', False) else 0,
-                    1 if github_data.get('api_success', False) else 0,
-                    1 if document360_data.get('api_success', False) else 0
-                ]),
-                "jira_query_success": jira_data.get('query_success', False),
-                "confluence_api_success": confluence_data.get('api_success', False),
-                "github_api_success": github_data.get('api_success', False),
-                "document360_api_success": document360_data.get('api_success', False),
-                "confluence_sources": confluence_data["total_sources_found"],
-                "github_repos": github_data["total_repos_found"],
-                "document360_articles": document360_data["total_articles_found"]
-            }
+        if not cache_key:
+            payload, status_code = _run_ask_pipeline(*pipeline_args)
+            return _cache_response(payload, cache_status, status_code=status_code)
 
-        print(f"✅ v5 Response completed with OpenAI synthesis: {len(tickets)} JIRA tickets, {confluence_data['total_sources_found']} Confluence pages")
-        return jsonify(openai_response)
+        # Coalesce with an identical question already being answered on this worker
+        call, is_leader = ASK_SINGLEFLIGHT.join(cache_key)
+        if not is_leader:
+            print(f"🔗 Joining the in-flight answer to this question ({call.followers} joined)")
+            with trace_span("coalesced_wait"):
+                answered = call.done.wait(timeout=_follower_wait_seconds(query_analysis.get('intent', 'general')))
+            if answered and call.result:
+                payload, status_code = call.result
+                payload = _with_session_id(payload, session_id)
+                return _cache_response(payload, "COALESCED", status_code=status_code)
+            ASK_SINGLEFLIGHT.record_timeout()
+            print("⏱️ In-flight answer did not arrive in time - answering this request on its own")
+            payload, status_code = _run_ask_pipeline(*pipeline_args)
+        else:
+            result = None
+            try:
+                result = _run_ask_pipeline(*pipeline_args)
+            except Exception as e:
+                result = ({
+                    "error": f"Internal server error: {str(e)}",
+                    "version": "5.0-FIXED-DATA-SOURCES",
+                    "timestamp": datetime.now().isoformat()
+                }, 500)
+                raise
+            finally:
+                ASK_SINGLEFLIGHT.finish(cache_key, call, result)
+            payload, status_code = result
+        if status_code == 200 and _is_cacheable_response(payload):
+            _response_cache_put(cache_key, payload, query_analysis.get('intent', 'general'))
+        return _cache_response(payload, cache_status, status_code=status_code)
 
     except Exception as e:
         print(f"❌ v5 Error: {e}")
@@ -2091,36 +5547,24 @@ else:
         """Placeholder for Cloud Run deployment (not used)"""
         pass
 
+_end_import_phase("module setup")
+IMPORT_TIMINGS["total_ms"] = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1)
+print(f"⏱️ main.py imported in {IMPORT_TIMINGS['total_ms']:.0f} ms ("
+      + ", ".join(f"{name} {ms:.0f} ms" for name, ms in IMPORT_TIMINGS["phases"].items()) + ")")
+
 # For Cloud Run direct deployment (legacy - kept for compatibility)
 if __name__ == '__main__':
     # In production (Cloud Run), use gunicorn with proper timeout
     # In development, use Flask's built-in server
     if os.environ.get('GAE_ENV') or os.environ.get('K_SERVICE'):
-        # Cloud Run environment - use gunicorn
-        import gunicorn.app.base
-        from gunicorn import util
-        
-        class StandaloneApplication(gunicorn.app.base.BaseApplication):
-            def __init__(self, app, options=None):
-                self.options = options or {}
-                self.application = app
-                super().__init__()
-            
-            def load_config(self):
-                for key, value in self.options.items():
-                    self.cfg.set(key.lower(), value)
-            
-            def load(self):
-                return self.application
-        
-        options = {
-            'bind': f"0.0.0.0:{os.environ.get('PORT', 8080)}",
-            'workers': 2,
-            'timeout': 120,
-            'worker_class': 'sync',
-            'keepalive': 5,
-        }
-        StandaloneApplication(app, options).run()
+        # Cloud Run environment - serve the way the Procfile / app.yaml entrypoint does
+        # (gunicorn -c gunicorn.conf.py main:app), so workers, preload, the warmup hook and
+        # the worker_exit metrics flush all come from gunicorn.conf.py and GUNICORN_* env vars
+        from gunicorn.app.wsgiapp import WSGIApplication
+        # main:app and the config hooks' `import main` get this module, not a second copy
+        sys.modules.setdefault('main', sys.modules[__name__])
+        sys.argv = [sys.argv[0], '-c', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py'), 'main:app']
+        WSGIApplication("%(prog)s [OPTIONS] [APP_MODULE]").run()
     else:
         # Local development
         app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)), debug=False)
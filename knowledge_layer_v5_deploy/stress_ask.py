@@ -0,0 +1,155 @@
+"""
+Concurrency stress test for /ask against a running server (gunicorn -c gunicorn.conf.py main:app).
+
+Fires concurrent requests - the same question from many clients at once and distinct
+questions side by side, buffered and streamed - and checks that every one gets a 200
+with a complete JSON body, its own session_id back, and the same intent a lone request
+for that question gets. Any crossed answer, dropped stream or 5xx is listed and the
+script exits non-zero.
+
+Usage (from knowledge_layer_v5_deploy/):
+    python stress_ask.py [--url http://localhost:8080] [--concurrency 32] [--rounds 3] [--cache refresh]
+
+--cache refresh (the default) skips response-cache hits so every request runs the
+pipeline; identical questions in flight together still share one computation.
+"""
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+STRESS_QUESTIONS = [
+    "What are the AO factors?",
+    "What is QAR?",
+    "tell me the workflow of PRTS",
+    "How many story points did Front End complete last sprint?",
+    "What is on the roadmap for Adaptive Optimization this year?",
+    "Who is the product manager for APIs?",
+    "explain how NPI matching works with Smart NPI Match",
+    "show me open bugs for Authentication"
+]
+
+def _read_stream(response) -> dict:
+    """Final frame of an NDJSON /ask stream, or raises if the stream ended without one"""
+    final = None
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            continue
+        event = json.loads(line)
+        if event.get("event") in ("final", "error"):
+            final = event.get("data", {})
+    if final is None:
+        raise ValueError("stream ended without a final event")
+    return final
+
+def ask(session: requests.Session, url: str, question: str, stream: bool, cache: str, timeout: float) -> dict:
+    """One /ask call; returns what the checks need, never raises"""
+    session_id = f"stress-{uuid.uuid4().hex[:12]}"
+    body = {"question": question, "session_id": session_id}
+    if cache != "default":
+        body["cache"] = cache
+    if stream:
+        body["stream"] = "ndjson"
+    start = time.perf_counter()
+    result = {"question": question, "session_id": session_id, "stream": stream, "status": None, "error": None}
+    try:
+        response = session.post(f"{url}/ask", json=body, timeout=timeout, stream=stream)
+        result["status"] = response.status_code
+        result["x_cache"] = response.headers.get("X-Cache", "")
+        payload = _read_stream(response) if stream else response.json()
+        result["payload"] = payload
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def check(result: dict, expected_intents: dict) -> list:
+    """Problems with one response (empty when it is correct)"""
+    if result["error"]:
+        return [result["error"]]
+    problems = []
+    payload = result.get("payload") or {}
+    if result["status"] != 200:
+        problems.append(f"HTTP {result['status']}: {str(payload.get('error', ''))[:120]}")
+    if payload.get("error"):
+        problems.append(f"error in body: {str(payload['error'])[:120]}")
+    # Workflow answers are flattened to the top level; the others only carry synthesis_response
+    synthesis_response = payload.get("synthesis_response", {})
+    if not (payload.get("response") or synthesis_response.get("response")):
+        problems.append("empty response")
+    returned_session = payload.get("session_id") or synthesis_response.get("session_id")
+    if returned_session and returned_session != result["session_id"]:
+        problems.append(f"session_id {returned_session} returned for {result['session_id']}")
+    expected_intent = expected_intents.get(result["question"])
+    if expected_intent and payload.get("query_intent") != expected_intent:
+        problems.append(f"intent {payload.get('query_intent')} (a lone request gets {expected_intent})")
+    return problems
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--cache", choices=["default", "refresh", "bypass"], default="refresh")
+    parser.add_argument("--timeout", type=float, default=150.0)
+    args = parser.parse_args()
+    url = args.url.rstrip("/")
+
+    # Baseline: each question alone, so a crossed answer under load shows up as a wrong intent
+    session = requests.Session()
+    expected_intents = {}
+    for question in STRESS_QUESTIONS:
+        baseline = ask(session, url, question, False, args.cache, args.timeout)
+        if baseline["error"] or baseline["status"] != 200:
+            print(f"❌ Baseline request failed for {question!r}: {baseline['error'] or baseline['status']}")
+            sys.exit(1)
+        expected_intents[question] = baseline["payload"].get("query_intent")
+
+    # Each round: half the clients ask the same question at once, the rest spread over the others,
+    # alternating buffered and streamed responses
+    plan = []
+    for round_number in range(args.rounds):
+        hot_question = STRESS_QUESTIONS[round_number % len(STRESS_QUESTIONS)]
+        for i in range(args.concurrency):
+            question = hot_question if i % 2 == 0 else STRESS_QUESTIONS[(i // 2) % len(STRESS_QUESTIONS)]
+            plan.append((question, i % 4 == 1))
+
+    # One keep-alive session per client thread (requests.Session is not thread-safe)
+    local = threading.local()
+    def run(item):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return ask(local.session, url, item[0], item[1], args.cache, args.timeout)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(run, plan))
+    wall_seconds = time.perf_counter() - start
+
+    failures = [(result, problems) for result in results for problems in [check(result, expected_intents)] if problems]
+    latencies = [result["seconds"] for result in results]
+    print(f"Requests:   {len(results)} ({args.rounds} rounds x {args.concurrency} concurrent, {sum(1 for _, s in plan if s)} streamed)")
+    print(f"Throughput: {len(results) / wall_seconds:.1f} req/s over {wall_seconds:.1f}s")
+    print(f"Latency:    p50 {percentile(latencies, 0.5):.2f}s  p95 {percentile(latencies, 0.95):.2f}s  "
+          f"max {max(latencies):.2f}s  mean {statistics.mean(latencies):.2f}s")
+    print(f"X-Cache:    {dict(Counter(result.get('x_cache') or 'none' for result in results))}")
+    if failures:
+        print(f"❌ {len(failures)} of {len(results)} requests failed:")
+        for result, problems in failures[:20]:
+            print(f"   {result['question']!r} ({'stream' if result['stream'] else 'buffered'}): {'; '.join(problems)}")
+        sys.exit(1)
+    print(f"✅ All {len(results)} responses correct")
+
+if __name__ == "__main__":
+    main_cli()